@@ -1,22 +1,35 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
+import bisect
 import os
-from sentence_transformers import SentenceTransformer
-import json
-import faiss
-import numpy as np
+from collections import deque
 from datetime import datetime
-import easyocr
-from docx import Document
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-import io
-import base64
+import json
 import uuid
 import threading
 import time
-from collections import defaultdict
 import tempfile
-import shutil
+import atexit
+import signal
+import sys
+
+import numpy as np
+
+from src import config
+from src.cache import EmbeddingCache, hash_arquivo, normalizar_texto
+from src.collection_manager import Colecao, ColecaoInexistente, GerenciadorColecoes, validar_nome
+from src.database import DocumentStore
+from src.document_processor import chunk_tokens, extrair, tipo_arquivo, tokenizar_com
+from src.embeddings import EmbeddingService
+from src.filters import MetadataIndex, ler_filtros
+from src.jobs import FilaCheia, JobQueue
+from src.lexical import LexicalIndex, rrf
+from src.metrics import Cronometro, Registro, memoria_rss
+from src.ocr import OCRPool
+from src.query_cache import QueryCache
+from src.search_engine import SearchEngine
+from src.sharded_engine import ShardIndisponivel, ShardedEngine
+from src.snapshot import SnapshotScheduler, carregar_snapshot, salvar_snapshot
+from src.supabase_db import PgVectorEngine, SupabaseDBManager
 
 app = Flask(__name__)
 
@@ -25,21 +38,100 @@ MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB limite por arquivo
 UPLOAD_FOLDER = tempfile.mkdtemp()
 
 # Inicialização
-model = SentenceTransformer('all-MiniLM-L6-v2')
-reader = easyocr.Reader(['pt'], gpu=False)
-embedding_dim = 384
-index = faiss.IndexFlatL2(embedding_dim)
-documentos = []
+def carregar_modelo():
+    # Importado aqui: torch e sentence_transformers dominam o tempo de importação
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(config.MODEL_NAME)
+
+embedding_cache = None
+if config.EMBEDDING_CACHE_MAX_ITEMS > 0:
+    embedding_cache = EmbeddingCache(config.EMBEDDING_CACHE_PATH,
+                                     config.MODEL_NAME,
+                                     config.EMBEDDING_DIM,
+                                     max_itens=config.EMBEDDING_CACHE_MAX_ITEMS)
+embeddings = EmbeddingService(carregar_modelo,
+                              config.EMBEDDING_DIM,
+                              batch_size=config.EMBEDDING_BATCH_SIZE,
+                              max_batch_size=config.EMBEDDING_MAX_BATCH_SIZE,
+                              max_wait_ms=config.EMBEDDING_MAX_WAIT_MS,
+                              cache=embedding_cache)
+# Métricas expostas em /metrics; os medidores são registrados depois dos componentes
+metricas = Registro(prefixo="vetorizador_")
+latencia_etapa = metricas.histograma(
+    "etapa_segundos",
+    "Duração das etapas: extração (inclui esperar o OCR) e chunking por documento, "
+    "OCR por página, embedding e indexação por lote de chunks, busca no índice por chamada",
+    rotulos=("etapa",))
+latencia_busca = metricas.histograma("busca_segundos", "Duração das requisições de busca", rotulos=("modo",))
+documentos_processados = metricas.contador("documentos_processados_total", "Arquivos processados por resultado",
+                                           rotulos=("status",))
+erros_total = metricas.contador("erros_total", "Erros de ingestão registrados")
+ocr_pool = OCRPool(workers=config.OCR_WORKERS, idiomas=config.OCR_LANGUAGES, dpi=config.OCR_DPI,
+                   ao_concluir=lambda segundos: latencia_etapa.observar(segundos, etapa="ocr"))
+embedding_dim = config.EMBEDDING_DIM
+parametros_index = dict(tipo=config.INDEX_TYPE,
+                        nlist=config.INDEX_NLIST,
+                        pq_m=config.INDEX_PQ_M,
+                        hnsw_m=config.INDEX_HNSW_M,
+                        ef_construction=config.INDEX_EF_CONSTRUCTION,
+                        nprobe=config.INDEX_NPROBE,
+                        ef_search=config.INDEX_EF_SEARCH,
+                        treino_min=config.INDEX_TRAIN_MIN,
+                        compactar_min=config.INDEX_COMPACT_MIN,
+                        compactar_fracao=config.INDEX_COMPACT_RATIO,
+                        rerank=config.INDEX_RERANK)
+# Com postgres os vetores e a busca ficam no pgvector, compartilhados entre réplicas; sem índice FAISS local
+busca_remota = config.STORAGE_BACKEND == 'postgres'
+sharded = config.INDEX_SHARDS > 1 and not busca_remota
+store_remoto = None
+if busca_remota:
+    store_remoto = SupabaseDBManager(config.DATABASE_URL,
+                                     config.EMBEDDING_DIM,
+                                     pool_min=config.PG_POOL_MIN,
+                                     pool_max=config.PG_POOL_MAX,
+                                     lote_escrita=config.DB_WRITE_BATCH,
+                                     probes=config.PG_IVFFLAT_PROBES,
+                                     aplicar_migracao=config.PG_APPLY_MIGRATIONS)
+# Consultas repetidas: texto -> embedding e (coleção, consulta, parâmetros) -> resultados
+cache_vetores_consulta = QueryCache(config.QUERY_EMBEDDING_CACHE_SIZE, config.QUERY_CACHE_TTL)
+cache_resultados = QueryCache(config.QUERY_CACHE_SIZE, config.QUERY_CACHE_TTL, particao=lambda chave: chave[0])
+
+def caminhos_colecao(nome):
+    """(banco SQLite, diretório de snapshots) da coleção; a padrão usa os caminhos de sempre"""
+    if nome == config.DEFAULT_COLLECTION:
+        return config.DATABASE_PATH, config.SNAPSHOT_DIR
+    return os.path.join(colecoes.caminho(nome), 'documentos.db'), os.path.join(colecoes.caminho(nome), 'snapshots')
+
+def criar_colecao(nome):
+    """Índice, banco e índices secundários de uma coleção, ainda vazios"""
+    if busca_remota:
+        return Colecao(nome, PgVectorEngine(store_remoto, probes=config.PG_IVFFLAT_PROBES), store=store_remoto)
+    caminho_banco, diretorio_snapshots = caminhos_colecao(nome)
+    if sharded:
+        engine = ShardedEngine(embedding_dim, config.INDEX_SHARDS,
+                               atribuidos=config.INDEX_SHARDS_ASSIGNED,
+                               workers=config.INDEX_SHARD_THREADS,
+                               diretorio=diretorio_snapshots,
+                               **parametros_index)
+    else:
+        engine = SearchEngine(embedding_dim, **parametros_index)
+    store = None
+    if config.STORAGE_BACKEND == 'sqlite':
+        store = DocumentStore(caminho_banco, config.EMBEDDING_DIM, lote_escrita=config.DB_WRITE_BATCH)
+        engine.carregar_vetores = store.obter_vetores
+        if sharded:
+            engine.carregar_do_banco = lambda shard, num_shards: store.carregar_chunks(shard=shard,
+                                                                                     num_shards=num_shards)
+    return Colecao(nome, engine, store=store, lexical=LexicalIndex(), filtros=MetadataIndex(),
+                   diretorio_snapshots=diretorio_snapshots)
 
-# Estrutura para armazenar estatísticas
+# Estrutura para armazenar estatísticas do processo; os contadores de
+# documentos ficam em cada coleção
 estatisticas = {
-    "total_documentos": 0,
-    "total_embeddings": 0,
-    "espaco_utilizado": 0,
-    "ultimo_upload": None,
     "processando": False,
     "fila_processamento": [],
-    "erros": []
+    # Só as mensagens mais recentes; o total fica no contador vetorizador_erros_total
+    "erros": deque(maxlen=config.STATS_MAX_ERRORS)
 }
 
 # Lock para operações thread-safe
@@ -83,9 +175,9 @@ SIMPLE_HTML = '''
         
         <div class="upload-area" onclick="document.getElementById('fileInput').click()">
             <h3>📁 Upload de Documentos</h3>
-            <p>Clique ou arraste arquivos PDF, DOCX ou TXT</p>
+            <p>Clique ou arraste arquivos PDF, DOCX, TXT, XLSX ou imagens</p>
             <button class="btn">Selecionar Arquivos</button>
-            <input type="file" id="fileInput" name="files" accept=".pdf,.docx,.txt" multiple style="display: none;" onchange="uploadFiles(event)">
+            <input type="file" id="fileInput" name="files" accept=".pdf,.docx,.txt,.xlsx,.png,.jpg,.jpeg" multiple style="display: none;" onchange="uploadFiles(event)">
         </div>
         
         <h2>🔍 Busca Semântica</h2>
@@ -152,18 +244,573 @@ SIMPLE_HTML = '''
 
 @app.route('/health')
 def health():
+    # Liveness: responde assim que o Flask sobe, sem depender do modelo; não carrega coleções
+    residentes = colecoes.lista_residentes()
+    padrao = next((colecao for colecao in residentes if colecao.nome == config.DEFAULT_COLLECTION), None)
     return jsonify({
         "status": "healthy", 
+        "ready": prontidao["pronto"],
         "timestamp": datetime.now().isoformat(),
-        "documents_processed": len(documentos),
-        "total_embeddings": index.ntotal if index else 0
+        "documents_processed": sum(len(colecao.documentos) for colecao in residentes),
+        "total_embeddings": sum(colecao.engine.ntotal for colecao in residentes),
+        "index_type": padrao.engine.tipo_atual if padrao else config.INDEX_TYPE,
+        "collections_loaded": len(residentes)
     }), 200
 
+@app.route('/ready')
+def ready():
+    # Readiness: 200 só com o índice restaurado e o modelo carregado
+    corpo = {
+        "ready": prontidao["pronto"],
+        "model_loaded": embeddings.pronto,
+        "error": prontidao["erro"],
+        "startup_seconds": (prontidao["pronto_em"] - prontidao["iniciado_em"]) if prontidao["pronto"] else None
+    }
+    return jsonify(corpo), 200 if prontidao["pronto"] else 503
+
 @app.route('/')
 def home():
-    return render_template_string(SIMPLE_HTML, 
-                                estatisticas=estatisticas,
-                                documentos=documentos)
+    with colecoes.usar(config.DEFAULT_COLLECTION, criar=True) as colecao:
+        return render_template_string(SIMPLE_HTML,
+                                      estatisticas=resumo_estatisticas(colecao),
+                                      documentos=colecao.documentos)
+
+def indexar_documento(colecao, documento, chunks):
+    """Gera os embeddings dos chunks em lotes e registra o documento no índice e no banco da coleção"""
+    engine = colecao.engine
+    registro_id = engine.reservar_id()
+    documento["registro_id"] = registro_id
+    if sharded and config.INDEX_SHARD_KEY:
+        engine.atribuir(documento["id"], (documento.get("metadata") or {}).get(config.INDEX_SHARD_KEY))
+    if colecao.store:
+        colecao.store.registrar_documento(registro_id, documento)
+
+    ids = []
+    primeiro_texto = None
+    try:
+        lote = []
+        for chunk in chunks:
+            if primeiro_texto is None:
+                primeiro_texto = chunk
+            lote.append(chunk)
+            if len(lote) >= config.INGEST_CHUNK_BATCH:
+                ids.extend(indexar_lote(colecao, documento, lote, primeiro_chunk=len(ids) + 1))
+                lote = []
+        if lote:
+            ids.extend(indexar_lote(colecao, documento, lote, primeiro_chunk=len(ids) + 1))
+        if not ids:
+            raise ValueError("Nenhum texto extraído do documento")
+    except Exception:
+        # Descarta os chunks já indexados do documento incompleto
+        engine.remover(ids)
+        if not busca_remota:
+            colecao.lexical.remove(ids)
+        if colecao.store:
+            colecao.store.remover_documento(registro_id)
+        raise
+
+    engine.finalizar(ids)
+    documento["total_chunks"] = len(ids)
+    documento["texto"] = primeiro_texto[:config.PREVIEW_CHARS]
+    if colecao.store:
+        colecao.store.finalizar_documento(registro_id, documento)
+    with colecao.lock:
+        adicionar_documento(colecao, documento)
+        colecao.estatisticas["total_embeddings"] += len(ids)
+    if not busca_remota:
+        colecao.filtros.add(documento, ids)
+    cache_resultados.invalidar(colecao.nome)
+
+def indexar_lote(colecao, documento, textos, primeiro_chunk):
+    with latencia_etapa.medir(etapa="embedding"):
+        vetores = embeddings.encode(textos)
+    with latencia_etapa.medir(etapa="indexacao"):
+        ids = colecao.engine.add(documento["id"], textos, vetores, primeiro_chunk=primeiro_chunk)
+        if not busca_remota:
+            colecao.lexical.add(ids, textos)
+        if colecao.store:
+            colecao.store.registrar_chunks(documento["registro_id"], documento, ids, textos, vetores, primeiro_chunk)
+    return ids
+
+def adicionar_documento(colecao, documento):
+    """Registra o documento na lista e nos mapas em memória da coleção (chamar com colecao.lock)"""
+    # A lista fica ordenada por seq, o que permite achar um cursor por bisect
+    if documento.get("seq") is None or documento["seq"] < colecao.proximo_seq:
+        documento["seq"] = colecao.proximo_seq
+    colecao.proximo_seq = documento["seq"] + 1
+    colecao.documentos.append(documento)
+    colecao.documentos_por_id[documento["id"]] = documento
+    colecao.documentos_por_hash[chave_documento(documento)] = documento
+    colecao.versoes_por_nome.setdefault(chave_versao(documento), {})[documento["id"]] = documento
+
+def chave_documento(documento):
+    """Chave de deduplicação: o mesmo arquivo com metadata diferente (outro tenant) é outro documento"""
+    if not documento.get("metadata"):
+        return documento["hash"]
+    return documento["hash"] + ":" + json.dumps(documento["metadata"], sort_keys=True, ensure_ascii=False)
+
+def chave_versao(documento):
+    """Versões do mesmo arquivo: mesmo nome e mesma metadata, conteúdo qualquer"""
+    return documento["nome"], json.dumps(documento.get("metadata") or None, sort_keys=True, ensure_ascii=False)
+
+def processar_arquivo(colecao, nome, caminho, metadata=None, substituidos=None):
+    """
+    Extrai, divide em chunks, indexa e contabiliza um arquivo salvo em disco.
+
+    Retorna (documento, novo); arquivos com conteúdo e metadata idênticos a
+    um documento já indexado (ou em processamento) não são reprocessados.
+    Se a lista `substituidos` for passada, versões anteriores com o mesmo
+    nome e metadata são removidas depois que a nova estiver indexada, e os
+    ids removidos são acrescentados a ela.
+    """
+    tamanho = os.path.getsize(caminho)
+    hash_conteudo = hash_arquivo(caminho)
+    chave = chave_documento({"hash": hash_conteudo, "metadata": metadata})
+    with colecao.lock:
+        existente = colecao.documentos_por_hash.get(chave)
+        if existente is not None or chave in colecao.hashes_em_processamento:
+            return existente, False
+        colecao.hashes_em_processamento.add(chave)
+
+    try:
+        documento = {
+            "id": str(uuid.uuid4()),
+            "nome": nome,
+            "tipo": tipo_arquivo(nome),
+            "tamanho": tamanho,
+            "hash": hash_conteudo,
+            "data": datetime.now().strftime("%d/%m/%Y %H:%M")
+        }
+        if metadata:
+            documento["metadata"] = metadata
+
+        paginas_ocr = []
+        # Extração e chunking são geradores consumidos pela indexação: cada
+        # cronômetro mede o tempo dentro do seu gerador (o do chunking inclui
+        # o da extração, que é descontado)
+        extracao = Cronometro()
+        chunking = Cronometro()
+        segmentos = extracao.iterar(extrair(caminho, nome,
+                                            ocr=ocr_pool,
+                                            min_caracteres=config.PDF_MIN_TEXT_CHARS,
+                                            paginas_ocr=paginas_ocr))
+        chunks = chunking.iterar(chunk_tokens(segmentos,
+                                              max_tokens=config.CHUNK_TOKENS,
+                                              overlap=config.CHUNK_OVERLAP,
+                                              tokenizar=tokenizar_com(getattr(embeddings.model, 'tokenizer', None))))
+        if documento["tipo"] == "pdf":
+            documento["paginas_ocr"] = paginas_ocr
+        indexar_documento(colecao, documento, chunks)
+        latencia_etapa.observar(extracao.total, etapa="extracao")
+        latencia_etapa.observar(max(chunking.total - extracao.total, 0.0), etapa="chunking")
+    finally:
+        with colecao.lock:
+            colecao.hashes_em_processamento.discard(chave)
+
+    # Atualizar estatísticas
+    with colecao.lock:
+        colecao.estatisticas["total_documentos"] += 1
+        colecao.estatisticas["espaco_utilizado"] += tamanho
+        colecao.estatisticas["ultimo_upload"] = datetime.now().strftime("%H:%M:%S")
+        anteriores = []
+        if substituidos is not None:
+            versoes = colecao.versoes_por_nome.get(chave_versao(documento), {})
+            anteriores = [documento_id for documento_id in versoes if documento_id != documento["id"]]
+    for documento_id in anteriores:
+        if remover_documento(colecao, documento_id):
+            substituidos.append(documento_id)
+    return documento, True
+
+def remover_documento(colecao, documento_id):
+    """Remove o documento do índice, dos índices secundários e do banco; retorna o documento ou None"""
+    with colecao.lock:
+        documento = colecao.documentos_por_id.pop(documento_id, None)
+        if documento is None:
+            return None
+        colecao.documentos.remove(documento)
+        colecao.documentos_por_hash.pop(chave_documento(documento), None)
+        versoes = colecao.versoes_por_nome.get(chave_versao(documento))
+        if versoes is not None:
+            versoes.pop(documento_id, None)
+            if not versoes:
+                del colecao.versoes_por_nome[chave_versao(documento)]
+        colecao.estatisticas["total_documentos"] -= 1
+        colecao.estatisticas["espaco_utilizado"] -= documento["tamanho"] or 0
+        colecao.estatisticas["total_embeddings"] -= documento.get("total_chunks") or 0
+
+    if not busca_remota:
+        ids = colecao.filtros.ids_chunks(documento_id)
+        colecao.engine.remover(ids)
+        colecao.lexical.remove(ids)
+        colecao.filtros.remove(documento)
+    if colecao.store and documento.get("registro_id") is not None:
+        colecao.store.remover_documento(documento["registro_id"])
+    cache_resultados.invalidar(colecao.nome)
+    return documento
+
+def processar_job(job, arquivos):
+    """Executado pelas threads do pool: processa os arquivos de um upload"""
+    # Todos os arquivos de um upload vão para a mesma coleção, criada se não existir
+    nome_colecao = arquivos[0].get("colecao", config.DEFAULT_COLLECTION)
+    try:
+        with colecoes.usar(nome_colecao, criar=True) as colecao:
+            resultado = processar_arquivos(colecao, arquivos)
+    finally:
+        for arquivo in arquivos:
+            try:
+                os.remove(arquivo["caminho"])
+            except OSError:
+                pass
+    # Depois do resultado pronto: a coleção cresceu e as ociosas podem precisar
+    # sair da memória (falhas ao despejar são registradas, não afetam o upload)
+    colecoes.aplicar_orcamento()
+    return resultado
+
+def processar_arquivos(colecao, arquivos):
+    resultados = []
+    errors = []
+    for arquivo in arquivos:
+        try:
+            substituidos = [] if arquivo.get("substituir") else None
+            documento, novo = processar_arquivo(colecao, arquivo["nome"], arquivo["caminho"],
+                                                arquivo.get("metadata"), substituidos)
+            resultado = {
+                "nome": arquivo["nome"],
+                "status": "concluido" if novo else "duplicado",
+                "documento_id": documento["id"] if documento else None
+            }
+            if substituidos is not None:
+                # Só quem pediu a substituição recebe a lista (vazia se não havia versão anterior)
+                resultado["substituidos"] = substituidos
+            resultados.append(resultado)
+            documentos_processados.inc(status=resultado["status"])
+        except Exception as e:
+            error_msg = f"Erro ao processar {arquivo['nome']}: {str(e)}"
+            errors.append(error_msg)
+            resultados.append({"nome": arquivo["nome"], "status": "erro", "erro": error_msg})
+            documentos_processados.inc(status="erro")
+            registrar_erro(error_msg)
+
+    processed = len(resultados) - len(errors)
+    if errors and processed == 0:
+        status = "erro"
+    elif errors:
+        status = "concluido_com_erros"
+    else:
+        status = "concluido"
+    return {"status": status, "arquivos": resultados, "processed": processed, "errors": errors}
+
+def registrar_erro(mensagem):
+    with lock:
+        estatisticas["erros"].append(mensagem)
+    erros_total.inc()
+
+def atualizar_fila(fila):
+    """Reflete o estado da fila de ingestão nas estatísticas"""
+    with lock:
+        estatisticas["processando"] = fila.ativos > 0
+        estatisticas["fila_processamento"] = fila.pendentes()
+
+CONTADORES_PERSISTIDOS = ("total_documentos", "total_embeddings", "espaco_utilizado", "ultimo_upload")
+
+def gravar_snapshot(colecao):
+    """Grava o índice e os metadados da coleção em disco de forma consistente"""
+    if busca_remota:
+        return  # os vetores estão no pgvector: não há índice local para gravar
+    engine = colecao.engine
+    # As buscas continuam durante a gravação; só as escritas no índice esperam.
+    # colecao.lock fica só com a cópia dos documentos e contadores, não com a
+    # escrita em disco (nenhum código espera o índice segurando colecao.lock)
+    with engine.sem_escritas() if sharded else engine.lock.sem_escritas():
+        with colecao.lock:
+            documentos = [dict(documento) for documento in colecao.documentos]
+            contadores = {c: colecao.estatisticas[c] for c in CONTADORES_PERSISTIDOS}
+        if sharded:
+            # Cada shard no seu diretório; o snapshot principal fica só com os metadados
+            engine.salvar_snapshots(manter=config.SNAPSHOT_KEEP)
+            metadados = {
+                "documentos": documentos,
+                "shards": engine.num_shards,
+                "proximo_id": engine.proximo_id,
+                "estatisticas": contadores
+            }
+            salvar_snapshot(colecao.diretorio_snapshots, None, metadados, manter=config.SNAPSHOT_KEEP)
+            return
+        metadados = {
+            "documentos": documentos,
+            "chunks": engine.exportar_chunks(),
+            "proximo_id": engine.proximo_id,
+            "estatisticas": contadores
+        }
+        salvar_snapshot(colecao.diretorio_snapshots, engine.index, metadados, manter=config.SNAPSHOT_KEEP,
+                        base=engine.base_mapeada)
+
+def restaurar_snapshot(colecao):
+    """Carrega o último snapshot da coleção, se existir; retorna True se restaurou"""
+    engine = colecao.engine
+    try:
+        snapshot = carregar_snapshot(colecao.diretorio_snapshots, mmap=config.SNAPSHOT_MMAP)
+    except Exception as e:
+        print(f"Snapshot da coleção {colecao.nome} ignorado: {e}")
+        return False
+    if snapshot is None:
+        return False
+    index_salvo, metadados, base = snapshot
+    if metadados.get("shards", 1) != (engine.num_shards if sharded else 1):
+        # Snapshot gravado com outra divisão do índice: os ids não batem com os shards atuais
+        print(f"Snapshot da coleção {colecao.nome} ignorado: gravado com outro número de shards")
+        return False
+    if not sharded:
+        engine.restaurar(index_salvo, metadados["chunks"], base=base)
+    engine.garantir_proximo_id(metadados.get("proximo_id", 0))
+    with colecao.lock:
+        for documento in metadados["documentos"]:
+            adicionar_documento(colecao, documento)
+        colecao.estatisticas.update(metadados["estatisticas"])
+    print(f"Coleção {colecao.nome} restaurada do snapshot: {len(colecao.documentos)} documentos, "
+          f"{engine.ntotal} embeddings")
+    return True
+
+def restaurar_banco(colecao):
+    """Sem snapshot, reconstrói o índice da coleção a partir dos vetores gravados no SQLite"""
+    engine = colecao.engine
+    # Os shards são carregados um a um em abrir_colecao
+    if not busca_remota and not sharded:
+        for ids, vetores, registros in colecao.store.carregar_chunks():
+            engine.carregar(ids, vetores, registros)
+    with colecao.lock:
+        for documento in colecao.store.carregar_documentos():
+            adicionar_documento(colecao, documento)
+            colecao.estatisticas["espaco_utilizado"] += documento["tamanho"] or 0
+        colecao.estatisticas["total_documentos"] = len(colecao.documentos)
+        colecao.estatisticas["total_embeddings"] = engine.ntotal
+    if colecao.documentos:
+        print(f"Coleção {colecao.nome} reconstruída do banco: {len(colecao.documentos)} documentos, "
+              f"{engine.ntotal} embeddings")
+
+def reconstruir_indices_secundarios(colecao, tamanho_lote=10_000):
+    """Reindexa no BM25 e nos filtros de metadados os chunks restaurados do snapshot ou do banco"""
+    itens = [(vetor_id, chunk["documento_id"], chunk["chunk_text"])
+             for vetor_id, chunk in colecao.engine.itens_chunks()]
+    ids_por_documento = {}
+    for inicio in range(0, len(itens), tamanho_lote):
+        lote = itens[inicio:inicio + tamanho_lote]
+        colecao.lexical.add([vetor_id for vetor_id, _, _ in lote], [texto for _, _, texto in lote])
+        for vetor_id, documento_id, _ in lote:
+            ids_por_documento.setdefault(documento_id, []).append(vetor_id)
+    with colecao.lock:
+        restaurados = list(colecao.documentos)
+    for documento in restaurados:
+        colecao.filtros.add(documento, ids_por_documento.get(documento["id"], []))
+
+def descartar_orfaos(colecao, itens):
+    """
+    Remove do índice os chunks cujo documento não está na coleção (em
+    processamento quando o snapshot foi gravado, ou removido depois dele ou
+    com o shard descarregado); retorna os itens (id, registro) que ficaram
+    """
+    with colecao.lock:
+        orfaos = [vetor_id for vetor_id, chunk in itens if chunk["documento_id"] not in colecao.documentos_por_id]
+    if not orfaos:
+        return itens
+    colecao.engine.remover(orfaos)
+    removidos = set(orfaos)
+    return [(vetor_id, chunk) for vetor_id, chunk in itens if vetor_id not in removidos]
+
+def sincronizar_banco(colecao):
+    """
+    Completa o snapshot com o que o SQLite gravou depois dele, já que o banco é
+    a fonte da verdade: documentos concluídos depois do snapshot entram com os
+    seus chunks e os removidos depois dele saem
+    """
+    engine = colecao.engine
+    no_banco = {documento["registro_id"]: documento for documento in colecao.store.carregar_documentos()}
+    with colecao.lock:
+        no_snapshot = {documento.get("registro_id") for documento in colecao.documentos}
+        apagados = [documento["id"] for documento in colecao.documentos
+                    if documento.get("registro_id") is not None and documento["registro_id"] not in no_banco]
+    for documento_id in apagados:
+        remover_documento(colecao, documento_id)
+    novos = [documento for registro_id, documento in no_banco.items() if registro_id not in no_snapshot]
+    with colecao.lock:
+        for documento in novos:
+            adicionar_documento(colecao, documento)
+            colecao.estatisticas["total_documentos"] += 1
+            colecao.estatisticas["espaco_utilizado"] += documento["tamanho"] or 0
+    descartar_orfaos(colecao, engine.itens_chunks())
+
+    for ids, vetores, registros in colecao.store.carregar_chunks(principais=no_banco.keys() - no_snapshot):
+        faltantes = []
+        for posicao, (vetor_id, registro) in enumerate(zip(ids.tolist(), registros)):
+            existente = engine.registro(vetor_id)
+            if existente is None:
+                faltantes.append(posicao)
+            else:
+                # Chunk que estava em processamento no snapshot: o vetor já está no índice
+                existente.update(registro)
+        if faltantes:
+            engine.carregar(ids[faltantes], vetores[faltantes], [registros[posicao] for posicao in faltantes])
+    with colecao.lock:
+        colecao.estatisticas["total_embeddings"] = engine.ntotal
+    if novos or apagados:
+        print(f"Coleção {colecao.nome} sincronizada com o banco: {len(novos)} documentos recuperados, "
+              f"{len(apagados)} removidos")
+
+def abrir_colecao(nome):
+    """Cria a coleção e restaura documentos e índice do snapshot e do banco"""
+    colecao = criar_colecao(nome)
+    # Com o pgvector o banco é a fonte da verdade: não há snapshot local
+    restaurado = not busca_remota and restaurar_snapshot(colecao)
+    if not restaurado and colecao.store:
+        restaurar_banco(colecao)
+    if sharded:
+        # Cada shard atribuído vem do seu snapshot ou, sem ele, do banco
+        for shard in colecao.engine.atribuidos:
+            colecao.engine.carregar_shard(shard, mmap=config.SNAPSHOT_MMAP)
+        with colecao.lock:
+            colecao.estatisticas["total_embeddings"] = colecao.engine.ntotal
+    if restaurado and colecao.store:
+        sincronizar_banco(colecao)
+    elif not busca_remota:
+        descartar_orfaos(colecao, colecao.engine.itens_chunks())
+    if colecao.store:
+        colecao.engine.garantir_proximo_id(colecao.store.maior_id() + 1)
+    if not busca_remota:
+        reconstruir_indices_secundarios(colecao)
+    return colecao
+
+def encerrar(*_):
+    """Grava o snapshot final no desligamento (SIGTERM do Railway/Procfile)"""
+    snapshots.stop()
+    for colecao in colecoes.lista_residentes():
+        if colecao.store:
+            colecao.store.flush()
+    if busca_remota:
+        return
+    try:
+        snapshots.salvar_se_alterado()
+    except Exception as e:
+        print(f"Erro ao gravar snapshot final: {e}")
+
+# Coleções em memória sob o orçamento; as demais voltam do disco na primeira requisição
+colecoes = GerenciadorColecoes(config.COLLECTIONS_DIR,
+                               abrir=abrir_colecao,
+                               salvar=gravar_snapshot,
+                               orcamento_bytes=int(config.COLLECTIONS_MEMORY_BUDGET_MB * 1024 * 1024),
+                               padrao=config.DEFAULT_COLLECTION)
+
+snapshots = SnapshotScheduler(colecoes.salvar_alteradas, colecoes.versao, intervalo=config.SNAPSHOT_INTERVAL)
+
+job_queue = JobQueue(processar_job,
+                     workers=config.INGEST_WORKERS,
+                     max_fila=config.INGEST_QUEUE_SIZE,
+                     ao_mudar=atualizar_fila)
+
+def somar_residentes(funcao):
+    return sum(funcao(colecao) for colecao in colecoes.lista_residentes())
+
+metricas.medidor("fila_ingestao_jobs", "Jobs de ingestão aguardando uma thread", lambda: len(job_queue.pendentes()))
+metricas.medidor("ingestao_ativos", "Jobs de ingestão em processamento", lambda: job_queue.ativos)
+metricas.medidor("fila_embeddings", "Pedidos aguardando o batcher de embeddings", lambda: embeddings.pedidos.qsize())
+metricas.medidor("indice_vetores", "Vetores pesquisáveis nos índices das coleções em memória",
+                 lambda: somar_residentes(lambda colecao: colecao.engine.ntotal))
+metricas.medidor("indice_tombstones", "Vetores removidos ainda nos índices HNSW e IVF",
+                 lambda: somar_residentes(lambda colecao: len(getattr(colecao.engine, "removidos", ()))))
+metricas.medidor("documentos", "Documentos indexados nas coleções em memória",
+                 lambda: somar_residentes(lambda colecao: len(colecao.documentos)))
+metricas.medidor("colecoes_residentes", "Coleções carregadas em memória", lambda: len(colecoes.lista_residentes()))
+metricas.medidor("colecoes_memoria_estimada_bytes", "Memória estimada das coleções em memória",
+                 colecoes.memoria_estimada)
+metricas.medidor("colecoes_cargas_total", "Coleções carregadas do disco", lambda: colecoes.cargas, tipo="counter")
+metricas.medidor("colecoes_despejos_total", "Coleções retiradas da memória pelo orçamento",
+                 lambda: colecoes.despejos, tipo="counter")
+metricas.medidor("memoria_rss_bytes", "Memória residente do processo", memoria_rss)
+metricas.medidor("cache_consultas_hits_total", "Acertos dos caches de consultas", rotulos=("cache",), tipo="counter",
+                 funcao=lambda: {("resultados",): cache_resultados.hits, ("embeddings",): cache_vetores_consulta.hits})
+metricas.medidor("cache_consultas_misses_total", "Faltas dos caches de consultas", rotulos=("cache",), tipo="counter",
+                 funcao=lambda: {("resultados",): cache_resultados.misses,
+                                 ("embeddings",): cache_vetores_consulta.misses})
+
+# Prontidão: o processo responde /health de imediato; /ready só depois do aquecimento
+prontidao = {"pronto": False, "erro": None, "iniciado_em": time.time(), "pronto_em": None}
+
+def restaurar_estado():
+    """Carrega a coleção padrão; as demais são carregadas na primeira requisição"""
+    with colecoes.usar(config.DEFAULT_COLLECTION, criar=True):
+        pass
+
+def iniciar_servicos():
+    """Threads de fundo do processo que atende as requisições"""
+    embeddings.start()
+    if not busca_remota:
+        snapshots.start()
+    # Jobs aceitos antes do fim do aquecimento esperam o modelo no batcher
+    job_queue.start()
+    atexit.register(encerrar)
+
+def aquecer():
+    try:
+        embeddings.aquecer()
+        prontidao["pronto_em"] = time.time()
+        prontidao["pronto"] = True
+        print(f"Aplicação pronta em {prontidao['pronto_em'] - prontidao['iniciado_em']:.1f}s")
+    except Exception as e:
+        prontidao["erro"] = str(e)
+        print(f"Erro na inicialização: {e}")
+
+def inicializar():
+    """Restaura o índice, libera a ingestão e aquece o modelo em segundo plano"""
+    try:
+        restaurar_estado()
+        iniciar_servicos()
+    except Exception as e:
+        prontidao["erro"] = str(e)
+        print(f"Erro na inicialização: {e}")
+        return
+    aquecer()
+
+def preparar_preload():
+    """
+    Master do gunicorn (preload_app), antes do fork: restaura o estado e
+    carrega os pesos do modelo uma vez, compartilhados copy-on-write pelos
+    workers. Nenhuma thread é iniciada aqui (threads não sobrevivem ao fork)
+    e as conexões abertas são fechadas para cada worker abrir as suas.
+    """
+    restaurar_estado()
+    for colecao in colecoes.lista_residentes():
+        if not busca_remota:
+            colecao.engine.aguardar_reconstrucao()
+        if colecao.store:
+            colecao.store.close()
+    embeddings.model  # só carrega; a primeira inferência fica para os workers
+    if embedding_cache:
+        embedding_cache.close()
+
+def iniciar_worker(threads_modelo=1):
+    """post_fork do gunicorn: reabre conexões, inicia as threads e aquece o modelo"""
+    for colecao in colecoes.lista_residentes():
+        if isinstance(colecao.store, DocumentStore):
+            colecao.store.conectar()
+    if embedding_cache:
+        embedding_cache.conectar()
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        # As threads do pool OpenMP do master não existem no processo filho;
+        # com vários workers, poucas threads por processo evitam disputa de CPU
+        torch.set_num_threads(threads_modelo)
+    prontidao["iniciado_em"] = time.time()
+    iniciar_servicos()
+    threading.Thread(target=aquecer, name="aquecimento", daemon=True).start()
+
+if config.SERVER_PRELOAD:
+    preparar_preload()
+else:
+    threading.Thread(target=inicializar, name="inicializacao", daemon=True).start()
+
+def resposta_nao_pronto():
+    response = jsonify({"status": "error", "message": "Serviço inicializando. Tente novamente em instantes."})
+    response.headers["Retry-After"] = "5"
+    return response, 503
 
 @app.route('/api/upload_batch', methods=['POST'])
 def upload_batch():
@@ -171,110 +818,474 @@ def upload_batch():
         files = request.files.getlist('files')
         if not files or len(files) == 0:
             return jsonify({"status": "error", "message": "Nenhum arquivo enviado"}), 400
-        
-        processed_count = 0
+
+        try:
+            metadata = ler_metadata_upload(request.form.get('metadata'))
+            colecao = nome_colecao(request.form.get('collection'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        substituir = request.form.get('replace', str(config.REPLACE_ON_REUPLOAD)).lower() == 'true'
+
+        arquivos = []
         errors = []
-        
-        # Processar cada arquivo
+
+        # Salvar os arquivos em disco; o processamento ocorre no pool de ingestão
         for file in files:
             if file and file.filename:
-                try:
-                    # Verificar tamanho do arquivo
-                    file.seek(0, 2)  # Ir para o final do arquivo
-                    file_size = file.tell()
-                    file.seek(0)  # Voltar ao início
-                    
-                    if file_size > MAX_FILE_SIZE:
-                        errors.append(f"Arquivo {file.filename} excede o limite de 50MB")
-                        continue
-                    
-                    # Processar o conteúdo do arquivo
-                    file_content = file.read()
-                    
-                    # Atualizar estatísticas
-                    with lock:
-                        estatisticas["total_documentos"] += 1
-                        estatisticas["espaco_utilizado"] += len(file_content)
-                        estatisticas["ultimo_upload"] = datetime.now().strftime("%H:%M:%S")
-                    
-                    # Adicionar documento à lista
-                    documentos.append({
-                        "id": str(uuid.uuid4()),
-                        "nome": file.filename,
-                        "tamanho": len(file_content),
-                        "data": datetime.now().strftime("%d/%m/%Y %H:%M"),
-                        "texto": f"Documento {file.filename} processado com sucesso! Tamanho: {len(file_content)} bytes"
-                    })
-                    
-                    processed_count += 1
-                    
-                except Exception as e:
-                    error_msg = f"Erro ao processar {file.filename}: {str(e)}"
-                    errors.append(error_msg)
-                    with lock:
-                        estatisticas["erros"].append(error_msg)
-        
-        # Retornar resposta apropriada
-        if errors and processed_count > 0:
-            return jsonify({
-                "status": "partial_success", 
-                "message": f"{processed_count} documentos processados, {len(errors)} com erro",
-                "processed": processed_count,
-                "errors": errors
-            }), 207
-        elif errors:
+                # Verificar tamanho do arquivo
+                file.seek(0, 2)  # Ir para o final do arquivo
+                file_size = file.tell()
+                file.seek(0)  # Voltar ao início
+
+                if file_size > MAX_FILE_SIZE:
+                    errors.append(f"Arquivo {file.filename} excede o limite de 50MB")
+                    continue
+
+                caminho = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}_{os.path.basename(file.filename)}")
+                file.save(caminho)
+                arquivos.append({"nome": file.filename, "caminho": caminho, "tamanho": file_size,
+                                 "metadata": metadata, "substituir": substituir, "colecao": colecao})
+
+        if not arquivos:
             return jsonify({
-                "status": "error", 
+                "status": "error",
                 "message": f"Nenhum documento processado. {len(errors)} erros encontrados",
                 "errors": errors
             }), 400
-        else:
-            return jsonify({
-                "status": "success", 
-                "message": f"{processed_count} documentos processados com sucesso!",
-                "processed": processed_count
-            }), 200
-        
+
+        try:
+            job = job_queue.submit(arquivos)
+        except FilaCheia:
+            for arquivo in arquivos:
+                os.remove(arquivo["caminho"])
+            response = jsonify({
+                "status": "error",
+                "message": "Fila de processamento cheia. Tente novamente em instantes."
+            })
+            response.headers["Retry-After"] = str(config.INGEST_RETRY_AFTER)
+            return response, 503
+
+        return jsonify({
+            "status": "accepted",
+            "message": f"{len(arquivos)} documentos enviados para processamento",
+            "job_id": job["id"],
+            "collection": colecao,
+            "queued": len(arquivos),
+            "errors": errors
+        }), 202
+
     except Exception as e:
         error_msg = f"Erro geral no processamento: {str(e)}"
-        with lock:
-            estatisticas["erros"].append(error_msg)
+        registrar_erro(error_msg)
         return jsonify({"status": "error", "message": error_msg}), 500
 
+def nome_colecao(valor):
+    """Coleção pedida na requisição (ou a padrão); ValueError se o nome for inválido"""
+    nome = validar_nome(valor or config.DEFAULT_COLLECTION)
+    if busca_remota and nome != config.DEFAULT_COLLECTION:
+        raise ValueError("Coleções indisponíveis com STORAGE_BACKEND=postgres")
+    return nome
+
+def resposta_colecao_inexistente(erro):
+    return jsonify({"status": "error", "message": str(erro)}), 404
+
+def ler_metadata_upload(texto):
+    """Metadata opcional do upload (JSON com valores simples), aplicado a todos os arquivos"""
+    if not texto:
+        return None
+    if len(texto.encode("utf-8")) > config.MAX_METADATA_BYTES:
+        raise ValueError(f"metadata excede {config.MAX_METADATA_BYTES} bytes")
+    try:
+        metadata = json.loads(texto)
+    except json.JSONDecodeError:
+        raise ValueError("metadata deve ser um JSON válido")
+    if not isinstance(metadata, dict) or not all(
+            isinstance(v, (str, int, float, bool)) or v is None for v in metadata.values()):
+        raise ValueError("metadata deve ser um objeto com valores simples")
+    return metadata or None
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job não encontrado"}), 404
+    return jsonify(job)
+
+MODOS_BUSCA = ("semantic", "lexical", "hybrid")
+
 @app.route('/api/search')
 def search():
     query = request.args.get('query', '')
     if not query:
         return jsonify({"results": []})
-    
-    # Busca semântica simulada
+    if not prontidao["pronto"]:
+        return resposta_nao_pronto()
+
+    k = request.args.get('k', config.DEFAULT_K, type=int)
+    k = max(1, min(k, config.MAX_K))
+    nprobe = request.args.get('nprobe', type=int)
+    ef_search = request.args.get('ef_search', type=int)
+    modo = request.args.get('mode', 'semantic').lower()
+    prefiltro = request.args.get('prefilter', type=int)
+    if modo not in MODOS_BUSCA:
+        return jsonify({"status": "error", "message": f"mode deve ser um de: {', '.join(MODOS_BUSCA)}"}), 400
+    try:
+        filtros = ler_filtros(tipo=request.args.get('tipo'),
+                              nome=request.args.get('nome'),
+                              data_inicio=request.args.get('data_inicio'),
+                              data_fim=request.args.get('data_fim'),
+                              metadata={chave[5:]: valor for chave, valor in request.args.items()
+                                        if chave.startswith('meta.')})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Filtro inválido: {e}"}), 400
+    try:
+        nome = nome_colecao(request.args.get('collection'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if busca_remota and (modo != "semantic" or prefiltro or filtros):
+        return jsonify({
+            "status": "error",
+            "message": "Busca lexical e filtros indisponíveis com STORAGE_BACKEND=postgres"
+        }), 400
+
+    chave = (nome, modo, normalizar_texto(query), k, prefiltro, nprobe, ef_search, filtros)
+    with latencia_busca.medir(modo=modo):
+        geracao = cache_resultados.geracao_de(chave)
+        resultados = cache_resultados.get(chave)
+        if resultados is None:
+            # Uma coleção fora da memória é carregada aqui, na primeira consulta
+            try:
+                with colecoes.usar(nome) as colecao:
+                    selecao = colecao.filtros.resolver(filtros) if filtros else None
+                    if modo == "semantic" and not prefiltro:
+                        resultados = busca_semantica(colecao, vetores_consulta([query]), k, nprobe, ef_search,
+                                                     selecao)[0]
+                    else:
+                        resultados = busca_lexica(colecao, query, k, modo, prefiltro, nprobe, ef_search, selecao)
+            except ColecaoInexistente as e:
+                return resposta_colecao_inexistente(e)
+            cache_resultados.put(chave, resultados, geracao)
+
+    if modo == "semantic" and not prefiltro:
+        return jsonify({"results": resultados})
+    return jsonify({"results": resultados, "mode": modo})
+
+@app.route('/api/search/batch', methods=['POST'])
+def search_batch():
+    """Várias consultas com um único encode e uma única busca no índice"""
+    if not prontidao["pronto"]:
+        return resposta_nao_pronto()
+    corpo = request.get_json(silent=True) or {}
+    queries = corpo.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return jsonify({"status": "error", "message": "queries deve ser uma lista de textos"}), 400
+    if len(queries) > config.MAX_BATCH_QUERIES:
+        return jsonify({
+            "status": "error",
+            "message": f"No máximo {config.MAX_BATCH_QUERIES} consultas por requisição"
+        }), 400
+
+    try:
+        k = max(1, min(int(corpo.get("k", config.DEFAULT_K)), config.MAX_K))
+        nprobe = int(corpo["nprobe"]) if corpo.get("nprobe") is not None else None
+        ef_search = int(corpo["ef_search"]) if corpo.get("ef_search") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "k, nprobe e ef_search devem ser inteiros"}), 400
+    try:
+        filtros = ler_filtros(**corpo["filters"]) if corpo.get("filters") else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Filtro inválido: {e}"}), 400
+    if busca_remota and filtros:
+        return jsonify({"status": "error", "message": "Filtros indisponíveis com STORAGE_BACKEND=postgres"}), 400
+    try:
+        nome = nome_colecao(corpo.get("collection"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    # Mesmas chaves do /api/search semântico: as duas rotas compartilham o cache
+    with latencia_busca.medir(modo="batch"):
+        chaves = [(nome, "semantic", normalizar_texto(q), k, None, nprobe, ef_search, filtros) for q in queries]
+        geracao = cache_resultados.geracao_de((nome,))  # as chaves são todas da mesma coleção
+        resultados = [cache_resultados.get(chave) if q.strip() else [] for q, chave in zip(queries, chaves)]
+        faltantes = [i for i, r in enumerate(resultados) if r is None]
+        if faltantes:
+            try:
+                with colecoes.usar(nome) as colecao:
+                    selecao = colecao.filtros.resolver(filtros) if filtros else None
+                    encontrados = busca_semantica(colecao, vetores_consulta([queries[i] for i in faltantes]), k,
+                                                  nprobe, ef_search, selecao)
+            except ColecaoInexistente as e:
+                return resposta_colecao_inexistente(e)
+            for i, r in zip(faltantes, encontrados):
+                resultados[i] = r
+                cache_resultados.put(chaves[i], r, geracao)
+
+    return jsonify({"results": [{"query": q, "results": r} for q, r in zip(queries, resultados)]})
+
+def vetores_consulta(queries):
+    """Embeddings das consultas; só as ausentes do cache em memória passam pelo modelo"""
+    chaves = [normalizar_texto(q) for q in queries]
+    vetores = np.empty((len(queries), config.EMBEDDING_DIM), dtype=np.float32)
+    faltantes = []
+    for i, chave in enumerate(chaves):
+        vetor = cache_vetores_consulta.get(chave)
+        if vetor is None:
+            faltantes.append(i)
+        else:
+            vetores[i] = vetor
+    if faltantes:
+        novos = embeddings.encode([queries[i] for i in faltantes], usar_cache=False)
+        for i, vetor in zip(faltantes, novos):
+            vetores[i] = vetor
+            cache_vetores_consulta.put(chaves[i], vetor.copy())
+    return vetores
+
+def busca_semantica(colecao, vetores, k, nprobe, ef_search, selecao=None):
+    """
+    Uma lista de resultados por linha de `vetores`, com uma única busca no
+    índice; `selecao` (filtros resolvidos) restringe a busca ANN aos chunks permitidos
+    """
+    with latencia_etapa.medir(etapa="busca"):
+        lotes = colecao.engine.search_lote(vetores, k, nprobe=nprobe, ef_search=ef_search, selecao=selecao)
     resultados = []
-    if documentos:
-        # Simular busca semântica com resultados aleatórios
-        import random
-        for doc in documentos[-5:]:  # Últimos 5 documentos
-            resultados.append({
-                "nome": doc["nome"],
-                "texto": doc["texto"],
-                "data": doc["data"],
-                "similaridade": random.uniform(0.7, 0.95)  # Similaridade simulada
-            })
-    
-    return jsonify({"results": resultados})
+    for pares in lotes:
+        resultado = []
+        for chunk, score in pares:
+            # Com o pgvector o chunk pode ser de um documento enviado a outra réplica
+            doc = colecao.documentos_por_id.get(chunk["documento_id"]) or chunk.get("documento")
+            if doc is not None:
+                resultado.append(formatar_resultado(doc, chunk, score))
+        resultados.append(resultado)
+    return resultados
+
+def busca_lexica(colecao, query, k, modo, prefiltro, nprobe, ef_search, selecao=None):
+    """
+    Modos lexical e hybrid, e o prefiltro lexical: `prefilter=N` limita a
+    busca vetorial aos N chunks com maior BM25. O modo hybrid funde os dois
+    rankings por reciprocal rank fusion.
+    """
+    profundidade = max(k, config.HYBRID_CANDIDATES)
+    if prefiltro:
+        prefiltro = max(1, min(prefiltro, config.MAX_PREFILTER))
+    permitidos = selecao.conjunto if selecao is not None else None
+    with latencia_etapa.medir(etapa="bm25"):
+        bm25 = dict(colecao.lexical.search(query, max(profundidade, prefiltro or 0), permitidos=permitidos))
+
+    cosseno = {}
+    if modo != "lexical":
+        candidatos = None
+        if prefiltro:
+            # Os candidatos do BM25 já respeitam os filtros
+            candidatos = sorted(bm25, key=bm25.get, reverse=True)[:prefiltro]
+            selecao = None
+        vetor = vetores_consulta([query])
+        with latencia_etapa.medir(etapa="busca"):
+            cosseno = dict(colecao.engine.search_ids(vetor, profundidade if modo == "hybrid" else k,
+                                                     nprobe=nprobe, ef_search=ef_search, ids=candidatos,
+                                                     selecao=selecao))
+
+    if modo == "hybrid":
+        rankings = [sorted(cosseno, key=cosseno.get, reverse=True),
+                    sorted(bm25, key=bm25.get, reverse=True)[:profundidade]]
+        ordenados = rrf(rankings, k, constante=config.RRF_K)
+    else:
+        scores = bm25 if modo == "lexical" else cosseno
+        ordenados = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    resultados = []
+    for vetor_id, score in ordenados:
+        chunk = colecao.engine.registro(vetor_id)
+        doc = colecao.documentos_por_id.get(chunk["documento_id"]) if chunk else None
+        if doc is None:
+            continue
+        resultado = formatar_resultado(doc, chunk, cosseno.get(vetor_id))
+        resultado.update({"bm25": bm25.get(vetor_id), "score": score})
+        resultados.append(resultado)
+    return resultados
+
+def formatar_resultado(doc, chunk, similaridade):
+    return {
+        "documento_id": doc["id"],
+        "nome": doc["nome"],
+        "texto": chunk["chunk_text"],
+        "data": doc["data"],
+        "chunk_id": chunk["chunk_id"],
+        "total_chunks": chunk["total_chunks"],
+        "similaridade": similaridade
+    }
+
+def resumo_estatisticas(colecao):
+    """Contadores da coleção com o estado da ingestão e os erros do processo"""
+    with colecao.lock:
+        contadores = dict(colecao.estatisticas)
+    with lock:
+        return {"colecao": colecao.nome, **contadores, **estatisticas, "erros": list(estatisticas["erros"]),
+                "fila_processamento": list(estatisticas["fila_processamento"])}
+
+@app.route('/metrics')
+def metrics():
+    """Métricas no formato de texto do Prometheus"""
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 @app.route('/api/stats')
 def stats():
-    return jsonify(estatisticas)
+    try:
+        nome = nome_colecao(request.args.get('collection'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        with colecoes.usar(nome) as colecao:
+            resumo = resumo_estatisticas(colecao)
+    except ColecaoInexistente as e:
+        return resposta_colecao_inexistente(e)
+    return jsonify({
+        **resumo,
+        "cache_consultas": {
+            "resultados": cache_resultados.resumo(),
+            "embeddings": cache_vetores_consulta.resumo()
+        }
+    })
 
 @app.route('/api/documents')
 def list_documents():
+    """
+    Lista paginada por cursor: `limit`, `cursor` (o `next_cursor` da página
+    anterior) e `fields` (p.ex. id,nome,data). Com `format=ndjson` todos os
+    documentos a partir do cursor são enviados em streaming, um por linha.
+    `collection` escolhe a coleção (padrão: DEFAULT_COLLECTION).
+    """
+    try:
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else -1
+    except ValueError:
+        return jsonify({"status": "error", "message": "cursor inválido"}), 400
+    try:
+        nome = nome_colecao(request.args.get('collection'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if not colecoes.existe(nome):
+        return resposta_colecao_inexistente(ColecaoInexistente(f"Coleção {nome} não encontrada"))
+    campos = [c.strip() for c in request.args.get('fields', '').split(',') if c.strip()] or None
+
+    if request.args.get('format') == 'ndjson':
+        def gerar(cursor):
+            # A coleção fica fixada em memória até o fim do streaming
+            with colecoes.usar(nome) as colecao:
+                while True:
+                    with colecao.lock:
+                        pagina = pagina_documentos(colecao, cursor, 1000)
+                    if not pagina:
+                        return
+                    for documento in pagina:
+                        yield json.dumps(projetar(documento, campos), ensure_ascii=False) + "\n"
+                    cursor = pagina[-1]["seq"]
+        return Response(stream_with_context(gerar(cursor)), mimetype='application/x-ndjson')
+
+    limite = request.args.get('limit', config.DOCUMENTS_PAGE_SIZE, type=int)
+    limite = max(1, min(limite, config.DOCUMENTS_MAX_PAGE_SIZE))
+    with colecoes.usar(nome) as colecao:
+        with colecao.lock:
+            pagina = pagina_documentos(colecao, cursor, limite + 1)
+            total = len(colecao.documentos)
+        resumo = resumo_estatisticas(colecao)
+    proximo = str(pagina[limite - 1]["seq"]) if len(pagina) > limite else None
+    return jsonify({
+        "total": total,
+        "documents": [projetar(documento, campos) for documento in pagina[:limite]],
+        "next_cursor": proximo,
+        "statistics": resumo
+    })
+
+def pagina_documentos(colecao, cursor, limite):
+    """Até `limite` documentos com seq maior que o cursor (chamar com colecao.lock)"""
+    inicio = bisect.bisect_right(colecao.documentos, cursor, key=lambda documento: documento["seq"])
+    return colecao.documentos[inicio:inicio + limite]
+
+def projetar(documento, campos):
+    if campos is None:
+        return documento
+    return {campo: documento[campo] for campo in campos if campo in documento}
+
+@app.route('/api/documents/<documento_id>', methods=['DELETE'])
+def delete_document(documento_id):
+    try:
+        nome = nome_colecao(request.args.get('collection'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        with colecoes.usar(nome) as colecao:
+            documento = remover_documento(colecao, documento_id)
+    except ColecaoInexistente as e:
+        return resposta_colecao_inexistente(e)
+    if documento is None:
+        return jsonify({"status": "error", "message": "Documento não encontrado"}), 404
     return jsonify({
-        "total": len(documentos),
-        "documents": documentos,
-        "statistics": estatisticas
+        "status": "success",
+        "message": f"Documento {documento['nome']} removido",
+        "documento_id": documento_id,
+        "chunks_removidos": documento.get("total_chunks")
     })
 
+@app.route('/api/collections')
+def list_collections():
+    """Coleções conhecidas, quais estão em memória e o orçamento de memória"""
+    return jsonify({
+        "default": config.DEFAULT_COLLECTION,
+        "memory_budget_bytes": colecoes.orcamento_bytes or None,
+        "memory_estimated_bytes": colecoes.memoria_estimada(),
+        "collections": colecoes.resumo()
+    })
+
+def colecao_com_shards(funcao):
+    """Resolve a coleção da requisição para as rotas de shards"""
+    if not sharded:
+        return jsonify({"status": "error", "message": "Índice sem shards (INDEX_SHARDS=1)"}), 404
+    try:
+        nome = nome_colecao(request.args.get('collection'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        with colecoes.usar(nome) as colecao:
+            return funcao(colecao)
+    except ColecaoInexistente as e:
+        return resposta_colecao_inexistente(e)
+
+@app.route('/api/shards')
+def list_shards():
+    return colecao_com_shards(lambda colecao: jsonify({
+        "num_shards": colecao.engine.num_shards,
+        "shard_key": config.INDEX_SHARD_KEY,
+        "shards": colecao.engine.resumo()
+    }))
+
+@app.route('/api/shards/<int:shard>/load', methods=['POST'])
+def load_shard(shard):
+    """Carrega um shard atribuído a este nó e o inclui nas buscas"""
+    def carregar(colecao):
+        try:
+            itens = colecao.engine.carregar_shard(shard, mmap=config.SNAPSHOT_MMAP)
+        except ShardIndisponivel as e:
+            return jsonify({"status": "error", "message": str(e)}), 409
+        # Chunks de documentos removidos enquanto o shard estava descarregado
+        itens = descartar_orfaos(colecao, itens)
+        colecao.lexical.add([vetor_id for vetor_id, _ in itens], [chunk["chunk_text"] for _, chunk in itens])
+        cache_resultados.invalidar(colecao.nome)
+        return jsonify({"status": "success", "shard": shard, "chunks": len(itens)})
+    return colecao_com_shards(carregar)
+
+@app.route('/api/shards/<int:shard>/unload', methods=['POST'])
+def unload_shard(shard):
+    """Grava o snapshot do shard e o retira da memória e das buscas"""
+    def descarregar(colecao):
+        ids = colecao.engine.descarregar_shard(shard, manter=config.SNAPSHOT_KEEP)
+        # Os filtros de metadados mantêm os ids: a remoção de um documento continua
+        # apagando os chunks do banco, e os órfãos saem quando o shard voltar
+        colecao.lexical.remove(ids)
+        cache_resultados.invalidar(colecao.nome)
+        return jsonify({"status": "success", "shard": shard, "chunks": len(ids)})
+    return colecao_com_shards(descarregar)
+
 if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # dispara o atexit com o snapshot final
     port = int(os.environ.get('PORT', 8080))
     print(f"Iniciando aplicação na porta {port}")
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
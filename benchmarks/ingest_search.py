@@ -0,0 +1,340 @@
+"""
+Benchmark de ingestão e busca com um corpus sintético em português
+
+Gera um corpus reprodutível (semente fixa) de documentos .txt sobre temas
+variados, envia tudo pelo /api/upload_batch e mede, com a aplicação rodando
+em um diretório de dados temporário:
+
+- ingestão: documentos/s e embeddings/s de ponta a ponta, até os jobs terminarem;
+- embeddings: vetores/s do modelo isolado, sem cache;
+- construção do índice: tempo de treino e adição para cada tipo pedido, com
+  os vetores originais gravados no SQLite;
+- busca: latência p50/p95/p99 do /api/search (cache de consultas desligado)
+  e recall@k contra a busca exata; o mesmo para cada índice construído.
+
+O resultado é um JSON (stdout e, opcionalmente, --output) para comparar
+versões. As variáveis de ambiente da aplicação (MODEL_NAME, INDEX_NPROBE...)
+continuam valendo; DATA_DIR, STORAGE_BACKEND e os caches são definidos aqui.
+
+Uso:
+    python benchmarks/ingest_search.py --docs 200 --queries 100 --k 10 \\
+        --index-type hnsw --build-types flat,hnsw,ivf,sq8 --output resultado.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEMAS = {
+    "contratos": ["contrato", "cláusula", "aditivo", "rescisão", "vigência", "contratante", "multa", "prazo",
+                  "fornecedor", "garantia", "reajuste", "licitação"],
+    "saude": ["paciente", "consulta", "exame", "diagnóstico", "tratamento", "hospital", "receita", "vacina",
+              "internação", "prontuário", "sintoma", "cirurgia"],
+    "financas": ["orçamento", "receita", "despesa", "balanço", "fluxo de caixa", "investimento", "juros",
+                 "dividendo", "tributo", "auditoria", "faturamento", "provisão"],
+    "educacao": ["aluno", "professor", "disciplina", "matrícula", "avaliação", "currículo", "semestre",
+                 "frequência", "bolsa", "turma", "coordenação", "estágio"],
+    "tecnologia": ["servidor", "banco de dados", "implantação", "requisito", "integração", "segurança",
+                   "backup", "latência", "api", "monitoramento", "incidente", "versão"],
+    "juridico": ["processo", "sentença", "recurso", "audiência", "petição", "réu", "autor", "tribunal",
+                 "prazo recursal", "jurisprudência", "parecer", "intimação"],
+}
+
+SUJEITOS = ["A empresa", "O setor responsável", "A diretoria", "O comitê", "A equipe técnica", "O gestor",
+            "A comissão", "O departamento jurídico", "A coordenação", "O cliente"]
+VERBOS = ["analisou", "aprovou", "revisou", "registrou", "solicitou", "encaminhou", "atualizou", "validou",
+          "cancelou", "detalhou"]
+CONECTORES = ["conforme", "de acordo com", "em razão de", "após", "antes de", "durante", "mediante"]
+COMPLEMENTOS = ["o relatório anual", "a reunião de segunda-feira", "a norma interna", "o pedido formal",
+                "a auditoria externa", "o cronograma previsto", "a legislação vigente", "o parecer técnico"]
+
+
+def frase(rng, termos):
+    termo, outro = rng.sample(termos, 2)
+    partes = [rng.choice(SUJEITOS), rng.choice(VERBOS), f"o {termo}" if rng.random() < 0.5 else f"a {termo}",
+              rng.choice(CONECTORES), rng.choice(COMPLEMENTOS), f"sobre {outro}"]
+    if rng.random() < 0.3:
+        partes.append(f"nº {rng.randint(1000, 99999)}/{rng.randint(2015, 2025)}")
+    return " ".join(partes) + "."
+
+
+def gerar_corpus(documentos, paragrafos, frases_por_paragrafo, semente):
+    """Lista de (nome, texto, frases) determinística para a semente"""
+    rng = random.Random(semente)
+    corpus = []
+    for i in range(documentos):
+        tema = rng.choice(list(TEMAS))
+        frases = []
+        blocos = []
+        for _ in range(paragrafos):
+            bloco = [frase(rng, TEMAS[tema]) for _ in range(frases_por_paragrafo)]
+            frases.extend(bloco)
+            blocos.append(" ".join(bloco))
+        corpus.append((f"{tema}_{i:05d}.txt", "\n\n".join(blocos), frases))
+    return corpus
+
+
+def gerar_consultas(corpus, quantidade, semente):
+    """Consultas parecidas com trechos do corpus: uma frase sem o início ou o fim"""
+    rng = random.Random(semente + 1)
+    consultas = []
+    for _ in range(quantidade):
+        palavras = rng.choice(rng.choice(corpus)[2]).rstrip(".").split()
+        inicio = rng.randint(0, 2)
+        consultas.append(" ".join(palavras[inicio:inicio + rng.randint(5, len(palavras))]))
+    return consultas
+
+
+def percentis(amostras):
+    valores = np.asarray(amostras) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(valores, 50)),
+        "p95_ms": float(np.percentile(valores, 95)),
+        "p99_ms": float(np.percentile(valores, 99)),
+        "media_ms": float(valores.mean()),
+    }
+
+
+def recall(encontrados, exatos):
+    return float(np.mean([len(set(e) & set(x)) / len(x) for e, x in zip(encontrados, exatos) if len(x)]))
+
+
+def versao_git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def preparar_ambiente(args, diretorio):
+    os.environ.update({
+        "DATA_DIR": diretorio,
+        "STORAGE_BACKEND": "sqlite",
+        "SNAPSHOT_INTERVAL": "0",
+        "INDEX_TYPE": args.index_type,
+        # Sem caches: cada consulta e cada chunk passa pelo modelo e pelo índice
+        "QUERY_CACHE_SIZE": "0",
+        "QUERY_EMBEDDING_CACHE_SIZE": "0",
+        "EMBEDDING_CACHE_MAX_ITEMS": "0",
+    })
+    if args.train_min:
+        os.environ["INDEX_TRAIN_MIN"] = str(args.train_min)
+    sys.path.insert(0, RAIZ)
+
+
+def aguardar(condicao, timeout, intervalo=0.1):
+    limite = time.perf_counter() + timeout
+    while time.perf_counter() < limite:
+        if condicao():
+            return True
+        time.sleep(intervalo)
+    return False
+
+
+def medir_ingestao(aplicacao, client, corpus, arquivos_por_upload, timeout):
+    jobs = []
+    inicio = time.perf_counter()
+    for i in range(0, len(corpus), arquivos_por_upload):
+        lote = corpus[i:i + arquivos_por_upload]
+        while True:
+            resposta = client.post("/api/upload_batch", content_type="multipart/form-data", data={
+                "files": [(io.BytesIO(texto.encode("utf-8")), nome) for nome, texto, _ in lote]})
+            if resposta.status_code != 503:
+                break
+            time.sleep(0.05)  # fila cheia: espera uma vaga como um cliente faria
+        jobs.append(resposta.get_json()["job_id"])
+
+    def concluidos():
+        return all(client.get(f"/api/jobs/{job_id}").get_json()["status"] not in ("pendente", "processando")
+                   for job_id in jobs)
+
+    if not aguardar(concluidos, timeout):
+        raise RuntimeError("Ingestão não terminou dentro do timeout")
+    duracao = time.perf_counter() - inicio
+    erros = sum(len(client.get(f"/api/jobs/{job_id}").get_json().get("errors") or []) for job_id in jobs)
+    chunks = colecao_padrao(aplicacao).engine.ntotal
+    return {
+        "documentos": len(corpus),
+        "chunks": chunks,
+        "erros": erros,
+        "segundos": duracao,
+        "documentos_por_s": len(corpus) / duracao,
+        "embeddings_por_s": chunks / duracao,
+    }
+
+
+def medir_embeddings(aplicacao, textos):
+    inicio = time.perf_counter()
+    aplicacao.embeddings.encode(textos, usar_cache=False)
+    duracao = time.perf_counter() - inicio
+    return {"textos": len(textos), "segundos": duracao, "embeddings_por_s": len(textos) / duracao}
+
+
+def colecao_padrao(aplicacao):
+    """Coleção em que o benchmark ingere (a padrão, que fica em memória sem orçamento)"""
+    return aplicacao.colecoes.residentes[aplicacao.config.DEFAULT_COLLECTION]
+
+
+def carregar_vetores(aplicacao):
+    """Ids, vetores float32 originais (SQLite) e o mapa (documento, chunk) -> id"""
+    colecao = colecao_padrao(aplicacao)
+    colecao.store.flush()
+    ids, vetores = [], []
+    for pagina_ids, pagina_vetores, _ in colecao.store.carregar_chunks():
+        ids.append(pagina_ids)
+        vetores.append(pagina_vetores)
+    ids = np.concatenate(ids)
+    vetores = np.ascontiguousarray(np.concatenate(vetores))
+    por_chunk = {(c["documento_id"], c["chunk_id"]): vetor_id for vetor_id, c in colecao.engine.itens_chunks()}
+    return ids, vetores, por_chunk
+
+
+def medir_busca_api(client, consultas, k, repeticoes, por_chunk):
+    latencias = []
+    encontrados = []
+    for repeticao in range(repeticoes):
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            resposta = client.get("/api/search", query_string={"query": consulta, "k": k})
+            latencias.append(time.perf_counter() - inicio)
+            if repeticao == 0:
+                encontrados.append([por_chunk.get((r["documento_id"], r["chunk_id"]))
+                                    for r in resposta.get_json()["results"]])
+    return latencias, encontrados
+
+
+def medir_indices(tipos, ids, vetores, consultas_vetores, exatos, k, args):
+    from src.index_factory import criar_index, parametros_busca
+
+    resultados = {}
+    for tipo in tipos:
+        try:
+            inicio = time.perf_counter()
+            index = criar_index(tipo, vetores.shape[1], nlist=args.nlist, pq_m=args.pq_m)
+            if not index.is_trained:
+                index.train(vetores)
+            treino = time.perf_counter() - inicio
+            index.add_with_ids(vetores, ids)
+            construcao = time.perf_counter() - inicio
+            params = parametros_busca(index, args.nprobe, args.ef_search)
+            latencias = []
+            encontrados = []
+            for vetor in consultas_vetores:
+                inicio = time.perf_counter()
+                _, linha = index.search(vetor.reshape(1, -1), k, params=params)
+                latencias.append(time.perf_counter() - inicio)
+                encontrados.append([int(v) for v in linha[0] if v >= 0])
+            resultados[tipo] = {
+                "treino_s": treino,
+                "construcao_s": construcao,
+                "vetores_por_s": len(ids) / construcao,
+                "recall_at_k": recall(encontrados, exatos),
+                **percentis(latencias),
+            }
+        except Exception as e:
+            resultados[tipo] = {"erro": str(e)}
+    return resultados
+
+
+def executar(args):
+    diretorio = tempfile.mkdtemp(prefix="benchmark_")
+    preparar_ambiente(args, diretorio)
+    import app as aplicacao
+
+    if not aguardar(lambda: aplicacao.prontidao["pronto"] or aplicacao.prontidao["erro"], args.timeout):
+        raise RuntimeError("Aplicação não ficou pronta")
+    if aplicacao.prontidao["erro"]:
+        raise RuntimeError(aplicacao.prontidao["erro"])
+    client = aplicacao.app.test_client()
+
+    corpus = gerar_corpus(args.docs, args.paragraphs, args.sentences, args.seed)
+    consultas = gerar_consultas(corpus, args.queries, args.seed)
+
+    ingestao = medir_ingestao(aplicacao, client, corpus, args.files_per_upload, args.timeout)
+    # Tipos treinados começam como flat e migram em segundo plano
+    engine = colecao_padrao(aplicacao).engine
+    migrou = aguardar(lambda: engine.tipo_atual == args.index_type, args.timeout, intervalo=0.5)
+    textos = [c["chunk_text"] for _, c in engine.itens_chunks()[:2000]]
+    embeddings = medir_embeddings(aplicacao, textos)
+
+    ids, vetores, por_chunk = carregar_vetores(aplicacao)
+    consultas_vetores = aplicacao.embeddings.encode(consultas, usar_cache=False)
+    # Busca exata: produto interno com todos os vetores (todos normalizados)
+    exatos = [ids[np.argsort(-(vetores @ q))[:args.k]].tolist() for q in consultas_vetores]
+
+    latencias, encontrados = medir_busca_api(client, consultas, args.k, args.repeat, por_chunk)
+    tipos = [t.strip() for t in args.build_types.split(",") if t.strip()]
+
+    resultado = {
+        "data": datetime.now(timezone.utc).isoformat(),
+        "commit": versao_git(),
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "modelo": aplicacao.config.MODEL_NAME,
+        },
+        "parametros": vars(args),
+        "ingestao": ingestao,
+        "embeddings": embeddings,
+        "busca_api": {
+            "index_type": engine.tipo_atual,
+            "migracao_concluida": migrou,
+            "consultas": len(latencias),
+            "recall_at_k": recall(encontrados, exatos),
+            **percentis(latencias),
+        },
+        "indices": medir_indices(tipos, ids, vetores, consultas_vetores, exatos, args.k, args) if tipos else {},
+    }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200, help="documentos no corpus")
+    parser.add_argument("--paragraphs", type=int, default=8, help="parágrafos por documento")
+    parser.add_argument("--sentences", type=int, default=5, help="frases por parágrafo")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3, help="repetições das consultas na medição de latência")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--files-per-upload", type=int, default=20)
+    parser.add_argument("--index-type", default=os.environ.get("INDEX_TYPE", "flat"),
+                        help="INDEX_TYPE da aplicação durante o benchmark")
+    parser.add_argument("--train-min", type=int, default=0,
+                        help="INDEX_TRAIN_MIN; para tipos treinados o benchmark espera a migração")
+    parser.add_argument("--build-types", default="flat,hnsw,ivf",
+                        help="tipos de índice construídos e medidos isoladamente (vazio desativa)")
+    parser.add_argument("--nlist", type=int, default=64, help="nlist dos índices construídos isoladamente")
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=1800.0)
+    parser.add_argument("--output", help="também grava o JSON neste arquivo")
+    args = parser.parse_args()
+
+    # As mensagens da aplicação vão para o stderr; o stdout fica só com o JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        resultado = executar(args)
+    saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(saida)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(saida + "\n")
+
+
+if __name__ == "__main__":
+    main()
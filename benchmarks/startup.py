@@ -0,0 +1,70 @@
+"""
+Benchmark de inicialização da aplicação
+
+Mede, em processos novos, o tempo de `import app` (o que bloqueia o /health)
+e o tempo até o /ready responder 200 (modelo carregado e índice restaurado).
+Sai com código 1 quando a mediana do import passa do orçamento, para ser
+usado como verificação no CI.
+
+Uso:
+    python benchmarks/startup.py --runs 5 --import-budget 2.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODIGO = """
+import json, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter() - t0
+client = app.app.test_client()
+status_health = client.get('/health').status_code
+t_ready = None
+while time.perf_counter() - t0 < {timeout}:
+    if client.get('/ready').status_code == 200:
+        t_ready = time.perf_counter() - t0
+        break
+    time.sleep(0.05)
+print(json.dumps({{"import": t_import, "health": status_health, "ready": t_ready}}))
+"""
+
+
+def medir(timeout):
+    saida = subprocess.run([sys.executable, "-c", CODIGO.format(timeout=timeout)],
+                           cwd=RAIZ, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=float(os.environ.get("STARTUP_IMPORT_BUDGET", 2.0)),
+                        help="orçamento em segundos para a mediana de `import app`")
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    medicoes = [medir(args.ready_timeout) for _ in range(args.runs)]
+    imports = sorted(m["import"] for m in medicoes)
+    prontos = sorted(m["ready"] for m in medicoes if m["ready"] is not None)
+    resultado = {
+        "runs": args.runs,
+        "import_median_s": statistics.median(imports),
+        "import_max_s": imports[-1],
+        "ready_median_s": statistics.median(prontos) if prontos else None,
+        "ready_failures": args.runs - len(prontos),
+        "health_ok": all(m["health"] == 200 for m in medicoes),
+        "import_budget_s": args.import_budget,
+    }
+    resultado["passed"] = resultado["import_median_s"] <= args.import_budget and resultado["health_ok"]
+    print(json.dumps(resultado, indent=2))
+    sys.exit(0 if resultado["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
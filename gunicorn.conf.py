@@ -0,0 +1,51 @@
+"""
+Configuração do gunicorn para produção
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers gthread: cada processo atende GUNICORN_THREADS requisições em
+paralelo (a busca no FAISS e a inferência do modelo liberam o GIL).
+
+Vários processos (WEB_CONCURRENCY) só são suportados com
+STORAGE_BACKEND=postgres, em que os vetores ficam no pgvector: a aplicação
+é carregada uma vez no master (preload_app) e os pesos do modelo são
+compartilhados copy-on-write pelos workers.
+
+Com o índice FAISS local (sqlite ou none) servir com vários processos não é
+suportado: cada worker teria o seu índice e uma ingestão feita em um deles
+não apareceria nos outros. Nesse modo roda um único worker com threads;
+para ir além de um processo o índice é dividido entre nós (INDEX_SHARDS).
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+# Uploads grandes são processados em segundo plano; a requisição só salva os arquivos
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+accesslog = "-"
+
+if workers > 1 and os.environ.get("STORAGE_BACKEND", "sqlite").lower() != "postgres":
+    # Limitação, não configuração: o índice FAISS local não é compartilhado entre processos
+    print(f"AVISO: WEB_CONCURRENCY={workers} não é suportado com o índice FAISS local "
+          f"(STORAGE_BACKEND=postgres para vários workers); iniciando 1 worker com {threads} threads.")
+    workers = 1
+
+preload_app = workers > 1
+if preload_app:
+    # Lido por src/config.py quando o master importar a aplicação
+    os.environ["SERVER_PRELOAD"] = "true"
+
+# Threads de inferência do torch por worker no modo preload: vários processos
+# com uma thread cada escalam melhor do que disputar os núcleos entre si
+threads_modelo = int(os.environ.get("TORCH_THREADS_PER_WORKER", 1))
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+
+        app.iniciar_worker(threads_modelo)
@@ -0,0 +1,3 @@
+"""
+Módulos de processamento, indexação e busca de documentos
+"""
@@ -0,0 +1,107 @@
+"""
+Cache persistente de embeddings endereçado por conteúdo
+
+A chave é o SHA-256 do nome do modelo junto do texto normalizado do chunk,
+então o mesmo trecho reenviado em qualquer documento reaproveita o vetor
+sem passar pelo modelo. Os vetores ficam em um SQLite (float32 em BLOB) com
+despejo LRU quando o número de entradas passa de `max_itens`.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+def normalizar_texto(texto):
+    """Forma NFC com espaços colapsados; diferenças só de espaçamento viram a mesma chave"""
+    return unicodedata.normalize("NFC", " ".join(texto.split()))
+
+
+def chave_chunk(texto, modelo):
+    return hashlib.sha256(f"{modelo}\0{normalizar_texto(texto)}".encode("utf-8")).hexdigest()
+
+
+def hash_arquivo(caminho, bloco=1024 * 1024):
+    """SHA-256 do conteúdo do arquivo, lido em blocos"""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """Mapa chave do chunk -> vetor float32, persistido em SQLite com LRU"""
+
+    def __init__(self, caminho, modelo, dim, max_itens=200_000):
+        self.modelo = modelo
+        self.dim = dim
+        self.max_itens = max_itens
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.conectar()
+
+    def conectar(self):
+        """Abre a conexão; chamado de novo em cada processo criado por fork (gunicorn)"""
+        self.conn = sqlite3.connect(self.caminho, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                chave TEXT PRIMARY KEY,
+                vetor BLOB NOT NULL,
+                acessado_em REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_acesso ON embedding_cache(acessado_em)")
+        self.conn.commit()
+        self.total = self.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_many(self, textos):
+        """Retorna {posição em textos: vetor} para os textos já em cache"""
+        chaves = [chave_chunk(t, self.modelo) for t in textos]
+        encontrados = {}
+        with self.lock:
+            # Consulta em blocos para respeitar o limite de parâmetros do SQLite
+            for inicio in range(0, len(chaves), 500):
+                bloco = list(set(chaves[inicio:inicio + 500]))
+                marcadores = ",".join("?" * len(bloco))
+                for chave, vetor in self.conn.execute(
+                        f"SELECT chave, vetor FROM embedding_cache WHERE chave IN ({marcadores})", bloco):
+                    encontrados[chave] = np.frombuffer(vetor, dtype=np.float32)
+            if encontrados:
+                agora = time.time()
+                self.conn.executemany("UPDATE embedding_cache SET acessado_em = ? WHERE chave = ?",
+                                      [(agora, chave) for chave in encontrados])
+                self.conn.commit()
+        return {i: encontrados[c] for i, c in enumerate(chaves) if c in encontrados}
+
+    def put_many(self, textos, vetores):
+        vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+        agora = time.time()
+        linhas = [(chave_chunk(t, self.modelo), vetores[i].tobytes(), agora) for i, t in enumerate(textos)]
+        with self.lock:
+            antes = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache (chave, vetor, acessado_em) VALUES (?, ?, ?)", linhas)
+            self.total += self.conn.total_changes - antes
+            self._despejar()
+            self.conn.commit()
+
+    def _despejar(self):
+        # Remove as entradas acessadas há mais tempo até voltar ao limite
+        excesso = self.total - self.max_itens
+        if excesso > 0:
+            self.conn.execute("""
+                DELETE FROM embedding_cache WHERE chave IN (
+                    SELECT chave FROM embedding_cache ORDER BY acessado_em LIMIT ?
+                )
+            """, (excesso,))
+            self.total -= excesso
@@ -0,0 +1,249 @@
+"""
+Coleções nomeadas com orçamento de memória
+
+Cada coleção tem o seu índice vetorial, banco, BM25, filtros de metadados,
+documentos e contadores (`Colecao`). O `GerenciadorColecoes` mantém em
+memória só as coleções usadas recentemente: quando a memória estimada das
+residentes passa do orçamento, as menos usadas (LRU) que não estão em uso
+gravam o snapshot e saem da memória. Uma coleção fora da memória volta na
+primeira requisição, restaurada do snapshot (ou do banco).
+
+`usar` fixa a coleção durante uma busca ou ingestão, e uma coleção fixada
+nunca é despejada. Requisições que chegam durante a carga ou o despejo de
+uma coleção esperam a operação terminar.
+"""
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+NOME_VALIDO = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+class ColecaoInexistente(Exception):
+    """A coleção pedida não existe (nem em memória nem em disco)"""
+
+
+def validar_nome(nome):
+    """Nomes viram diretórios: minúsculas, dígitos, _ e -, até 64 caracteres"""
+    if not nome or not NOME_VALIDO.match(nome):
+        raise ValueError("collection deve ter até 64 caracteres entre a-z, 0-9, _ e -, começando por letra ou dígito")
+    return nome
+
+
+class Colecao:
+    """Estado de uma coleção: índice, documentos, índices secundários e contadores"""
+
+    def __init__(self, nome, engine, store=None, lexical=None, filtros=None, diretorio_snapshots=None):
+        self.nome = nome
+        self.engine = engine
+        self.store = store
+        self.lexical = lexical
+        self.filtros = filtros
+        self.diretorio_snapshots = diretorio_snapshots
+        self.documentos = []
+        self.documentos_por_id = {}
+        self.documentos_por_hash = {}
+        self.versoes_por_nome = {}  # (nome, metadata) -> {id: documento}, para a substituição no re-upload
+        self.hashes_em_processamento = set()
+        # Posição crescente de cada documento na lista; é o cursor da paginação
+        self.proximo_seq = 0
+        self.estatisticas = {
+            "total_documentos": 0,
+            "total_embeddings": 0,
+            "espaco_utilizado": 0,
+            "ultimo_upload": None
+        }
+        # Documentos e contadores; o índice e o BM25 têm os seus próprios locks
+        self.lock = threading.Lock()
+        self.em_uso = 0
+        self.ultimo_acesso = time.monotonic()
+        self.versao_salva = engine.versao
+        self._memoria = (None, 0)  # (versão do índice, bytes) da última estimativa
+
+    def memoria_estimada(self):
+        """Bytes aproximados do índice, dos registros e do BM25; recalculado quando o índice muda"""
+        versao = self.engine.versao
+        if self._memoria[0] != versao:
+            total = self.engine.memoria_estimada()
+            if self.lexical is not None:
+                total += self.lexical.memoria_estimada()
+            with self.lock:
+                # documento com preview e metadata: ~1 KB cada
+                total += 1024 * len(self.documentos)
+            self._memoria = (versao, total)
+        return self._memoria[1]
+
+    def close(self):
+        """Libera o banco e as threads do índice (depois do snapshot)"""
+        if self.store is not None:
+            self.store.close()
+        fechar = getattr(self.engine, "close", None)
+        if fechar is not None:
+            fechar()
+
+
+class GerenciadorColecoes:
+    """
+    Coleções residentes sob um orçamento de memória.
+
+    `abrir(nome)` cria a Colecao e restaura o seu estado; `salvar(colecao)`
+    grava o snapshot. Coleções ficam em `<diretorio>/<nome>`; a coleção
+    `padrao` usa os caminhos de sempre e existe mesmo sem diretório.
+    """
+
+    def __init__(self, diretorio, abrir, salvar, orcamento_bytes=0, padrao="default"):
+        self.diretorio = diretorio
+        self.abrir = abrir
+        self.salvar = salvar
+        self.orcamento_bytes = orcamento_bytes
+        self.padrao = padrao
+        self.residentes = {}
+        self.ocupadas = set()  # nomes sendo carregados ou despejados
+        self.condicao = threading.Condition()
+        self.despejos = 0
+        self.cargas = 0
+
+    def caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def existe(self, nome):
+        return nome == self.padrao or nome in self.residentes or os.path.isdir(self.caminho(nome))
+
+    def nomes(self):
+        em_disco = os.listdir(self.diretorio) if os.path.isdir(self.diretorio) else []
+        return sorted({self.padrao, *self.residentes, *(n for n in em_disco if NOME_VALIDO.match(n))})
+
+    def lista_residentes(self):
+        with self.condicao:
+            return list(self.residentes.values())
+
+    @contextmanager
+    def usar(self, nome, criar=False):
+        """Fixa a coleção (carregando-a se preciso) enquanto o bloco roda"""
+        colecao = self._fixar(nome, criar)
+        try:
+            yield colecao
+        finally:
+            with self.condicao:
+                colecao.em_uso -= 1
+                colecao.ultimo_acesso = time.monotonic()
+                self.condicao.notify_all()
+
+    def _fixar(self, nome, criar):
+        with self.condicao:
+            while nome in self.ocupadas:
+                self.condicao.wait()
+            colecao = self.residentes.get(nome)
+            if colecao is not None:
+                colecao.em_uso += 1
+                colecao.ultimo_acesso = time.monotonic()
+                return colecao
+            if not criar and not self.existe(nome):
+                raise ColecaoInexistente(f"Coleção {nome} não encontrada")
+            self.ocupadas.add(nome)
+
+        # Carga fora do lock: as demais coleções seguem atendendo
+        try:
+            if nome != self.padrao:
+                os.makedirs(self.caminho(nome), exist_ok=True)
+            colecao = self.abrir(nome)
+        except BaseException:
+            with self.condicao:
+                self.ocupadas.discard(nome)
+                self.condicao.notify_all()
+            raise
+        with self.condicao:
+            colecao.em_uso += 1
+            self.residentes[nome] = colecao
+            self.ocupadas.discard(nome)
+            self.cargas += 1
+            self.condicao.notify_all()
+        self.aplicar_orcamento()
+        return colecao
+
+    def aplicar_orcamento(self):
+        """Despeja coleções ociosas, das menos usadas para as mais usadas, até caber no orçamento"""
+        if not self.orcamento_bytes:
+            return
+        while True:
+            with self.condicao:
+                residentes = list(self.residentes.values())
+            total = sum(colecao.memoria_estimada() for colecao in residentes)
+            if total <= self.orcamento_bytes:
+                return
+            with self.condicao:
+                ociosas = sorted((c for c in self.residentes.values() if not c.em_uso and c.nome not in self.ocupadas),
+                                 key=lambda c: c.ultimo_acesso)
+            # Só coleções em uso: o excesso é temporário e volta a ser avaliado no próximo uso
+            if not ociosas:
+                return
+            try:
+                despejada = self.despejar(ociosas[0].nome)
+            except Exception as e:
+                # A coleção continua residente; a carga ou o upload que disparou o despejo não falha por isso
+                print(f"Erro ao despejar a coleção {ociosas[0].nome}: {e}")
+                return
+            if not despejada:
+                return
+
+    def despejar(self, nome):
+        """Grava o snapshot da coleção e a retira da memória; False se estiver em uso"""
+        with self.condicao:
+            colecao = self.residentes.get(nome)
+            if colecao is None or colecao.em_uso or nome in self.ocupadas:
+                return False
+            self.ocupadas.add(nome)
+        try:
+            self._salvar(colecao)
+            colecao.close()
+            with self.condicao:
+                del self.residentes[nome]
+                self.despejos += 1
+            print(f"Coleção {nome} despejada da memória")
+            return True
+        finally:
+            with self.condicao:
+                self.ocupadas.discard(nome)
+                self.condicao.notify_all()
+
+    def _salvar(self, colecao):
+        versao = colecao.engine.versao
+        if versao != colecao.versao_salva:
+            self.salvar(colecao)
+            colecao.versao_salva = versao
+
+    def versao(self):
+        """Muda quando alguma coleção residente muda (para o SnapshotScheduler)"""
+        with self.condicao:
+            return tuple(sorted((nome, colecao.engine.versao) for nome, colecao in self.residentes.items()))
+
+    def salvar_alteradas(self):
+        """Snapshot das coleções residentes alteradas desde o último"""
+        for colecao in self.lista_residentes():
+            with self.condicao:
+                # Uma coleção sendo despejada grava o próprio snapshot
+                if colecao.nome in self.ocupadas or self.residentes.get(colecao.nome) is not colecao:
+                    continue
+                colecao.em_uso += 1
+            try:
+                self._salvar(colecao)
+            finally:
+                with self.condicao:
+                    colecao.em_uso -= 1
+                    self.condicao.notify_all()
+
+    def memoria_estimada(self):
+        return sum(colecao.memoria_estimada() for colecao in self.lista_residentes())
+
+    def resumo(self):
+        with self.condicao:
+            residentes = dict(self.residentes)
+        return [{
+            "nome": nome,
+            "residente": nome in residentes,
+            "em_uso": residentes[nome].em_uso if nome in residentes else 0,
+            "documentos": len(residentes[nome].documentos) if nome in residentes else None,
+            "memoria_estimada_bytes": residentes[nome].memoria_estimada() if nome in residentes else None,
+        } for nome in self.nomes()]
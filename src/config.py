@@ -0,0 +1,119 @@
+"""
+Configurações compartilhadas, sobrescritíveis por variáveis de ambiente
+"""
+import os
+
+# Modelo de embeddings
+MODEL_NAME = os.environ.get('MODEL_NAME', 'all-MiniLM-L6-v2')
+EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', 384))
+
+# Busca
+DEFAULT_K = int(os.environ.get('SEARCH_DEFAULT_K', 5))
+MAX_K = int(os.environ.get('SEARCH_MAX_K', 100))
+# Busca híbrida: profundidade de cada ranking na fusão e constante do RRF
+HYBRID_CANDIDATES = int(os.environ.get('SEARCH_HYBRID_CANDIDATES', 50))
+RRF_K = int(os.environ.get('SEARCH_RRF_K', 60))
+MAX_PREFILTER = int(os.environ.get('SEARCH_MAX_PREFILTER', 10_000))
+MAX_BATCH_QUERIES = int(os.environ.get('SEARCH_MAX_BATCH_QUERIES', 256))
+
+# Listagem de documentos
+DOCUMENTS_PAGE_SIZE = int(os.environ.get('DOCUMENTS_PAGE_SIZE', 100))
+DOCUMENTS_MAX_PAGE_SIZE = int(os.environ.get('DOCUMENTS_MAX_PAGE_SIZE', 1000))
+
+# Cache em memória de consultas (0 desativa); invalidado a cada ingestão
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', 1000))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 5000))
+QUERY_CACHE_TTL = float(os.environ.get('QUERY_CACHE_TTL', 300))  # segundos
+
+# Ingestão assíncrona
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 32))
+INGEST_RETRY_AFTER = int(os.environ.get('INGEST_RETRY_AFTER', 5))
+# Padrão do campo `replace` do upload: com true, reenviar um arquivo com o mesmo
+# nome (e metadata) apaga a versão anterior; desligado, quem envia pede replace=true
+REPLACE_ON_REUPLOAD = os.environ.get('REPLACE_ON_REUPLOAD', 'false').lower() == 'true'
+# Tamanho máximo do JSON de metadata enviado no upload
+MAX_METADATA_BYTES = int(os.environ.get('MAX_METADATA_BYTES', 4096))
+
+# Definido pelo gunicorn.conf.py quando a aplicação é carregada no master antes do fork
+SERVER_PRELOAD = os.environ.get('SERVER_PRELOAD', 'false').lower() == 'true'
+
+# Mensagens de erro de ingestão mantidas em /api/stats (as mais recentes)
+STATS_MAX_ERRORS = int(os.environ.get('STATS_MAX_ERRORS', 100))
+
+# Micro-batching de embeddings
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 32))
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get('EMBEDDING_MAX_BATCH_SIZE', 256))
+EMBEDDING_MAX_WAIT_MS = float(os.environ.get('EMBEDDING_MAX_WAIT_MS', 5))
+
+# Extração e chunking
+CHUNK_TOKENS = int(os.environ.get('CHUNK_TOKENS', 200))
+CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 40))
+INGEST_CHUNK_BATCH = int(os.environ.get('INGEST_CHUNK_BATCH', 64))
+PREVIEW_CHARS = int(os.environ.get('PREVIEW_CHARS', 500))
+OCR_DPI = int(os.environ.get('OCR_DPI', 200))
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', 0)) or None  # None = todos os núcleos
+OCR_LANGUAGES = tuple(os.environ.get('OCR_LANGUAGES', 'pt').split(','))
+# Páginas de PDF com menos caracteres extraíveis que isto vão para o OCR
+PDF_MIN_TEXT_CHARS = int(os.environ.get('PDF_MIN_TEXT_CHARS', 20))
+
+# Diretório dos arquivos de dados locais (SQLite, snapshots)
+DATA_DIR = os.environ.get('DATA_DIR', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cache de embeddings por conteúdo do chunk (0 desativa)
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join(DATA_DIR, 'embedding_cache.db'))
+EMBEDDING_CACHE_MAX_ITEMS = int(os.environ.get('EMBEDDING_CACHE_MAX_ITEMS', 200_000))
+
+# Snapshots do índice
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(DATA_DIR, 'snapshots'))
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 300))  # segundos; 0 desativa
+# Mapeia os códigos do índice salvo do arquivo em vez de lê-los para a RAM
+SNAPSHOT_MMAP = os.environ.get('SNAPSHOT_MMAP', 'true').lower() == 'true'
+SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', 2))
+
+# Coleções (um cliente ou tenant cada): índice, banco e snapshots próprios em
+# COLLECTIONS_DIR/<nome>; a coleção padrão usa DATABASE_PATH e SNAPSHOT_DIR
+DEFAULT_COLLECTION = os.environ.get('DEFAULT_COLLECTION', 'default')
+COLLECTIONS_DIR = os.environ.get('COLLECTIONS_DIR', os.path.join(DATA_DIR, 'colecoes'))
+# Memória estimada das coleções residentes; acima dela as ociosas menos usadas
+# gravam o snapshot e saem da memória até a próxima requisição (0 = sem limite)
+COLLECTIONS_MEMORY_BUDGET_MB = float(os.environ.get('COLLECTIONS_MEMORY_BUDGET_MB', 0))
+
+# Tipo do índice: flat, hnsw, ivf, ivfpq ou, para economizar memória, fp16, sq8 ou pq
+INDEX_TYPE = os.environ.get('INDEX_TYPE', 'flat').lower()
+INDEX_NLIST = int(os.environ.get('INDEX_NLIST', 1024))
+INDEX_PQ_M = int(os.environ.get('INDEX_PQ_M', 48))
+INDEX_HNSW_M = int(os.environ.get('INDEX_HNSW_M', 32))
+INDEX_EF_CONSTRUCTION = int(os.environ.get('INDEX_EF_CONSTRUCTION', 40))
+INDEX_NPROBE = int(os.environ.get('INDEX_NPROBE', 16))
+INDEX_EF_SEARCH = int(os.environ.get('INDEX_EF_SEARCH', 64))
+# Vetores necessários antes de treinar IVF/PQ/SQ8 (padrão: 39 por centroide)
+INDEX_TRAIN_MIN = int(os.environ.get('INDEX_TRAIN_MIN', 0)) or None
+# Compactação do HNSW e do IVF: tombstones acima de max(mínimo, fração do índice)
+INDEX_COMPACT_MIN = int(os.environ.get('INDEX_COMPACT_MIN', 1000))
+INDEX_COMPACT_RATIO = float(os.environ.get('INDEX_COMPACT_RATIO', 0.2))
+# Re-ranking exato nos índices quantizados: busca RERANK x k candidatos e os
+# reordena com os vetores float32 do SQLite; 0 desativa
+INDEX_RERANK = int(os.environ.get('INDEX_RERANK', 0))
+# Índice dividido em shards com busca em paralelo (1 = um único índice). O shard
+# de um documento vem do hash do id ou, com INDEX_SHARD_KEY, do valor dessa
+# chave no metadata do upload (p.ex. "tenant"), que mantém o tenant em um shard
+INDEX_SHARDS = int(os.environ.get('INDEX_SHARDS', 1))
+INDEX_SHARD_KEY = os.environ.get('INDEX_SHARD_KEY', '').strip() or None
+# Shards mantidos por este nó, p.ex. "0,2" (vazio = todos)
+INDEX_SHARDS_ASSIGNED = [int(s) for s in os.environ.get('INDEX_SHARDS_ASSIGNED', '').split(',') if s.strip()]
+# Threads da busca nos shards (0 = uma por shard, limitado ao número de CPUs)
+INDEX_SHARD_THREADS = int(os.environ.get('INDEX_SHARD_THREADS', 0))
+
+# Armazenamento persistente de documentos e embeddings: sqlite, postgres ou none
+# Com postgres a busca é feita pelo pgvector e as réplicas compartilham o mesmo banco
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite').lower()
+DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(DATA_DIR, 'documentos.db'))
+DB_WRITE_BATCH = int(os.environ.get('DB_WRITE_BATCH', 1000))
+
+# Postgres/pgvector (STORAGE_BACKEND=postgres)
+DATABASE_URL = os.environ.get('DATABASE_URL')
+PG_POOL_MIN = int(os.environ.get('PG_POOL_MIN', 1))
+PG_POOL_MAX = int(os.environ.get('PG_POOL_MAX', 10))
+PG_IVFFLAT_PROBES = int(os.environ.get('PG_IVFFLAT_PROBES', 10))
+PG_APPLY_MIGRATIONS = os.environ.get('PG_APPLY_MIGRATIONS', 'true').lower() == 'true'
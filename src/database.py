@@ -0,0 +1,232 @@
+"""
+Persistência local em SQLite
+
+A tabela `documentos` segue as colunas da migração do Supabase
+(supabase/migrations/001_documentos_table.sql): cada documento tem um
+registro principal (chunk_id = 0) e um registro por chunk (chunk_id >= 1)
+apontando para ele em `documento_principal_id`. O id de um chunk é o mesmo
+id do seu vetor no índice FAISS.
+
+Embeddings são gravados como BLOB float32 (sem serializar em JSON) e lidos
+de volta com `np.frombuffer`. As inserções são acumuladas e gravadas com
+`executemany` em poucas transações, com o banco em modo WAL.
+"""
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+COLUNAS = {
+    "id": "INTEGER PRIMARY KEY",
+    "nome": "TEXT NOT NULL",
+    "texto": "TEXT",
+    "embedding": "BLOB",
+    "data": "TEXT",
+    "tamanho": "INTEGER",
+    "tipo": "TEXT",
+    "chunk_id": "INTEGER DEFAULT 0",
+    "total_chunks": "INTEGER DEFAULT 1",
+    "chunk_text": "TEXT",
+    "chunk_embedding": "BLOB",
+    "metadata": "TEXT",
+    "documento_principal_id": "INTEGER REFERENCES documentos(id)",
+}
+
+INDICES = {
+    "idx_documentos_nome": "nome",
+    "idx_documentos_data": "data",
+    "idx_documentos_tipo": "tipo",
+    "idx_documentos_chunk_id": "chunk_id",
+    "idx_documentos_principal_id": "documento_principal_id",
+}
+
+INSERIR = (f"INSERT OR REPLACE INTO documentos ({', '.join(COLUNAS)}) "
+           f"VALUES ({', '.join('?' * len(COLUNAS))})")
+
+
+def para_blob(vetor):
+    return np.ascontiguousarray(vetor, dtype=np.float32).tobytes()
+
+
+class DocumentStore:
+    """Grava documentos, chunks e embeddings no SQLite em lotes"""
+
+    def __init__(self, caminho, dim, lote_escrita=1000):
+        self.caminho = caminho
+        self.dim = dim
+        self.lote_escrita = lote_escrita
+        self.lock = threading.Lock()
+        self.pendentes = []
+        self.conectar()
+        self._criar_schema()
+
+    def conectar(self):
+        """Abre as conexões; chamado de novo em cada processo criado por fork (gunicorn)"""
+        self.leitura = threading.local()  # uma conexão de leitura por thread (obter_vetores)
+        self.conn = sqlite3.connect(self.caminho, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self):
+        """Grava o que estiver pendente e fecha a conexão de escrita"""
+        with self.lock:
+            self._gravar_pendentes()
+            self.conn.close()
+
+    def _criar_schema(self):
+        colunas = ",\n    ".join(f"{nome} {tipo}" for nome, tipo in COLUNAS.items())
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS documentos (\n    {colunas}\n)")
+            # Bancos criados pela versão antiga só têm id, nome, texto, embedding e data
+            existentes = {linha[1] for linha in self.conn.execute("PRAGMA table_info(documentos)")}
+            for nome, tipo in COLUNAS.items():
+                if nome not in existentes:
+                    self.conn.execute(f"ALTER TABLE documentos ADD COLUMN {nome} {tipo.replace(' NOT NULL', '')}")
+            for indice, coluna in INDICES.items():
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {indice} ON documentos({coluna})")
+
+    def registrar_documento(self, registro_id, documento):
+        """Enfileira o registro principal (chunk_id = 0) de um documento"""
+        self._enfileirar([(
+            registro_id, documento["nome"], documento.get("texto"), None, documento["data"],
+            documento["tamanho"], documento["tipo"], 0, documento.get("total_chunks"), None, None,
+            json.dumps(metadados_documento(documento), ensure_ascii=False), None,
+        )])
+
+    def registrar_chunks(self, registro_id, documento, ids, textos, vetores, primeiro_chunk):
+        """Enfileira os registros dos chunks com os embeddings em BLOB"""
+        self._enfileirar([
+            (vetor_id, documento["nome"], None, None, documento["data"], None, documento["tipo"],
+             primeiro_chunk + i, None, texto, para_blob(vetores[i]), None, registro_id)
+            for i, (vetor_id, texto) in enumerate(zip(ids, textos))
+        ])
+
+    def finalizar_documento(self, registro_id, documento):
+        """Grava o que estiver pendente e completa total_chunks e a prévia do documento"""
+        with self.lock:
+            self._gravar_pendentes()
+            with self.conn:
+                self.conn.execute("UPDATE documentos SET total_chunks = ? WHERE documento_principal_id = ?",
+                                  (documento["total_chunks"], registro_id))
+                self.conn.execute("UPDATE documentos SET total_chunks = ?, texto = ?, metadata = ? WHERE id = ?",
+                                  (documento["total_chunks"], documento.get("texto"),
+                                   json.dumps(metadados_documento(documento), ensure_ascii=False), registro_id))
+
+    def remover_documento(self, registro_id):
+        with self.lock:
+            self._gravar_pendentes()
+            with self.conn:
+                self.conn.execute("DELETE FROM documentos WHERE id = ? OR documento_principal_id = ?",
+                                  (registro_id, registro_id))
+
+    def flush(self):
+        with self.lock:
+            self._gravar_pendentes()
+
+    def _enfileirar(self, linhas):
+        with self.lock:
+            self.pendentes.extend(linhas)
+            if len(self.pendentes) >= self.lote_escrita:
+                self._gravar_pendentes()
+
+    def _gravar_pendentes(self):
+        # Uma transação para todo o lote acumulado (chamar com o lock)
+        if not self.pendentes:
+            return
+        with self.conn:
+            self.conn.executemany(INSERIR, self.pendentes)
+        self.pendentes = []
+
+    def maior_id(self):
+        with self.lock:
+            self._gravar_pendentes()
+            return self.conn.execute("SELECT COALESCE(MAX(id), -1) FROM documentos").fetchone()[0]
+
+    def carregar_documentos(self):
+        """Registros principais completos, na ordem de inserção"""
+        with self.lock:
+            self._gravar_pendentes()
+            linhas = self.conn.execute("""
+                SELECT id, nome, texto, data, tamanho, tipo, total_chunks, metadata
+                FROM documentos WHERE chunk_id = 0 AND total_chunks IS NOT NULL ORDER BY id
+            """).fetchall()
+        documentos = []
+        for registro_id, nome, texto, data, tamanho, tipo, total_chunks, metadata in linhas:
+            documento = json.loads(metadata) if metadata else {}
+            documento.update({
+                "registro_id": registro_id, "nome": nome, "texto": texto, "data": data,
+                "tamanho": tamanho, "tipo": tipo, "total_chunks": total_chunks,
+            })
+            documentos.append(documento)
+        return documentos
+
+    def carregar_chunks(self, tamanho_pagina=50_000, shard=None, num_shards=1, principais=None):
+        """
+        Produz páginas (ids, vetores, registros) dos chunks de documentos completos;
+        com `shard`, só os chunks com id % num_shards == shard, e com
+        `principais`, só os dos documentos com esses registros principais.
+
+        Usa uma conexão própria de leitura (o WAL permite ler durante gravações)
+        e lê os BLOBs de cada página com um único np.frombuffer.
+        """
+        self.flush()
+        if principais is None:
+            lotes = [()]
+        else:
+            principais = sorted(principais)
+            lotes = [principais[inicio:inicio + 500] for inicio in range(0, len(principais), 500)]
+        conn = sqlite3.connect(self.caminho)
+        try:
+            uuids = {}  # metadata do principal -> id público do documento
+            for lote in lotes:
+                filtro = f" AND p.id IN ({', '.join('?' * len(lote))})" if lote else ""
+                cursor = conn.execute(f"""
+                    SELECT c.id, c.chunk_id, c.total_chunks, c.chunk_text, c.chunk_embedding, p.metadata
+                    FROM documentos c JOIN documentos p ON p.id = c.documento_principal_id
+                    WHERE c.chunk_id > 0 AND p.total_chunks IS NOT NULL
+                      AND (? IS NULL OR c.id % ? = ?){filtro} ORDER BY c.id
+                """, (shard, num_shards, shard, *lote))
+                while True:
+                    linhas = cursor.fetchmany(tamanho_pagina)
+                    if not linhas:
+                        break
+                    ids = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=len(linhas))
+                    vetores = np.frombuffer(b"".join(linha[4] for linha in linhas),
+                                            dtype=np.float32).reshape(-1, self.dim)
+                    registros = [{
+                        "documento_id": uuids.get(linha[5]) or uuids.setdefault(linha[5], json.loads(linha[5])["id"]),
+                        "chunk_id": linha[1],
+                        "total_chunks": linha[2],
+                        "chunk_text": linha[3],
+                    } for linha in linhas]
+                    yield ids, vetores, registros
+        finally:
+            conn.close()
+
+    def obter_vetores(self, ids):
+        """
+        Embeddings float32 originais dos chunks, como {id: vetor}.
+
+        Usado no re-ranking exato dos índices quantizados; lê pela chave
+        primária em uma conexão de leitura da thread, sem disputar o lock das
+        gravações. Ids ainda pendentes de gravação ficam de fora.
+        """
+        conn = getattr(self.leitura, "conn", None)
+        if conn is None:
+            conn = self.leitura.conn = sqlite3.connect(self.caminho)
+        ids = list(ids)
+        vetores = {}
+        for inicio in range(0, len(ids), 500):  # limite de parâmetros do SQLite
+            lote = ids[inicio:inicio + 500]
+            linhas = conn.execute(
+                f"SELECT id, chunk_embedding FROM documentos WHERE id IN ({', '.join('?' * len(lote))})"
+                " AND chunk_embedding IS NOT NULL", lote)
+            vetores.update((vetor_id, np.frombuffer(blob, dtype=np.float32)) for vetor_id, blob in linhas)
+        return vetores
+
+
+def metadados_documento(documento):
+    """Campos do documento sem coluna própria, guardados no JSON de metadata (SQLite e pgvector)"""
+    return {chave: valor for chave, valor in documento.items()
+            if chave in ("id", "hash", "paginas_ocr", "metadata")}
@@ -0,0 +1,177 @@
+"""
+Extração de texto em streaming e divisão em chunks
+
+Cada extrator é um gerador que produz o documento aos poucos (páginas,
+parágrafos ou linhas de planilha), e o chunker consome esse fluxo com uma
+janela deslizante de tokens. Assim o pico de memória depende do tamanho do
+chunk, não do tamanho do arquivo.
+"""
+import os
+import re
+from collections import deque
+
+EXTENSOES_IMAGEM = {"png", "jpg", "jpeg", "tif", "tiff", "bmp"}
+
+# Acumula linhas de TXT até este limite mesmo sem linha em branco
+MAX_CARACTERES_SEGMENTO = 64 * 1024
+
+_PECAS = re.compile(r"\S+\s*")
+
+
+def tipo_arquivo(nome):
+    """Extensão do arquivo em minúsculas, sem o ponto"""
+    return os.path.splitext(nome)[1].lower().lstrip(".")
+
+
+def extrair_txt(caminho):
+    """Produz parágrafos (blocos separados por linha em branco)"""
+    with open(caminho, "r", encoding="utf-8", errors="replace") as f:
+        buffer = []
+        tamanho = 0
+        for linha in f:
+            if linha.strip():
+                buffer.append(linha)
+                tamanho += len(linha)
+                if tamanho < MAX_CARACTERES_SEGMENTO:
+                    continue
+            if buffer:
+                yield "".join(buffer)
+                buffer = []
+                tamanho = 0
+        if buffer:
+            yield "".join(buffer)
+
+
+def extrair_docx(caminho):
+    """Produz os parágrafos e depois as linhas das tabelas do DOCX"""
+    from docx import Document
+
+    doc = Document(caminho)
+    for paragrafo in doc.paragraphs:
+        if paragrafo.text.strip():
+            yield paragrafo.text
+    for tabela in doc.tables:
+        for linha in tabela.rows:
+            celulas = [c.text.strip() for c in linha.cells if c.text.strip()]
+            if celulas:
+                yield " | ".join(celulas)
+
+
+def extrair_xlsx(caminho):
+    """Produz uma linha de texto por linha de planilha, sem carregar a pasta inteira"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield ws.title
+            for linha in ws.iter_rows(values_only=True):
+                valores = [str(v) for v in linha if v is not None and str(v).strip()]
+                if valores:
+                    yield " | ".join(valores)
+    finally:
+        wb.close()
+
+
+def extrair_pdf(caminho, ocr, dpi=None, min_caracteres=20, paginas_ocr=None):
+    """
+    Produz o texto de cada página, na ordem.
+
+    Páginas com camada de texto (ao menos `min_caracteres` extraíveis) são
+    lidas diretamente; só as demais são rasterizadas e enviadas ao pool de
+    OCR. Os números dessas páginas são acrescentados a `paginas_ocr`.
+    """
+    from pypdf import PdfReader
+
+    leitor = PdfReader(caminho)
+    janela = 2 * ocr.workers
+    pendentes = deque()  # texto pronto ou Future do OCR, na ordem das páginas
+    for numero, pagina in enumerate(leitor.pages, start=1):
+        try:
+            texto = pagina.extract_text() or ""
+        except Exception:
+            texto = ""
+        if len(texto.strip()) >= min_caracteres:
+            pendentes.append(texto)
+        else:
+            if paginas_ocr is not None:
+                paginas_ocr.append(numero)
+            pendentes.append(ocr.submit_pagina(caminho, numero, dpi))
+        while pendentes and (isinstance(pendentes[0], str) or len(pendentes) >= janela):
+            yield _resolver(pendentes.popleft())
+    while pendentes:
+        yield _resolver(pendentes.popleft())
+
+
+def _resolver(pagina):
+    return pagina if isinstance(pagina, str) else pagina.result()
+
+
+def extrair_imagem(caminho, ocr):
+    yield ocr.imagem(caminho)
+
+
+def extrair(caminho, nome, ocr=None, dpi=None, min_caracteres=20, paginas_ocr=None):
+    """Escolhe o extrator pelo tipo do arquivo e retorna o gerador de segmentos"""
+    tipo = tipo_arquivo(nome)
+    if tipo in ("txt", "md", "csv"):
+        return extrair_txt(caminho)
+    if tipo == "docx":
+        return extrair_docx(caminho)
+    if tipo in ("xlsx", "xlsm"):
+        return extrair_xlsx(caminho)
+    if tipo == "pdf":
+        return extrair_pdf(caminho, ocr, dpi=dpi, min_caracteres=min_caracteres, paginas_ocr=paginas_ocr)
+    if tipo in EXTENSOES_IMAGEM:
+        return extrair_imagem(caminho, ocr)
+    raise ValueError(f"Tipo de arquivo não suportado: .{tipo}")
+
+
+def tokenizar_com(tokenizer):
+    """
+    Cria uma função que divide um texto em peças, uma por token do modelo.
+
+    As peças são fatias do texto original (usando os offsets do tokenizer),
+    então concatená-las reconstrói o texto sem os artefatos de subpalavra.
+    Sem tokenizer, cada palavra com o espaço seguinte é uma peça.
+    """
+    if tokenizer is None or not getattr(tokenizer, "is_fast", False):
+        return _PECAS.findall
+
+    def tokenizar(texto):
+        offsets = tokenizer(texto, add_special_tokens=False,
+                            return_offsets_mapping=True)["offset_mapping"]
+        inicios = [inicio for inicio, _ in offsets]
+        return [texto[a:b] for a, b in zip(inicios, inicios[1:] + [len(texto)])]
+
+    return tokenizar
+
+
+def chunk_tokens(segmentos, max_tokens=200, overlap=40, tokenizar=None):
+    """
+    Janela deslizante de `max_tokens` tokens com `overlap` tokens repetidos
+    entre chunks consecutivos. Consome e produz de forma preguiçosa.
+    """
+    if overlap >= max_tokens:
+        raise ValueError("overlap deve ser menor que max_tokens")
+    tokenizar = tokenizar or _PECAS.findall
+    passo = max_tokens - overlap
+
+    janela = []
+    novos = 0  # tokens na janela ainda não emitidos em nenhum chunk
+    for segmento in segmentos:
+        pecas = tokenizar(segmento)
+        if not pecas:
+            continue
+        # Preserva a separação entre segmentos (páginas, parágrafos)
+        pecas[-1] = pecas[-1].rstrip() + "\n"
+        janela.extend(pecas)
+        novos += len(pecas)
+        while len(janela) >= max_tokens:
+            yield "".join(janela[:max_tokens]).strip()
+            janela = janela[passo:]
+            novos = max(0, len(janela) - overlap)
+    if novos > 0 and janela:
+        texto = "".join(janela).strip()
+        if texto:
+            yield texto
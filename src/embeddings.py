@@ -0,0 +1,147 @@
+"""
+Serviço de embeddings com micro-batching dinâmico
+
+Pedidos concorrentes (chunks de vários documentos e consultas) são reunidos
+em micro-batches de até `max_batch_size` textos ou `max_wait_ms` de espera.
+Cada micro-batch é ordenado pela quantidade de tokens antes de chamar
+`encode`, para que textos de tamanhos parecidos dividam o mesmo batch e o
+padding seja mínimo.
+
+O modelo é carregado sob demanda (ou por `aquecer`, em segundo plano), para
+que importar a aplicação não pague o custo de carregar torch e os pesos.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class EmbeddingService:
+    """Agrupa pedidos de encode e devolve vetores float32 normalizados"""
+
+    def __init__(self, carregar_modelo, dim, batch_size=32, max_batch_size=256, max_wait_ms=5, cache=None):
+        self.carregar_modelo = carregar_modelo
+        self.dim = dim
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.pedidos = queue.Queue()
+        self.lock = threading.Lock()
+        self._lock_modelo = threading.Lock()
+        self._model = None
+        self._thread = None
+
+    @property
+    def model(self):
+        """Modelo carregado na primeira utilização"""
+        if self._model is None:
+            with self._lock_modelo:
+                if self._model is None:
+                    self._model = self.carregar_modelo()
+        return self._model
+
+    @property
+    def pronto(self):
+        return self._model is not None
+
+    def aquecer(self):
+        """Carrega o modelo e faz um encode descartável para inicializar os kernels"""
+        self.model.encode(["aquecimento"], convert_to_numpy=True, show_progress_bar=False)
+
+    def start(self):
+        """Inicia a thread do batcher (idempotente)"""
+        with self.lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def encode(self, textos, usar_cache=True):
+        """Retorna uma matriz (len(textos), dim) float32 com linhas de norma 1"""
+        if isinstance(textos, str):
+            textos = [textos]
+        if not textos:
+            return np.zeros((0, self.dimensao()), dtype=np.float32)
+        if self.cache is None or not usar_cache:
+            return self._encode_em_lote(list(textos))
+
+        # Só os textos ausentes do cache passam pelo modelo
+        encontrados = self.cache.get_many(textos)
+        faltantes = [i for i in range(len(textos)) if i not in encontrados]
+        vetores = np.empty((len(textos), self.dimensao()), dtype=np.float32)
+        for i, vetor in encontrados.items():
+            vetores[i] = vetor
+        if faltantes:
+            novos = self._encode_em_lote([textos[i] for i in faltantes])
+            vetores[faltantes] = novos
+            self.cache.put_many([textos[i] for i in faltantes], novos)
+        return vetores
+
+    def _encode_em_lote(self, textos):
+        self.start()
+        futuro = Future()
+        self.pedidos.put((textos, futuro))
+        return futuro.result()
+
+    def dimensao(self):
+        return self.dim
+
+    def _coletar(self):
+        """Bloqueia até o primeiro pedido e agrega outros até encher o batch ou expirar a espera"""
+        lote = [self.pedidos.get()]
+        total = len(lote[0][0])
+        limite = time.monotonic() + self.max_wait
+        while total < self.max_batch_size:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                pedido = self.pedidos.get(timeout=restante)
+            except queue.Empty:
+                break
+            lote.append(pedido)
+            total += len(pedido[0])
+        return lote
+
+    def _loop(self):
+        while True:
+            lote = self._coletar()
+            textos = [texto for pedido, _ in lote for texto in pedido]
+            try:
+                vetores = self._encode_ordenado(textos)
+            except Exception as e:
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+                continue
+
+            inicio = 0
+            for pedido, futuro in lote:
+                futuro.set_result(vetores[inicio:inicio + len(pedido)])
+                inicio += len(pedido)
+
+    def _tokens(self, textos):
+        """Tokens de cada texto, limitados ao max_seq_length (o que o padding iguala); sem tokenizer, caracteres"""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(t) for t in textos]
+        # Uma chamada para o lote todo: o tokenizer rápido (Rust) processa em paralelo
+        limite = getattr(self.model, "max_seq_length", None)
+        truncamento = {"truncation": True, "max_length": limite} if limite else {}
+        return [len(ids) for ids in tokenizer(textos, add_special_tokens=False, **truncamento)["input_ids"]]
+
+    def _encode_ordenado(self, textos):
+        # Ordena por tokens para reduzir padding e restaura a ordem original
+        ordem = np.argsort(self._tokens(textos), kind="stable")
+        vetores = np.empty((len(textos), self.dimensao()), dtype=np.float32)
+        for inicio in range(0, len(ordem), self.batch_size):
+            idx = ordem[inicio:inicio + self.batch_size]
+            vetores[idx] = self.model.encode(
+                [textos[i] for i in idx],
+                batch_size=len(idx),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        return vetores
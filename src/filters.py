@@ -0,0 +1,213 @@
+"""
+Filtros de metadados para a busca
+
+`MetadataIndex` mantém índices secundários em memória, por documento:
+tipo, nome, chaves do metadata enviado no upload (por exemplo `tenant`) e
+data. Um filtro é resolvido para o conjunto de ids de chunks permitidos e
+vira um IDSelector, aplicado dentro da busca ANN pelos SearchParameters
+(sem buscar a mais e filtrar depois). As datas ficam ordenadas e um
+intervalo é resolvido por bisect.
+
+Seleções resolvidas ficam em cache. Ingerir ou remover um documento
+descarta só as seleções dos filtros que ele atende; as demais continuam
+valendo.
+"""
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time as hora
+
+import faiss
+import numpy as np
+
+from src.query_cache import QueryCache
+
+FORMATO_DATA = "%d/%m/%Y %H:%M"
+
+
+def valor_indexado(valor):
+    """Representação em texto usada nas chaves do índice (filtros chegam como texto)"""
+    return valor if isinstance(valor, str) else json.dumps(valor)
+
+
+def ler_data(texto, fim=False):
+    """Data ISO (AAAA-MM-DD ou com horário); sem horário, `fim` usa o fim do dia"""
+    data = datetime.fromisoformat(texto)
+    if fim and len(texto) <= 10:
+        data = datetime.combine(data.date(), hora.max)
+    return data
+
+
+def ler_filtros(tipo=None, nome=None, data_inicio=None, data_fim=None, metadata=None):
+    """
+    Valida e normaliza os filtros; retorna None sem filtros ou uma tupla
+    canônica (usada também como chave de cache). Levanta ValueError.
+    """
+    tipos = tipo.split(",") if isinstance(tipo, str) else tipo
+    metadata = metadata or {}
+    if not isinstance(metadata, dict):
+        raise ValueError("metadata deve ser um objeto")
+    filtros = (
+        tuple(sorted(t.strip().lower() for t in tipos if t.strip())) if tipos else None,
+        nome or None,
+        ler_data(data_inicio) if data_inicio else None,
+        ler_data(data_fim, fim=True) if data_fim else None,
+        tuple(sorted((str(chave), valor_indexado(valor)) for chave, valor in metadata.items())),
+    )
+    return filtros if any(filtros) else None
+
+
+def atende(filtros, chaves, data):
+    """Se um documento com essas chaves (de `MetadataIndex._chaves`) e data entra na seleção do filtro"""
+    tipos, nome, inicio, fim, metadata = filtros
+    if tipos and not any(("tipo", tipo) in chaves for tipo in tipos):
+        return False
+    if nome and ("nome", nome) not in chaves:
+        return False
+    if any((("metadata", chave), valor) not in chaves for chave, valor in metadata):
+        return False
+    if inicio or fim:
+        return data is not None and (not inicio or data >= inicio) and (not fim or data <= fim)
+    return True
+
+
+def seletor_ids(ids):
+    """
+    IDSelector dos ids: bitmap (um bit por id até o maior) quando o conjunto
+    é denso, IDSelectorBatch (tabela hash) quando o bitmap seria grande demais
+    """
+    maior = int(ids.max())
+    if maior < 64 * len(ids):
+        mascara = np.zeros(maior + 1, dtype=bool)
+        mascara[ids] = True
+        bitmap = np.packbits(mascara, bitorder="little")
+        seletor = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        seletor.referenciado = bitmap  # o seletor só guarda o ponteiro
+        return seletor
+    return faiss.IDSelectorBatch(ids)
+
+
+class Selecao:
+    """Ids de chunks permitidos por um filtro, com o seletor FAISS pré-construído"""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.seletor = seletor_ids(ids) if len(ids) else None
+        self._conjunto = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def conjunto(self):
+        # Usado pela busca lexical; construído só quando necessário
+        if self._conjunto is None:
+            self._conjunto = frozenset(self.ids.tolist())
+        return self._conjunto
+
+
+class MetadataIndex:
+    """Índices secundários documento -> chunks para resolver filtros"""
+
+    def __init__(self, cache_itens=256):
+        self.chunks_por_documento = {}  # id do documento -> np.ndarray int64 de ids de chunks
+        self.por_campo = {}  # (campo, valor) -> set de ids de documentos
+        self.datas = {}  # id do documento -> datetime
+        # Datas em ordem crescente e, na mesma posição, o documento de cada uma
+        self.datas_ordenadas = []
+        self.documentos_por_data = []
+        self.versao = 0  # seleções calculadas antes de uma alteração não entram no cache
+        self.lock = threading.Lock()
+        self.cache = QueryCache(cache_itens, ttl=float("inf"))
+
+    def add(self, documento, ids):
+        chaves = self._chaves(documento)
+        data = datetime.strptime(documento["data"], FORMATO_DATA) if documento.get("data") else None
+        with self.lock:
+            self._remover_data(documento["id"])
+            self.chunks_por_documento[documento["id"]] = np.asarray(ids, dtype=np.int64)
+            for chave in chaves:
+                self.por_campo.setdefault(chave, set()).add(documento["id"])
+            if data is not None:
+                self.datas[documento["id"]] = data
+                posicao = bisect_right(self.datas_ordenadas, data)
+                self.datas_ordenadas.insert(posicao, data)
+                self.documentos_por_data.insert(posicao, documento["id"])
+            self._invalidar(chaves, data)
+
+    def ids_chunks(self, documento_id):
+        with self.lock:
+            ids = self.chunks_por_documento.get(documento_id)
+        return ids.tolist() if ids is not None else []
+
+    def remove(self, documento):
+        chaves = self._chaves(documento)
+        with self.lock:
+            if self.chunks_por_documento.pop(documento["id"], None) is None:
+                return
+            data = self._remover_data(documento["id"])
+            for chave in chaves:
+                documentos = self.por_campo.get(chave)
+                if documentos is not None:
+                    documentos.discard(documento["id"])
+                    if not documentos:
+                        del self.por_campo[chave]
+            self._invalidar(chaves, data)
+
+    def _remover_data(self, documento_id):
+        # Tira o documento da lista ordenada de datas; retorna a data (chamar com o lock)
+        data = self.datas.pop(documento_id, None)
+        if data is not None:
+            posicao = bisect_left(self.datas_ordenadas, data)
+            while self.documentos_por_data[posicao] != documento_id:
+                posicao += 1
+            del self.datas_ordenadas[posicao]
+            del self.documentos_por_data[posicao]
+        return data
+
+    def _invalidar(self, chaves, data):
+        # Só mudam as seleções dos filtros que o documento atende (chamar com o lock)
+        chaves = set(chaves)
+        self.versao += 1
+        self.cache.descartar(lambda filtros: atende(filtros, chaves, data))
+
+    @staticmethod
+    def _chaves(documento):
+        chaves = [("tipo", documento.get("tipo")), ("nome", documento.get("nome"))]
+        chaves.extend((("metadata", chave), valor_indexado(valor))
+                      for chave, valor in (documento.get("metadata") or {}).items())
+        return chaves
+
+    def resolver(self, filtros):
+        """Selecao dos chunks que atendem a todos os filtros (tupla de `ler_filtros`)"""
+        selecao = self.cache.get(filtros)
+        if selecao is not None:
+            return selecao
+
+        tipos, nome, inicio, fim, metadata = filtros
+        with self.lock:
+            versao = self.versao
+            conjuntos = []
+            if tipos:
+                conjuntos.append(set().union(*(self.por_campo.get(("tipo", t), ()) for t in tipos)))
+            if nome:
+                conjuntos.append(self.por_campo.get(("nome", nome), set()))
+            for chave, valor in metadata:
+                conjuntos.append(self.por_campo.get((("metadata", chave), valor), set()))
+            if inicio or fim:
+                primeiro = bisect_left(self.datas_ordenadas, inicio) if inicio else 0
+                ultimo = bisect_right(self.datas_ordenadas, fim) if fim else len(self.datas_ordenadas)
+                conjuntos.append(self.documentos_por_data[primeiro:ultimo])
+            # Começa pelo menor conjunto para interseções baratas
+            conjuntos.sort(key=len)
+            documentos = set(conjuntos[0]) if conjuntos else set(self.chunks_por_documento)
+            for conjunto in conjuntos[1:]:
+                documentos.intersection_update(conjunto)
+            partes = [self.chunks_por_documento[d] for d in documentos if d in self.chunks_por_documento]
+
+        selecao = Selecao(np.concatenate(partes) if partes else np.zeros(0, dtype=np.int64))
+        with self.lock:
+            # Um documento alterado durante o cálculo pode ter mudado esta seleção
+            if self.versao == versao:
+                self.cache.put(filtros, selecao)
+        return selecao
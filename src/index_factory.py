@@ -0,0 +1,116 @@
+"""
+Fábrica de índices FAISS configuráveis
+
+Todos os índices usam produto interno (vetores normalizados = cosseno) e
+ficam dentro de um `IndexIDMap2`, então os ids dos chunks são atribuídos
+pela aplicação e não dependem da posição no índice.
+
+Para reduzir memória há codificações quantizadas sem IVF: fp16 (2 bytes
+por dimensão), sq8 (`IndexScalarQuantizer` de 8 bits, 1 byte por dimensão)
+e pq (`IndexPQ`, `pq_m` bytes por vetor). Com 384 dimensões isso dá 768,
+384 e 48 bytes por chunk, contra 1536 em float32.
+"""
+import faiss
+
+TIPOS = ("flat", "hnsw", "ivf", "ivfpq", "fp16", "sq8", "pq")
+QUANTIZADOS = ("fp16", "sq8", "pq", "ivfpq")
+
+
+def descricao(tipo, nlist=1024, pq_m=48, hnsw_m=32):
+    """String do `faiss.index_factory` para o tipo configurado"""
+    if tipo == "flat":
+        return "Flat"
+    if tipo == "hnsw":
+        return f"HNSW{hnsw_m},Flat"
+    if tipo == "ivf":
+        return f"IVF{nlist},Flat"
+    if tipo == "ivfpq":
+        return f"IVF{nlist},PQ{pq_m}"
+    if tipo == "fp16":
+        return "SQfp16"
+    if tipo == "sq8":
+        return "SQ8"
+    if tipo == "pq":
+        return f"PQ{pq_m}"
+    raise ValueError(f"Tipo de índice desconhecido: {tipo} (use {', '.join(TIPOS)})")
+
+
+def criar_index(tipo, dim, nlist=1024, pq_m=48, hnsw_m=32, ef_construction=40):
+    index = faiss.index_factory(dim, "IDMap2," + descricao(tipo, nlist, pq_m, hnsw_m),
+                                faiss.METRIC_INNER_PRODUCT)
+    if tipo == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = ef_construction
+    return index
+
+
+def precisa_treino(tipo):
+    return tipo in ("ivf", "ivfpq", "sq8", "pq")
+
+
+def minimo_treino(tipo, nlist=1024):
+    """Vetores necessários para um treino razoável (regra prática do FAISS: ~39 por centroide)"""
+    if tipo in ("ivf", "ivfpq"):
+        return 39 * nlist
+    if tipo == "pq":
+        return 39 * 256  # 256 centroides por subquantizador de 8 bits
+    if tipo == "sq8":
+        return 1000  # só mínimo e máximo por dimensão
+    return 0
+
+
+def bytes_por_vetor(tipo, dim, pq_m=48, hnsw_m=32):
+    """Memória aproximada de um vetor no índice, incluindo o id no IDMap2 (id_map e rev_map)"""
+    codigo = {"fp16": 2 * dim, "sq8": dim, "pq": pq_m, "ivfpq": pq_m + 8}.get(tipo, 4 * dim)
+    if tipo == "ivf":
+        codigo += 8  # id na lista invertida
+    if tipo == "hnsw":
+        codigo += 2 * hnsw_m * 4  # vizinhos do nível 0
+    return codigo + 48
+
+
+def suporta_remocao(index):
+    """
+    Se `remove_ids` do IDMap2 é seguro. O IDMap2 supõe que o índice interno
+    renumera as posições como o flat (fp16, sq8 e pq também); o IVF mantém os
+    rótulos antigos nas listas invertidas e desalinharia o id_map, e o HNSW
+    não remove vetores.
+    """
+    return tipo_do_index(index) not in ("hnsw", "ivf", "ivfpq")
+
+
+def tipo_do_index(index):
+    """Identifica o tipo de um índice (por exemplo, carregado de um snapshot)"""
+    interno = faiss.downcast_index(index.index if hasattr(index, "id_map") else index)
+    if isinstance(interno, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(interno, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(interno, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(interno, faiss.IndexPQ):
+        return "pq"
+    if isinstance(interno, faiss.IndexScalarQuantizer):
+        return "fp16" if interno.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
+
+
+def parametros_busca(index, nprobe=None, ef_search=None, seletor=None):
+    """
+    SearchParameters por consulta para IVF (nprobe) e HNSW (efSearch); None
+    para flat sem filtro. `seletor` (faiss.IDSelector) restringe a busca a um
+    subconjunto de ids.
+    """
+    tipo = tipo_do_index(index)
+    if tipo in ("ivf", "ivfpq") and (nprobe or seletor):
+        params = faiss.SearchParametersIVF(sel=seletor) if seletor else faiss.SearchParametersIVF()
+        if nprobe:
+            params.nprobe = nprobe
+        return params
+    if tipo == "hnsw" and (ef_search or seletor):
+        params = faiss.SearchParametersHNSW(sel=seletor) if seletor else faiss.SearchParametersHNSW()
+        if ef_search:
+            params.efSearch = ef_search
+        return params
+    if seletor:
+        return faiss.SearchParameters(sel=seletor)
+    return None
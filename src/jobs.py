@@ -0,0 +1,102 @@
+"""
+Fila de jobs de ingestão processada por um pool limitado de threads
+"""
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+
+class FilaCheia(Exception):
+    """A fila de processamento atingiu a capacidade máxima"""
+
+
+class JobQueue:
+    """Fila limitada de jobs; cada job é processado por uma thread do pool"""
+
+    def __init__(self, processar, workers=2, max_fila=32, max_historico=1000, ao_mudar=None):
+        self.processar = processar
+        self.ao_mudar = ao_mudar
+        self.workers = workers
+        self.max_historico = max_historico
+        self.fila = queue.Queue(maxsize=max_fila)
+        self.jobs = OrderedDict()
+        self.ativos = 0
+        self.lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Inicia as threads do pool (idempotente)"""
+        with self.lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._loop, name=f"ingestao-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, payload):
+        """Enfileira um job sem bloquear; lança FilaCheia se não houver espaço"""
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": "pendente",
+            "criado_em": datetime.now().isoformat(),
+            "iniciado_em": None,
+            "concluido_em": None,
+        }
+        with self.lock:
+            try:
+                self.fila.put_nowait((job, payload))
+            except queue.Full:
+                raise FilaCheia("Fila de processamento cheia")
+            self.jobs[job["id"]] = job
+            self._podar_historico()
+        self._notificar()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pendentes(self):
+        """Ids dos jobs ainda aguardando uma thread livre"""
+        with self.lock:
+            return [j["id"] for j in self.jobs.values() if j["status"] == "pendente"]
+
+    def _notificar(self):
+        if self.ao_mudar:
+            self.ao_mudar(self)
+
+    def _podar_historico(self):
+        # Remove os jobs finalizados mais antigos além do limite do histórico
+        excesso = len(self.jobs) - self.max_historico
+        for job_id in list(self.jobs):
+            if excesso <= 0:
+                break
+            if self.jobs[job_id]["status"] not in ("pendente", "processando"):
+                del self.jobs[job_id]
+                excesso -= 1
+
+    def _loop(self):
+        while True:
+            job, payload = self.fila.get()
+            with self.lock:
+                self.ativos += 1
+                job["status"] = "processando"
+                job["iniciado_em"] = datetime.now().isoformat()
+            self._notificar()
+            try:
+                resultado = self.processar(job, payload) or {}
+                status = resultado.pop("status", "concluido")
+            except Exception as e:
+                resultado = {"erro": str(e)}
+                status = "erro"
+            with self.lock:
+                self.ativos -= 1
+                job.update(resultado)
+                job["status"] = status
+                job["concluido_em"] = datetime.now().isoformat()
+            self.fila.task_done()
+            self._notificar()
@@ -0,0 +1,119 @@
+"""
+Índice invertido BM25 sobre os mesmos chunks do índice vetorial
+
+Complementa a busca semântica em termos exatos (números de contrato, CNPJs,
+nomes próprios), que o MiniLM não distingue bem. Os termos são normalizados
+sem acento e em minúsculas; números com pontuação (CNPJ, CPF, processos)
+também são indexados só com os dígitos, então "12.345.678/0001-90" e
+"12345678000190" se encontram. O índice é atualizado a cada lote ingerido.
+"""
+import heapq
+import math
+import re
+import sys
+import unicodedata
+from collections import Counter, defaultdict
+
+from src.rwlock import RWLock
+
+TERMO = re.compile(r"\w+")
+NUMERO_PONTUADO = re.compile(r"\d[\d./-]*\d")
+
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas
+para pra com sem sob sobre e ou que se nao mais mas como ao aos ja foi ser sao esta este
+isso isto essa esse seu sua seus suas ele ela eles elas ha tem entre ate quando muito
+""".split())
+
+
+def sem_acentos(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+
+def termos(texto):
+    """Termos indexáveis de um texto, na ordem em que aparecem"""
+    texto = sem_acentos(texto.lower())
+    resultado = [t for t in TERMO.findall(texto) if t not in STOPWORDS]
+    resultado.extend(re.sub(r"\D", "", n) for n in NUMERO_PONTUADO.findall(texto) if not n.isdigit())
+    return resultado
+
+
+def rrf(rankings, k, constante=60):
+    """Reciprocal rank fusion: soma 1 / (constante + posição) de cada ranking de ids"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for posicao, vetor_id in enumerate(ranking, start=1):
+            scores[vetor_id] += 1.0 / (constante + posicao)
+    return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class LexicalIndex:
+    """BM25 (Okapi) com listas invertidas em memória: termo -> {id do chunk: frequência}"""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.tamanhos = {}  # id do chunk -> quantidade de termos
+        self.termos_por_chunk = {}  # id do chunk -> termos distintos, para remover só as suas postings
+        self.total_termos = 0
+        self.lock = RWLock()  # buscas na leitura, atualizações na escrita
+
+    def __len__(self):
+        return len(self.tamanhos)
+
+    def add(self, ids, textos):
+        """Indexa chunks com os mesmos ids do índice vetorial"""
+        contagens = [(vetor_id, Counter(termos(texto))) for vetor_id, texto in zip(ids, textos)]
+        with self.lock:
+            self._remover({vetor_id for vetor_id, _ in contagens if vetor_id in self.tamanhos})
+            for vetor_id, contagem in contagens:
+                # Strings internadas: a tupla do chunk compartilha as chaves das postings
+                distintos = tuple(sys.intern(termo) for termo in contagem)
+                for termo, frequencia in zip(distintos, contagem.values()):
+                    self.postings[termo][vetor_id] = frequencia
+                self.termos_por_chunk[vetor_id] = distintos
+                tamanho = sum(contagem.values())
+                self.tamanhos[vetor_id] = tamanho
+                self.total_termos += tamanho
+
+    def remove(self, ids):
+        with self.lock:
+            self._remover({vetor_id for vetor_id in ids if vetor_id in self.tamanhos})
+
+    def _remover(self, ids):
+        # Só as postings dos termos de cada chunk (chamar com o lock)
+        for vetor_id in ids:
+            for termo in self.termos_por_chunk.pop(vetor_id):
+                lista = self.postings[termo]
+                del lista[vetor_id]
+                if not lista:
+                    del self.postings[termo]
+            self.total_termos -= self.tamanhos.pop(vetor_id)
+
+    def search(self, consulta, k, permitidos=None):
+        """Retorna até k pares (id do chunk, score BM25) em ordem decrescente; `permitidos` filtra os ids"""
+        termos_consulta = set(termos(consulta))
+        scores = defaultdict(float)
+        with self.lock.leitura():
+            total = len(self.tamanhos)
+            if not total or not termos_consulta:
+                return []
+            media = self.total_termos / total
+            for termo in termos_consulta:
+                lista = self.postings.get(termo)
+                if not lista:
+                    continue
+                idf = math.log(1 + (total - len(lista) + 0.5) / (len(lista) + 0.5))
+                for vetor_id, frequencia in lista.items():
+                    if permitidos is not None and vetor_id not in permitidos:
+                        continue
+                    normalizacao = self.k1 * (1 - self.b + self.b * self.tamanhos[vetor_id] / media)
+                    scores[vetor_id] += idf * frequencia * (self.k1 + 1) / (frequencia + normalizacao)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def memoria_estimada(self):
+        """Bytes aproximados das listas invertidas e dos termos de cada chunk (objetos do CPython)"""
+        with self.lock.leitura():
+            pares = sum(len(lista) for lista in self.postings.values())
+            return 108 * pares + 150 * len(self.postings) + 200 * len(self.tamanhos)
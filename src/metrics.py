@@ -0,0 +1,190 @@
+"""
+Métricas no formato de exposição de texto do Prometheus
+
+Histogramas com buckets fixos, contadores e medidores (gauges) calculados
+na hora da coleta, sem dependências externas. `Registro.exportar` gera o
+corpo servido em /metrics. Todas as operações são seguras entre threads.
+"""
+import math
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _rotulos(nomes, valores, extra=None):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+    """Distribuição de durações (segundos) por combinação de rótulos"""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.series = {}  # valores dos rótulos -> [contagens por bucket, soma, total]
+        self.lock = threading.Lock()
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(str(rotulos[nome]) for nome in self.rotulos)
+        with self.lock:
+            serie = self.series.get(chave)
+            if serie is None:
+                serie = self.series[chave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def amostras(self):
+        with self.lock:
+            series = [(chave, list(contagens), soma, total) for chave, (contagens, soma, total) in self.series.items()]
+        for chave, contagens, soma, total in sorted(series):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                le = 'le="' + _numero(limite) + '"'
+                yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}"
+            yield f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}"
+            yield f"{self.nome}_count{_rotulos(self.rotulos, chave)} {total}"
+
+
+class Contador:
+    """Valor que só cresce (eventos ocorridos desde o início do processo)"""
+
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores = {}
+        self.lock = threading.Lock()
+
+    def inc(self, valor=1, **rotulos):
+        chave = tuple(str(rotulos[nome]) for nome in self.rotulos)
+        with self.lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def amostras(self):
+        with self.lock:
+            valores = sorted(self.valores.items())
+        for chave, valor in valores:
+            yield f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+
+
+class Medidor:
+    """
+    Valor lido na coleta: `funcao` retorna um número ou, com rótulos, um
+    dict {tupla de valores dos rótulos: número}. `tipo` pode ser "counter"
+    para contadores mantidos por outros componentes.
+    """
+
+    def __init__(self, nome, ajuda, funcao, rotulos=(), tipo="gauge"):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.rotulos = tuple(rotulos)
+        self.tipo = tipo
+
+    def amostras(self):
+        valor = self.funcao()
+        if not self.rotulos:
+            yield f"{self.nome} {_numero(valor)}"
+            return
+        for chave, numero in sorted(valor.items()):
+            yield f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(numero)}"
+
+
+class Registro:
+    """Conjunto de métricas exportadas juntas"""
+
+    def __init__(self, prefixo=""):
+        self.prefixo = prefixo
+        self.metricas = []
+
+    def _registrar(self, metrica):
+        metrica.nome = self.prefixo + metrica.nome
+        self.metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome, ajuda, funcao, rotulos=(), tipo="gauge"):
+        return self._registrar(Medidor(nome, ajuda, funcao, rotulos, tipo))
+
+    def exportar(self):
+        linhas = []
+        for metrica in self.metricas:
+            try:
+                amostras = list(metrica.amostras())
+            except Exception as e:
+                # Uma métrica com falha não derruba a coleta das demais
+                print(f"Erro ao coletar a métrica {metrica.nome}: {e}")
+                continue
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(amostras)
+        return "\n".join(linhas) + "\n"
+
+
+class Cronometro:
+    """Acumula o tempo gasto dentro de um gerador consumido por outra etapa"""
+
+    def __init__(self):
+        self.total = 0.0
+
+    def iterar(self, iteravel):
+        iterador = iter(iteravel)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                item = next(iterador)
+            except StopIteration:
+                self.total += time.perf_counter() - inicio
+                return
+            self.total += time.perf_counter() - inicio
+            yield item
+
+
+def memoria_rss():
+    """Memória residente atual do processo em bytes (pico, fora do Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
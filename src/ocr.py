@@ -0,0 +1,84 @@
+"""
+Pool de processos para OCR
+
+Cada processo do pool mantém o seu próprio `easyocr.Reader`, criado uma vez
+no inicializador. Páginas de PDF são distribuídas uma a uma (cada worker
+rasteriza só a página que recebeu, no DPI configurado).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+_reader = None
+
+
+def _inicializar(idiomas):
+    global _reader
+    import easyocr
+
+    _reader = easyocr.Reader(list(idiomas), gpu=False)
+
+
+def _reconhecer(imagem):
+    import numpy as np
+
+    return "\n".join(_reader.readtext(np.array(imagem.convert("RGB")), detail=0, paragraph=True))
+
+
+def _ocr_pagina_pdf(caminho, numero, dpi):
+    from pdf2image import convert_from_path
+
+    imagens = convert_from_path(caminho, dpi=dpi, first_page=numero, last_page=numero)
+    return "\n".join(_reconhecer(imagem) for imagem in imagens)
+
+
+def _ocr_imagem(caminho):
+    from PIL import Image
+
+    with Image.open(caminho) as imagem:
+        return _reconhecer(imagem)
+
+
+class OCRPool:
+    """Executa OCR em paralelo em processos separados (fora do GIL)"""
+
+    def __init__(self, workers=None, idiomas=("pt",), dpi=200, ao_concluir=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.idiomas = tuple(idiomas)
+        self.dpi = dpi
+        self.ao_concluir = ao_concluir  # recebe a duração (s) de cada OCR, incluindo a espera no pool
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        """Cria o pool sob demanda; spawn evita herdar threads e estado do torch"""
+        with self.lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_inicializar,
+                    initargs=(self.idiomas,),
+                )
+            return self._executor
+
+    def submit_pagina(self, caminho, numero, dpi=None):
+        """Agenda o OCR de uma página de PDF; retorna um Future com o texto"""
+        return self._medir(self.executor().submit(_ocr_pagina_pdf, caminho, numero, dpi or self.dpi))
+
+    def imagem(self, caminho):
+        return self._medir(self.executor().submit(_ocr_imagem, caminho)).result()
+
+    def _medir(self, futuro):
+        if self.ao_concluir is not None:
+            inicio = time.perf_counter()
+            futuro.add_done_callback(lambda _: self.ao_concluir(time.perf_counter() - inicio))
+        return futuro
+
+    def shutdown(self):
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
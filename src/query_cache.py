@@ -0,0 +1,97 @@
+"""
+Cache em memória das consultas de busca
+
+Dois usos na aplicação: texto da consulta -> embedding (evita o forward
+pass do modelo em consultas repetidas) e (consulta, k, filtros) ->
+resultados. As entradas têm TTL e o total é limitado por `max_itens`, com
+despejo LRU.
+
+Resultados dependem do conteúdo do índice: cada ingestão ou remoção chama
+`invalidar`, que incrementa a geração. Uma entrada só é servida se foi
+gravada na geração atual; quem calcula um resultado lê a geração antes de
+consultar o índice e a passa para `put`, então um resultado calculado
+durante uma ingestão nunca é servido depois dela.
+
+Com `particao` (chave -> partição, por exemplo a coleção), cada partição
+tem também a sua geração, e `invalidar(particao)` descarta só as entradas
+dela: a ingestão em uma coleção não esvazia o cache das outras.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """LRU com TTL e contador de geração; seguro entre threads"""
+
+    def __init__(self, max_itens=1000, ttl=300, particao=None):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.particao = particao
+        self.itens = OrderedDict()  # chave -> (expira_em, geração, valor)
+        self.geracao = 0
+        self.geracoes = {}  # partição -> geração própria
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, chave):
+        """Valor em cache ou None se ausente, expirado ou de uma geração anterior"""
+        if self.max_itens <= 0:
+            return None
+        with self.lock:
+            item = self.itens.get(chave)
+            if item is not None:
+                expira_em, geracao, valor = item
+                if geracao == self._geracao(chave) and expira_em > time.monotonic():
+                    self.itens.move_to_end(chave)
+                    self.hits += 1
+                    return valor
+                del self.itens[chave]
+            self.misses += 1
+            return None
+
+    def put(self, chave, valor, geracao=None):
+        if self.max_itens <= 0:
+            return
+        with self.lock:
+            atual = self._geracao(chave)
+            geracao = atual if geracao is None else geracao
+            if geracao != atual:
+                return  # calculado antes de uma invalidação
+            self.itens[chave] = (time.monotonic() + self.ttl, geracao, valor)
+            self.itens.move_to_end(chave)
+            while len(self.itens) > self.max_itens:
+                self.itens.popitem(last=False)
+
+    def geracao_de(self, chave):
+        """Geração a passar para `put`, lida antes de calcular o valor da chave"""
+        with self.lock:
+            return self._geracao(chave)
+
+    def _geracao(self, chave):
+        # Global e, com partições, a da partição da chave (chamar com o lock)
+        if self.particao is None:
+            return self.geracao
+        return self.geracao, self.geracoes.get(self.particao(chave), 0)
+
+    def invalidar(self, particao=None):
+        """Nova geração: tudo o que foi gravado antes (na partição, se indicada) deixa de ser servido"""
+        with self.lock:
+            if particao is None:
+                self.geracao += 1
+                self.itens.clear()
+                return
+            self.geracoes[particao] = self.geracoes.get(particao, 0) + 1
+            for chave in [chave for chave in self.itens if self.particao(chave) == particao]:
+                del self.itens[chave]
+
+    def descartar(self, predicado):
+        """Remove só as entradas cuja chave atende `predicado`, sem mudar a geração"""
+        with self.lock:
+            for chave in [chave for chave in self.itens if predicado(chave)]:
+                del self.itens[chave]
+
+    def resumo(self):
+        with self.lock:
+            return {"itens": len(self.itens), "hits": self.hits, "misses": self.misses, "geracao": self.geracao}
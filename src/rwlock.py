@@ -0,0 +1,87 @@
+"""
+Lock de leitura e escrita
+
+Buscas são leituras e podem rodar juntas (o FAISS aceita buscas concorrentes
+e libera o GIL); adições, remoções e a troca do índice são escritas
+exclusivas. Escritores têm preferência: com um escritor esperando, novos
+leitores aguardam, então uma ingestão não fica parada atrás de um fluxo
+contínuo de buscas. Não é reentrante.
+
+Leituras longas (gravar o snapshot do índice) usam `sem_escritas`: impede
+novas escritas sem contar como leitor, então um escritor esperando não
+passa a bloquear as buscas.
+
+`with lock:` equivale a `with lock.escrita():`, para quem só precisa de
+exclusão mútua.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """Vários leitores ou um escritor"""
+
+    def __init__(self):
+        self._condicao = threading.Condition(threading.Lock())
+        self._leitores = 0
+        self._escrevendo = False
+        self._escritores_esperando = 0
+        self._fila_escrita = threading.Lock()  # um escritor por vez, antes de disputar com os leitores
+
+    def adquirir_leitura(self):
+        with self._condicao:
+            while self._escrevendo or self._escritores_esperando:
+                self._condicao.wait()
+            self._leitores += 1
+
+    def liberar_leitura(self):
+        with self._condicao:
+            self._leitores -= 1
+            if not self._leitores:
+                self._condicao.notify_all()
+
+    def adquirir_escrita(self):
+        self._fila_escrita.acquire()
+        with self._condicao:
+            self._escritores_esperando += 1
+            try:
+                while self._escrevendo or self._leitores:
+                    self._condicao.wait()
+            finally:
+                self._escritores_esperando -= 1
+            self._escrevendo = True
+
+    def liberar_escrita(self):
+        with self._condicao:
+            self._escrevendo = False
+            self._condicao.notify_all()
+        self._fila_escrita.release()
+
+    @contextmanager
+    def leitura(self):
+        self.adquirir_leitura()
+        try:
+            yield
+        finally:
+            self.liberar_leitura()
+
+    @contextmanager
+    def escrita(self):
+        self.adquirir_escrita()
+        try:
+            yield
+        finally:
+            self.liberar_escrita()
+
+    @contextmanager
+    def sem_escritas(self):
+        """Nenhuma escrita começa nem está em andamento; leitores seguem livres"""
+        with self._fila_escrita:
+            yield
+
+    def __enter__(self):
+        self.adquirir_escrita()
+        return self
+
+    def __exit__(self, *_):
+        self.liberar_escrita()
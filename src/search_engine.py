@@ -0,0 +1,425 @@
+"""
+Motor de busca semântica sobre um índice FAISS
+
+Os vetores são normalizados (norma L2 = 1) e indexados por produto interno,
+de modo que o score retornado pelo FAISS é a similaridade de cosseno.
+
+O tipo do índice (flat, hnsw, ivf, ivfpq, fp16, sq8, pq) vem da
+configuração. Tipos que exigem treino começam como flat; quando há vetores suficientes o índice
+treinado é construído em uma thread de fundo e trocado atomicamente, sem
+interromper buscas nem ingestões.
+
+Buscas compartilham o lock de leitura e rodam em paralelo; adições,
+remoções e a publicação de um índice reconstruído usam o de escrita, que é
+curto (a reconstrução em si acontece fora do lock).
+
+Remoções usam `remove_ids` do IDMap2 quando o índice suporta (flat, fp16,
+sq8, pq). No HNSW e no IVF os ids viram tombstones excluídos das buscas por
+um IDSelector; quando passam do limite o índice é reconstruído em segundo
+plano só com os vetores vivos (compactação).
+
+Nos índices quantizados os scores são aproximados. Com `rerank` > 1 a busca
+traz `rerank * k` candidatos e os reordena pelo cosseno exato, calculado com
+os vetores float32 originais fornecidos por `carregar_vetores` (o SQLite).
+
+Restaurado de um snapshot, o índice salvo vira uma base somente leitura
+mapeada do disco (`base`) e as adições vão para um delta flat em memória
+(`index`); a busca consulta os dois e junta os resultados, e as remoções
+viram tombstones. Quando o delta ou os tombstones passam do limite, a
+compactação reconstrói um único índice em memória com a base e o delta.
+"""
+import threading
+
+import faiss
+import numpy as np
+
+from src.filters import Selecao
+from src.index_factory import (QUANTIZADOS, bytes_por_vetor, criar_index, minimo_treino, parametros_busca,
+                                precisa_treino, suporta_remocao, tipo_do_index)
+from src.rwlock import RWLock
+
+
+def normalizar(vetores):
+    """Converte para float32 contíguo e normaliza cada linha (norma L2)"""
+    vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+    if vetores.ndim == 1:
+        vetores = vetores.reshape(1, -1)
+    faiss.normalize_L2(vetores)
+    return vetores
+
+
+def juntar_resultados(partes, k):
+    """Junta buscas (scores, ids) feitas em índices diferentes: os k maiores scores por consulta"""
+    scores = np.hstack([scores for scores, _ in partes])
+    ids = np.hstack([ids for _, ids in partes])
+    ordem = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, ordem, axis=1), np.take_along_axis(ids, ordem, axis=1)
+
+
+def ids_e_vetores(index):
+    """Ids e vetores (reconstruídos) de um IDMap2"""
+    ids = faiss.vector_to_array(index.id_map).copy()
+    if not index.ntotal:
+        return ids, np.zeros((0, index.d), dtype=np.float32)
+    return ids, index.index.reconstruct_n(0, index.ntotal)
+
+
+class SearchEngine:
+    """Índice FAISS com o mapeamento id do vetor -> registro do chunk"""
+
+    def __init__(self, dim, tipo="flat", nlist=1024, pq_m=48, hnsw_m=32, ef_construction=40,
+                 nprobe=16, ef_search=64, treino_min=None, treino_amostra=None,
+                 compactar_min=1000, compactar_fracao=0.2, rerank=0, carregar_vetores=None):
+        self.dim = dim
+        self.tipo = tipo
+        self.parametros = {"nlist": nlist, "pq_m": pq_m, "hnsw_m": hnsw_m, "ef_construction": ef_construction}
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.treino_min = treino_min or minimo_treino(tipo, nlist)
+        self.treino_amostra = treino_amostra or 256 * nlist
+        self.compactar_min = compactar_min
+        self.compactar_fracao = compactar_fracao
+        self.rerank = rerank
+        self.carregar_vetores = carregar_vetores  # ids -> {id: vetor float32}, para o re-ranking
+        self.index = criar_index("flat" if precisa_treino(tipo) else tipo, dim, **self.parametros)
+        self.base = None  # índice mapeado de um snapshot; com ele, `index` é o delta das adições
+        self.arquivo_base = None
+        self.chunks = {}  # id FAISS -> registro do chunk
+        self.proximo_id = 0
+        self.versao = 0  # incrementada a cada alteração do índice
+        # Buscas concorrentes na leitura; adições, remoções e a troca do índice na escrita
+        self.lock = RWLock()
+        self.removidos = set()  # tombstones: ids ainda no índice, mas excluídos das buscas
+        self._seletor_removidos = None
+        self._replay = None  # adições feitas durante uma reconstrução em andamento
+        self._remocoes_replay = None  # remoções feitas durante uma reconstrução em andamento
+        self._migracao_falhou = False
+        self._reconstrucao = None
+
+    @property
+    def ntotal(self):
+        return self._total_index() - len(self.removidos)
+
+    @property
+    def tipo_atual(self):
+        return tipo_do_index(self.base if self.base is not None else self.index)
+
+    @property
+    def base_mapeada(self):
+        """Par (base, nome do arquivo) para `salvar_snapshot`, ou None (chamar com o lock)"""
+        return (self.base, self.arquivo_base) if self.base is not None else None
+
+    def _total_index(self):
+        # Vetores nos índices, incluindo tombstones
+        return self.index.ntotal + (self.base.ntotal if self.base is not None else 0)
+
+    def reservar_id(self):
+        """Reserva um id da mesma sequência dos chunks (usado pelo registro principal do documento)"""
+        with self.lock:
+            self.proximo_id += 1
+            return self.proximo_id - 1
+
+    def garantir_proximo_id(self, minimo):
+        """Evita reaproveitar ids já gravados no armazenamento persistente"""
+        with self.lock:
+            self.proximo_id = max(self.proximo_id, minimo)
+
+    def add(self, documento_id, textos, vetores, primeiro_chunk=1, ids=None):
+        """Adiciona chunks de um documento; retorna os ids atribuídos (ou os `ids` já alocados)"""
+        vetores = normalizar(vetores)
+        if len(textos) != vetores.shape[0]:
+            raise ValueError("Quantidade de textos e vetores não confere")
+
+        with self.lock:
+            if ids is None:
+                ids = np.arange(self.proximo_id, self.proximo_id + len(textos), dtype=np.int64)
+                self.proximo_id += len(textos)
+            else:
+                ids = np.ascontiguousarray(ids, dtype=np.int64)
+            self.index.add_with_ids(vetores, ids)
+            if self._replay is not None:
+                self._replay.append((ids, vetores))
+            for i, (vetor_id, texto) in enumerate(zip(ids.tolist(), textos)):
+                self.chunks[vetor_id] = {
+                    "documento_id": documento_id,
+                    "chunk_id": primeiro_chunk + i,
+                    "total_chunks": None,
+                    "chunk_text": texto,
+                }
+            self.versao += 1
+            migrar = self._deve_migrar() or self._deve_compactar()
+        if migrar:
+            self.iniciar_reconstrucao()
+        return ids.tolist()
+
+    def finalizar(self, ids):
+        """Preenche total_chunks depois que todos os chunks do documento foram adicionados"""
+        with self.lock:
+            for vetor_id in ids:
+                self.chunks[vetor_id]["total_chunks"] = len(ids)
+            self.versao += 1
+
+    def search(self, vetor_consulta, k, nprobe=None, ef_search=None, ids=None):
+        """Retorna até k pares (registro do chunk, similaridade) em ordem decrescente"""
+        return [(self.chunks[vetor_id], score)
+                for vetor_id, score in self.search_ids(vetor_consulta, k, nprobe, ef_search, ids)
+                if vetor_id in self.chunks]
+
+    def search_ids(self, vetor_consulta, k, nprobe=None, ef_search=None, ids=None, selecao=None):
+        """
+        Como `search`, mas com os ids dos chunks. `ids` restringe os candidatos;
+        `selecao` (src.filters.Selecao) faz o mesmo com um seletor já construído.
+        """
+        if ids is not None:
+            selecao = Selecao(np.fromiter(ids, dtype=np.int64))
+        return self.search_lote_ids(vetor_consulta, k, nprobe, ef_search, selecao)[0]
+
+    def search_lote(self, vetores_consulta, k, nprobe=None, ef_search=None, selecao=None):
+        """Várias consultas em uma única chamada ao FAISS; uma lista de resultados por consulta"""
+        resultados = self.search_lote_ids(vetores_consulta, k, nprobe, ef_search, selecao)
+        # Um chunk removido depois da busca não aparece no resultado
+        return [[(self.chunks[vetor_id], score) for vetor_id, score in resultado if vetor_id in self.chunks]
+                for resultado in resultados]
+
+    def search_lote_ids(self, vetores_consulta, k, nprobe=None, ef_search=None, selecao=None):
+        consultas = normalizar(vetores_consulta)
+        seletor = None
+        if selecao is not None:
+            if not len(selecao):
+                return [[] for _ in range(len(consultas))]
+            k = min(k, len(selecao))
+            seletor = selecao.seletor
+        with self.lock.leitura():
+            if self._total_index() == 0:
+                return [[] for _ in range(len(consultas))]
+            reranquear = self._deve_reranquear()
+            candidatos = k * self.rerank if reranquear else k
+            vivos = self._seletor_vivos()
+            if vivos is not None:
+                seletor = faiss.IDSelectorAnd(seletor, vivos) if seletor is not None else vivos
+            partes = []
+            for index in (self.base, self.index):
+                if index is not None and index.ntotal:
+                    params = parametros_busca(index, nprobe or self.nprobe, ef_search or self.ef_search, seletor)
+                    partes.append(index.search(consultas, min(candidatos, index.ntotal), params=params))
+            scores, encontrados = partes[0] if len(partes) == 1 else juntar_resultados(partes, candidatos)
+
+        resultados = [[(int(vetor_id), float(score)) for vetor_id, score in zip(linha_ids, linha_scores) if vetor_id >= 0]
+                      for linha_ids, linha_scores in zip(encontrados, scores)]
+        if reranquear:
+            resultados = self._reranquear(consultas, resultados, k)
+        return resultados
+
+    def _deve_reranquear(self):
+        return self.rerank > 1 and self.carregar_vetores is not None and self.tipo_atual in QUANTIZADOS
+
+    def _reranquear(self, consultas, resultados, k):
+        """Reordena os candidatos pelo cosseno exato com os vetores originais (fora do lock)"""
+        vetores = self.carregar_vetores({vetor_id for resultado in resultados for vetor_id, _ in resultado})
+        reordenados = []
+        for consulta, resultado in zip(consultas, resultados):
+            # Candidato sem vetor gravado mantém o score aproximado
+            exatos = [(vetor_id, float(vetores[vetor_id] @ consulta) if vetor_id in vetores else score)
+                      for vetor_id, score in resultado]
+            exatos.sort(key=lambda item: item[1], reverse=True)
+            reordenados.append(exatos[:k])
+        return reordenados
+
+    def registro(self, vetor_id):
+        return self.chunks.get(vetor_id)
+
+    def itens_chunks(self):
+        """Pares (id, registro) de todos os chunks"""
+        with self.lock.leitura():
+            return list(self.chunks.items())
+
+    def memoria_estimada(self):
+        """Bytes aproximados do índice e dos registros dos chunks (a base mapeada só pelos ids e o grafo)"""
+        with self.lock.leitura():
+            vetores = self.index.ntotal * bytes_por_vetor(tipo_do_index(self.index), self.dim, self.parametros["pq_m"],
+                                                          self.parametros["hnsw_m"])
+            if self.base is not None:
+                # Os códigos ficam no arquivo (page cache); id_map, rev_map e vizinhos do HNSW na RAM
+                vizinhos = 2 * self.parametros["hnsw_m"] * 4 if self.tipo_atual == "hnsw" else 0
+                vetores += self.base.ntotal * (48 + vizinhos)
+            textos = sum(len(c["chunk_text"]) for c in self.chunks.values())
+            # dict do registro com chaves e inteiros do CPython: ~350 bytes por chunk além do texto
+            return vetores + textos + 350 * len(self.chunks)
+
+    def exportar_chunks(self):
+        """Registros dos chunks em listas compactas, para o sidecar do snapshot (chamar com o lock)"""
+        return [[vetor_id, c["documento_id"], c["chunk_id"], c["total_chunks"], c["chunk_text"]]
+                for vetor_id, c in self.chunks.items()]
+
+    def carregar(self, ids, vetores, registros):
+        """Adiciona em massa chunks já persistidos, mantendo os ids originais"""
+        vetores = normalizar(vetores)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        with self.lock:
+            self.index.add_with_ids(vetores, ids)
+            if self._replay is not None:
+                self._replay.append((ids, vetores))
+            self.chunks.update(zip(ids.tolist(), registros))
+            self.proximo_id = max(self.proximo_id, int(ids.max()) + 1)
+            self.versao += 1
+            migrar = self._deve_migrar() or self._deve_compactar()
+        if migrar:
+            self.iniciar_reconstrucao()
+
+    def remover(self, ids):
+        """Remove chunks do índice e dos registros; retorna quantos foram removidos"""
+        with self.lock:
+            ids = [vetor_id for vetor_id in ids if self.chunks.pop(vetor_id, None) is not None]
+            if not ids:
+                return 0
+            self._remover_do_index(self.index, ids)
+            if self._remocoes_replay is not None:
+                self._remocoes_replay.extend(ids)
+            self.versao += 1
+            compactar = self._deve_compactar()
+        if compactar:
+            self.iniciar_reconstrucao()
+        return len(ids)
+
+    def _remover_do_index(self, index, ids):
+        # remove_ids quando o índice suporta; senão, ou com a base mapeada, tombstones (chamar com o lock)
+        if self.base is None and suporta_remocao(index):
+            index.remove_ids(faiss.IDSelectorBatch(np.asarray(ids, dtype=np.int64)))
+        else:
+            self.removidos.update(ids)
+            self._seletor_removidos = None
+
+    def _seletor_vivos(self):
+        """IDSelector que exclui os tombstones (chamar com o lock); None sem tombstones"""
+        if not self.removidos:
+            return None
+        if self._seletor_removidos is None:
+            removidos = faiss.IDSelectorBatch(np.fromiter(self.removidos, dtype=np.int64))
+            seletor = faiss.IDSelectorNot(removidos)
+            seletor.referenciado = removidos  # mantém o seletor interno vivo
+            self._seletor_removidos = seletor
+        return self._seletor_removidos
+
+    def restaurar(self, index, chunks, base=None):
+        """
+        Substitui o índice e os registros pelos de um snapshot. Com `base`
+        (o par índice mapeado, arquivo de `carregar_snapshot`), `index` é o
+        delta ou None.
+        """
+        if index is None:
+            index = criar_index("flat", self.dim)
+        base, arquivo_base = base if base is not None else (None, None)
+        for parte in (index, base):
+            if parte is not None and parte.d != self.dim:
+                raise ValueError(f"Dimensão do snapshot ({parte.d}) difere da configurada ({self.dim})")
+        if not hasattr(index, "id_map"):
+            # Snapshot antigo (índice sem IDMap2): ids eram as posições no índice
+            convertido = criar_index("flat", self.dim)
+            convertido.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype=np.int64))
+            index = convertido
+        with self.lock:
+            self.index = index
+            self.base = base
+            self.arquivo_base = arquivo_base
+            self.chunks = {
+                vetor_id: {
+                    "documento_id": documento_id,
+                    "chunk_id": chunk_id,
+                    "total_chunks": total_chunks,
+                    "chunk_text": texto,
+                }
+                for vetor_id, documento_id, chunk_id, total_chunks, texto in chunks
+            }
+            self.proximo_id = max(self.chunks, default=-1) + 1
+            self.removidos = set()
+            self._seletor_removidos = None
+            # Vetores sem registro foram removidos antes do snapshot (tombstones do HNSW)
+            orfaos = [vetor_id for parte in (base, index) if parte is not None
+                      for vetor_id in faiss.vector_to_array(parte.id_map).tolist() if vetor_id not in self.chunks]
+            if orfaos:
+                self._remover_do_index(index, orfaos)
+            migrar = self._deve_migrar() or self._deve_compactar()
+        if migrar:
+            self.iniciar_reconstrucao()
+
+    def _deve_migrar(self):
+        # Só um índice flat é promovido, e apenas uma reconstrução por vez (chamar com o lock)
+        if self._replay is not None or self._migracao_falhou:
+            return False
+        if self.tipo == "flat" or self.tipo_atual != "flat":
+            return False
+        return not precisa_treino(self.tipo) or self._total_index() >= self.treino_min
+
+    def _deve_compactar(self):
+        # Tombstones demais custam memória e pioram o recall do HNSW; um delta
+        # grande deixa de ser barato de buscar por força bruta (chamar com o lock)
+        if self._replay is not None or self._migracao_falhou:
+            return False
+        if self.base is not None and self.index.ntotal > max(self.compactar_min,
+                                                             self.compactar_fracao * self.base.ntotal):
+            return True
+        return len(self.removidos) > max(self.compactar_min, self.compactar_fracao * self._total_index())
+
+    def iniciar_reconstrucao(self):
+        """Reconstrói o índice do tipo configurado só com os vetores vivos (base e delta), em segundo plano"""
+        # Copiar os vetores pode demorar: bloqueia só as escritas, não as buscas
+        with self.lock.sem_escritas():
+            if self._replay is not None:
+                return
+            self._replay = []
+            self._remocoes_replay = []
+            ids, vetores = ids_e_vetores(self.index)
+            if self.base is not None:
+                ids_base, vetores_base = ids_e_vetores(self.base)
+                ids, vetores = np.concatenate([ids_base, ids]), np.vstack([vetores_base, vetores])
+            if self.removidos:
+                vivos = ~np.isin(ids, np.fromiter(self.removidos, dtype=np.int64))
+                ids, vetores = ids[vivos], vetores[vivos]
+            # Compactar um IVF-PQ reconstrói vetores aproximados; os originais vêm do banco
+            aproximados = self.tipo_atual in QUANTIZADOS
+        self._reconstrucao = threading.Thread(target=self._reconstruir, args=(ids, vetores, aproximados),
+                                              name="reconstrucao-indice", daemon=True)
+        self._reconstrucao.start()
+
+    def aguardar_reconstrucao(self, timeout=None):
+        """Espera a reconstrução em andamento, se houver"""
+        if self._reconstrucao is not None:
+            self._reconstrucao.join(timeout)
+
+    def _reconstruir(self, ids, vetores, aproximados=False):
+        """Constrói o índice novo fora do lock e o publica no lugar do atual"""
+        try:
+            if aproximados and self.carregar_vetores is not None:
+                originais = self.carregar_vetores(ids.tolist())
+                for posicao, vetor_id in enumerate(ids.tolist()):
+                    if vetor_id in originais:
+                        vetores[posicao] = originais[vetor_id]
+                vetores = normalizar(vetores)
+            novo = criar_index(self.tipo, self.dim, **self.parametros)
+            if not novo.is_trained:
+                rng = np.random.default_rng(0)
+                amostra = rng.choice(len(vetores), min(len(vetores), self.treino_amostra), replace=False)
+                novo.train(vetores[np.sort(amostra)])
+            for inicio in range(0, len(ids), 65536):
+                novo.add_with_ids(vetores[inicio:inicio + 65536], ids[inicio:inicio + 65536])
+            with self.lock:
+                # Reaplica o que chegou enquanto o índice novo era construído
+                for ids_novos, vetores_novos in self._replay:
+                    novo.add_with_ids(vetores_novos, ids_novos)
+                self.index = novo
+                self.base = None
+                self.arquivo_base = None
+                self.removidos = set()
+                self._seletor_removidos = None
+                if self._remocoes_replay:
+                    self._remover_do_index(novo, self._remocoes_replay)
+                self._replay = None
+                self._remocoes_replay = None
+                self.versao += 1
+            print(f"Índice {self.tipo} reconstruído com {novo.ntotal} vetores")
+        except Exception as e:
+            with self.lock:
+                self._replay = None
+                self._remocoes_replay = None
+                self._migracao_falhou = True
+            print(f"Erro na reconstrução do índice {self.tipo}: {e}")
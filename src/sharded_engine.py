@@ -0,0 +1,305 @@
+"""
+Índice dividido em shards, com busca em paralelo
+
+`ShardedEngine` tem a mesma interface do SearchEngine e reparte os chunks
+entre `num_shards` SearchEngine independentes (cada um com o seu tipo de
+índice, migração, tombstones e re-ranking). O shard de um documento vem do
+hash do seu id ou, com `atribuir`, de uma chave como o tenant, mantendo os
+documentos de um tenant juntos. Os ids dos vetores são alocados de forma
+que `id % num_shards` é o shard, então qualquer id é roteado sem tabela.
+
+Cada consulta é enviada a todos os shards carregados por um pool de threads
+(o FAISS libera o GIL) e os top-k parciais são combinados com um heap.
+
+Um nó pode manter só os shards atribuídos a ele; cada shard tem o seu
+snapshot em `<diretório>/shard-NNN` e pode ser carregado (do snapshot ou do
+banco) e descarregado sem afetar os demais.
+"""
+import heapq
+import itertools
+import os
+import threading
+import zlib
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+
+from src.filters import Selecao
+from src.rwlock import RWLock
+from src.search_engine import SearchEngine, normalizar
+from src.snapshot import carregar_snapshot, salvar_snapshot
+
+
+class ShardIndisponivel(Exception):
+    """O shard não está carregado ou não é atribuído a este nó"""
+
+
+class ShardedEngine:
+    """Vários SearchEngine atrás da interface de um só"""
+
+    def __init__(self, dim, num_shards, atribuidos=None, workers=None, diretorio=None, **parametros):
+        self.dim = dim
+        self.num_shards = num_shards
+        self.atribuidos = tuple(sorted(set(atribuidos))) if atribuidos else tuple(range(num_shards))
+        if any(not 0 <= s < num_shards for s in self.atribuidos):
+            raise ValueError(f"Shards atribuídos fora de 0..{num_shards - 1}: {self.atribuidos}")
+        self.diretorio = diretorio
+        self.parametros = parametros
+        self.carregar_do_banco = None  # (shard, num_shards) -> páginas (ids, vetores, registros)
+        self._carregar_vetores = parametros.pop("carregar_vetores", None)
+        self.tipo = parametros.get("tipo", "flat")
+        # Shards carregados; o mapa é substituído, nunca alterado, e as buscas o leem sem lock
+        self.shards = {}
+        self.proximos = [0] * num_shards  # próximo k de cada shard (id = k * num_shards + shard)
+        self.destinos = {}  # id do documento -> shard escolhido por `atribuir`
+        self._lock_ids = threading.Lock()
+        # Ingestão na leitura (em paralelo); carregar e descarregar shards na escrita
+        self.lock = RWLock()
+        self._versao = 0
+        self.pool = ThreadPoolExecutor(max_workers=workers or min(num_shards, os.cpu_count() or 1),
+                                       thread_name_prefix="busca-shard")
+
+    def _novo_shard(self):
+        return SearchEngine(self.dim, carregar_vetores=self._carregar_vetores, **self.parametros)
+
+    # Propriedades usadas pela aplicação, agregadas entre os shards carregados
+
+    @property
+    def ntotal(self):
+        return sum(shard.ntotal for shard in self.shards.values())
+
+    @property
+    def tipo_atual(self):
+        tipos = {shard.tipo_atual for shard in self.shards.values()}
+        return tipos.pop() if len(tipos) == 1 else ",".join(sorted(tipos)) or self.tipo
+
+    @property
+    def versao(self):
+        return self._versao, tuple((s, shard.versao) for s, shard in sorted(self.shards.items()))
+
+    @property
+    def chunks(self):
+        return ChainMap(*[shard.chunks for shard in self.shards.values()])
+
+    @property
+    def removidos(self):
+        return set().union(*[shard.removidos for shard in self.shards.values()])
+
+    @property
+    def proximo_id(self):
+        with self._lock_ids:
+            return max(k * self.num_shards + s for s, k in enumerate(self.proximos))
+
+    @property
+    def carregar_vetores(self):
+        return self._carregar_vetores
+
+    @carregar_vetores.setter
+    def carregar_vetores(self, funcao):
+        self._carregar_vetores = funcao
+        for shard in self.shards.values():
+            shard.carregar_vetores = funcao
+
+    # Ids e roteamento
+
+    def shard_de(self, chave):
+        return zlib.crc32(str(chave).encode("utf-8")) % self.num_shards
+
+    def atribuir(self, documento_id, chave=None):
+        """Define o shard do documento pela `chave` (p.ex. o tenant) antes de indexá-lo"""
+        if chave is not None:
+            self.destinos[documento_id] = self.shard_de(chave)
+
+    def _alocar(self, shard, quantidade):
+        with self._lock_ids:
+            inicio = self.proximos[shard]
+            self.proximos[shard] += quantidade
+        return np.arange(inicio, inicio + quantidade, dtype=np.int64) * self.num_shards + shard
+
+    def reservar_id(self):
+        """Id do registro principal do documento (não entra em nenhum índice)"""
+        return int(self._alocar(0, 1)[0])
+
+    def garantir_proximo_id(self, minimo):
+        with self._lock_ids:
+            for s in range(self.num_shards):
+                self.proximos[s] = max(self.proximos[s], -(-(minimo - s) // self.num_shards))
+
+    def _shard(self, s):
+        shard = self.shards.get(s)
+        if shard is None:
+            situacao = "descarregado" if s in self.atribuidos else "não atribuído a este nó"
+            raise ShardIndisponivel(f"Shard {s} {situacao}")
+        return shard
+
+    def _por_shard(self, ids):
+        grupos = {}
+        for vetor_id in ids:
+            grupos.setdefault(vetor_id % self.num_shards, []).append(vetor_id)
+        return grupos
+
+    # Escrita
+
+    def add(self, documento_id, textos, vetores, primeiro_chunk=1):
+        s = self.destinos.get(documento_id, self.shard_de(documento_id))
+        with self.lock.leitura():
+            shard = self._shard(s)
+            ids = self._alocar(s, len(textos))
+            return shard.add(documento_id, textos, vetores, primeiro_chunk=primeiro_chunk, ids=ids)
+
+    def _esquecer_destino(self, ids):
+        # O documento foi concluído ou descartado: o roteamento por chave não é mais necessário
+        registro = self.registro(ids[0]) if ids else None
+        if registro is not None:
+            self.destinos.pop(registro["documento_id"], None)
+
+    def finalizar(self, ids):
+        self._esquecer_destino(ids)
+        with self.lock.leitura():
+            for s, grupo in self._por_shard(ids).items():
+                self._shard(s).finalizar(grupo)
+
+    def remover(self, ids):
+        self._esquecer_destino(ids)
+        removidos = 0
+        with self.lock.leitura():
+            for s, grupo in self._por_shard(ids).items():
+                shard = self.shards.get(s)
+                if shard is not None:
+                    removidos += shard.remover(grupo)
+        return removidos
+
+    def carregar(self, ids, vetores, registros):
+        """Chunks já persistidos; os de shards não atribuídos a este nó são ignorados"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vetores = np.asarray(vetores, dtype=np.float32)
+        destinos = ids % self.num_shards
+        with self.lock.leitura():
+            for s, shard in self.shards.items():
+                selecionados = np.flatnonzero(destinos == s)
+                if len(selecionados):
+                    shard.carregar(ids[selecionados], vetores[selecionados], [registros[i] for i in selecionados])
+        self.garantir_proximo_id(int(ids.max()) + 1 if len(ids) else 0)
+
+    # Busca
+
+    def search(self, vetor_consulta, k, nprobe=None, ef_search=None, ids=None):
+        selecao = Selecao(np.fromiter(ids, dtype=np.int64)) if ids is not None else None
+        return self.search_lote(vetor_consulta, k, nprobe, ef_search, selecao)[0]
+
+    def search_ids(self, vetor_consulta, k, nprobe=None, ef_search=None, ids=None, selecao=None):
+        if ids is not None:
+            selecao = Selecao(np.fromiter(ids, dtype=np.int64))
+        return self.search_lote_ids(vetor_consulta, k, nprobe, ef_search, selecao)[0]
+
+    def search_lote(self, vetores_consulta, k, nprobe=None, ef_search=None, selecao=None):
+        resultados = self.search_lote_ids(vetores_consulta, k, nprobe, ef_search, selecao)
+        return [[(registro, score) for registro, score in
+                 ((self.registro(vetor_id), score) for vetor_id, score in resultado) if registro is not None]
+                for resultado in resultados]
+
+    def search_lote_ids(self, vetores_consulta, k, nprobe=None, ef_search=None, selecao=None):
+        consultas = normalizar(vetores_consulta)
+        shards = list(self.shards.values())
+        if not shards:
+            return [[] for _ in range(len(consultas))]
+        if len(shards) == 1:
+            return shards[0].search_lote_ids(consultas, k, nprobe, ef_search, selecao)
+        futuros = [self.pool.submit(shard.search_lote_ids, consultas, k, nprobe, ef_search, selecao)
+                   for shard in shards]
+        parciais = [futuro.result() for futuro in futuros]
+        # Top-k global de cada consulta a partir dos top-k de cada shard
+        return [heapq.nlargest(k, itertools.chain.from_iterable(por_shard), key=lambda item: item[1])
+                for por_shard in zip(*parciais)]
+
+    def registro(self, vetor_id):
+        shard = self.shards.get(vetor_id % self.num_shards)
+        return shard.registro(vetor_id) if shard is not None else None
+
+    def itens_chunks(self):
+        return [item for shard in list(self.shards.values()) for item in shard.itens_chunks()]
+
+    def memoria_estimada(self):
+        return sum(shard.memoria_estimada() for shard in list(self.shards.values()))
+
+    def aguardar_reconstrucao(self, timeout=None):
+        for shard in list(self.shards.values()):
+            shard.aguardar_reconstrucao(timeout)
+
+    # Snapshots e ciclo de vida dos shards
+
+    def _diretorio_shard(self, s):
+        return os.path.join(self.diretorio, f"shard-{s:03d}")
+
+    @contextmanager
+    def sem_escritas(self):
+        """Nenhuma escrita em nenhum shard (snapshot consistente); buscas seguem livres"""
+        with self.lock.sem_escritas(), ExitStack() as pilha:
+            for shard in list(self.shards.values()):
+                pilha.enter_context(shard.lock.sem_escritas())
+            yield
+
+    def _salvar_shard(self, s, shard, manter):
+        salvar_snapshot(self._diretorio_shard(s), shard.index, {"chunks": shard.exportar_chunks()}, manter=manter,
+                        base=shard.base_mapeada)
+
+    def salvar_snapshots(self, manter=2):
+        """Grava o snapshot de cada shard carregado (chamar dentro de `sem_escritas`)"""
+        for s, shard in list(self.shards.items()):
+            self._salvar_shard(s, shard, manter)
+
+    def carregar_shard(self, s, mmap=True):
+        """
+        Carrega um shard atribuído do seu snapshot ou, sem snapshot, do banco
+        (vazio se não houver nenhum dos dois). Retorna os itens (id, registro)
+        carregados; não faz nada se já estiver carregado.
+        """
+        if s not in self.atribuidos:
+            raise ShardIndisponivel(f"Shard {s} não atribuído a este nó")
+        if s in self.shards:
+            return []
+        shard = self._novo_shard()
+        snapshot = carregar_snapshot(self._diretorio_shard(s), mmap=mmap) if self.diretorio else None
+        if snapshot is not None:
+            index, metadados, base = snapshot
+            shard.restaurar(index, metadados["chunks"], base=base)
+        elif self.carregar_do_banco is not None:
+            for ids, vetores, registros in self.carregar_do_banco(s, self.num_shards):
+                shard.carregar(ids, vetores, registros)
+        with self.lock:
+            if s in self.shards:
+                return []
+            self.shards = {**self.shards, s: shard}
+            self._versao += 1
+        if shard.chunks:
+            self.garantir_proximo_id(max(shard.chunks) + 1)
+        print(f"Shard {s} carregado com {shard.ntotal} vetores")
+        return shard.itens_chunks()
+
+    def descarregar_shard(self, s, manter=2):
+        """Grava o snapshot do shard e o remove da memória; retorna os ids que ele continha"""
+        # Na escrita: nenhuma ingestão em andamento; as buscas seguem no mapa atual
+        with self.lock:
+            shard = self.shards.get(s)
+            if shard is None:
+                return []
+            if self.diretorio:
+                with shard.lock.sem_escritas():
+                    self._salvar_shard(s, shard, manter)
+            self.shards = {outro: motor for outro, motor in self.shards.items() if outro != s}
+            self._versao += 1
+        print(f"Shard {s} descarregado")
+        return list(shard.chunks)
+
+    def resumo(self):
+        return [{
+            "shard": s,
+            "carregado": s in self.shards,
+            "vetores": self.shards[s].ntotal if s in self.shards else None,
+            "index_type": self.shards[s].tipo_atual if s in self.shards else None,
+        } for s in self.atribuidos]
+
+    def close(self):
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,162 @@
+"""
+Snapshots do índice FAISS e dos metadados em disco
+
+Cada snapshot grava `indice-<versão>.faiss` com `faiss.write_index` e um
+sidecar JSON compacto com os registros dos chunks e dos documentos. O
+arquivo `snapshot.json` aponta para o par mais recente e é substituído de
+forma atômica por último, então um snapshot interrompido nunca é lido.
+
+Na carga os códigos do índice são mapeados do arquivo (`IO_FLAG_MMAP_IFC`)
+em vez de lidos para a RAM: a instância volta a responder logo e as páginas
+ficam no page cache, que o sistema pode descartar e reler. O índice mapeado
+é somente leitura e vira a base do SearchEngine, com as novas adições em um
+delta em memória. O snapshot seguinte grava só o delta e aponta para o
+arquivo da base, que é mantido enquanto for referenciado.
+
+Com o índice dividido em shards cada shard tem o seu diretório de snapshot
+e o snapshot principal guarda só os metadados (`index` None).
+"""
+import json
+import os
+import threading
+import time
+
+import faiss
+
+PONTEIRO = "snapshot.json"
+
+
+def _escrever_atomico(caminho, escrever):
+    temporario = caminho + ".tmp"
+    escrever(temporario)
+    os.replace(temporario, caminho)
+
+
+def salvar_snapshot(diretorio, index, metadados, manter=2, base=None):
+    """
+    Grava o índice (se houver) e o sidecar; retorna o nome da versão gravada.
+    Com `base` (par índice mapeado, nome do arquivo, de um snapshot deste
+    diretório) `index` é só o delta, e o arquivo da base é reaproveitado.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    agora = time.time()
+    versao = time.strftime("%Y%m%d%H%M%S", time.gmtime(agora)) + f"-{int(agora % 1 * 1e6):06d}"
+    nome_indice = f"indice-{versao}.faiss" if index is not None else None
+    nome_metadados = f"metadados-{versao}.json"
+
+    if index is not None:
+        _escrever_atomico(os.path.join(diretorio, nome_indice),
+                          lambda caminho: faiss.write_index(index, caminho))
+
+    def escrever_json(dados):
+        def escrever(caminho):
+            with open(caminho, "w", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False, separators=(",", ":"))
+        return escrever
+
+    _escrever_atomico(os.path.join(diretorio, nome_metadados), escrever_json(metadados))
+    _escrever_atomico(os.path.join(diretorio, PONTEIRO), escrever_json({
+        "versao": versao,
+        "indice": nome_indice,
+        "metadados": nome_metadados,
+        "ntotal": index.ntotal if index is not None else 0,
+        "base": base[1] if base is not None else None,
+        "ntotal_base": base[0].ntotal if base is not None else 0,
+    }))
+    _remover_antigos(diretorio, manter, {base[1]} if base is not None else set())
+    return versao
+
+
+def _remover_antigos(diretorio, manter, referenciados):
+    # Arquivos já mapeados (por este ou outro processo) continuam válidos após o unlink
+    for prefixo in ("indice-", "metadados-"):
+        arquivos = sorted(f for f in os.listdir(diretorio) if f.startswith(prefixo) and not f.endswith(".tmp"))
+        for nome in arquivos[:-manter]:
+            if nome in referenciados:
+                continue
+            try:
+                os.remove(os.path.join(diretorio, nome))
+            except OSError:
+                pass
+
+
+def _ler_indice(diretorio, ponteiro, nome, ntotal, mmap):
+    index = faiss.read_index(os.path.join(diretorio, nome), faiss.IO_FLAG_MMAP_IFC if mmap else 0)
+    if index.ntotal != ntotal:
+        raise ValueError(f"Snapshot {ponteiro['versao']} inconsistente")
+    return index
+
+
+def carregar_snapshot(diretorio, mmap=True):
+    """
+    Retorna (index, metadados, base) do snapshot mais recente, ou None se não
+    houver. Com `mmap` o índice salvo volta como `base`, o par (índice
+    mapeado, nome do arquivo), e `index` é o delta (None se não houver); sem
+    `mmap` tudo é lido para um único `index` e `base` é None. `index` e
+    `base` são None em um snapshot só de metadados.
+    """
+    caminho_ponteiro = os.path.join(diretorio, PONTEIRO)
+    if not os.path.exists(caminho_ponteiro):
+        return None
+    with open(caminho_ponteiro, encoding="utf-8") as f:
+        ponteiro = json.load(f)
+
+    index = base = None
+    nome_base = ponteiro.get("base")
+    if ponteiro["indice"] is not None:
+        # O delta é pequeno e recebe as adições: fica na RAM
+        mapear = mmap and nome_base is None
+        index = _ler_indice(diretorio, ponteiro, ponteiro["indice"], ponteiro["ntotal"], mapear)
+        # Snapshot antigo sem IDMap2 é convertido em memória pelo SearchEngine
+        if mapear and hasattr(index, "id_map"):
+            index, base = None, (index, ponteiro["indice"])
+    if nome_base is not None:
+        completo = _ler_indice(diretorio, ponteiro, nome_base, ponteiro["ntotal_base"], mmap)
+        if mmap:
+            base = (completo, nome_base)
+        else:
+            if index.ntotal:
+                completo.add_with_ids(index.index.reconstruct_n(0, index.ntotal), faiss.vector_to_array(index.id_map))
+            index = completo
+    with open(os.path.join(diretorio, ponteiro["metadados"]), encoding="utf-8") as f:
+        metadados = json.load(f)
+    return index, metadados, base
+
+
+class SnapshotScheduler:
+    """Thread que chama `salvar` a cada `intervalo` segundos quando houve alterações"""
+
+    def __init__(self, salvar, versao_atual, intervalo=300):
+        self.salvar = salvar
+        self.versao_atual = versao_atual
+        self.intervalo = intervalo
+        self.ultima_versao = versao_atual()
+        self.lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.intervalo <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="snapshot", daemon=True)
+        self._thread.start()
+
+    def salvar_se_alterado(self):
+        """Grava um snapshot se o índice mudou desde o último; seguro entre threads"""
+        with self.lock:
+            versao = self.versao_atual()
+            if versao == self.ultima_versao:
+                return False
+            self.salvar()
+            self.ultima_versao = versao
+            return True
+
+    def stop(self):
+        self._parar.set()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.salvar_se_alterado()
+            except Exception as e:
+                print(f"Erro ao gravar snapshot: {e}")
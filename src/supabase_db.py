@@ -0,0 +1,295 @@
+"""
+Armazenamento remoto em Postgres com pgvector (schema do Supabase)
+
+`SupabaseDBManager` grava documentos e chunks na tabela `documentos` de
+supabase/migrations/001_documentos_table.sql com o mesmo modelo de linhas
+do SQLite local (registro principal com chunk_id = 0 e um registro por
+chunk), usando um pool de conexões e upserts em lote. A busca top-k roda no
+próprio Postgres, pelo índice ivfflat, com `ivfflat.probes` ajustável.
+
+Com este backend várias réplicas da aplicação compartilham o mesmo
+armazenamento de vetores; os ids vêm da sequência da tabela, então não
+colidem entre réplicas.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from src.database import metadados_documento
+
+MIGRACAO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "supabase", "migrations", "001_documentos_table.sql")
+
+FORMATO_DATA = "%d/%m/%Y %H:%M"
+
+UPSERT = """
+    INSERT INTO documentos (id, nome, texto, data, tamanho, tipo, chunk_id, total_chunks,
+                            chunk_text, chunk_embedding, metadata, documento_principal_id)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (id) DO UPDATE SET
+        nome = EXCLUDED.nome, texto = EXCLUDED.texto, data = EXCLUDED.data,
+        tamanho = EXCLUDED.tamanho, tipo = EXCLUDED.tipo, chunk_id = EXCLUDED.chunk_id,
+        total_chunks = EXCLUDED.total_chunks, chunk_text = EXCLUDED.chunk_text,
+        chunk_embedding = EXCLUDED.chunk_embedding, metadata = EXCLUDED.metadata,
+        documento_principal_id = EXCLUDED.documento_principal_id
+"""
+
+# Os vetores são normalizados, então a ordem por distância L2 (a métrica do
+# índice ivfflat da migração) é a mesma da similaridade de cosseno:
+# cos = 1 - d² / 2. A subconsulta deixa o ORDER BY ... LIMIT usar o índice.
+BUSCA = """
+    SELECT c.id, c.chunk_id, c.total_chunks, c.chunk_text, c.distancia, p.nome, p.data, p.metadata
+    FROM (
+        SELECT id, chunk_id, total_chunks, chunk_text, documento_principal_id,
+               chunk_embedding <-> %(q)s AS distancia
+        FROM documentos
+        WHERE chunk_id > 0 AND total_chunks IS NOT NULL
+        ORDER BY chunk_embedding <-> %(q)s
+        LIMIT %(k)s
+    ) c
+    JOIN documentos p ON p.id = c.documento_principal_id
+    ORDER BY c.distancia
+"""
+
+
+def _para_timestamp(data):
+    return datetime.strptime(data, FORMATO_DATA) if data else None
+
+
+def _de_timestamp(data):
+    return data.strftime(FORMATO_DATA) if data else None
+
+
+class SupabaseDBManager:
+    """Documentos e embeddings no Postgres/pgvector, com a mesma interface do DocumentStore"""
+
+    def __init__(self, dsn=None, dim=384, pool_min=1, pool_max=10, lote_escrita=1000, probes=10,
+                 aplicar_migracao=True):
+        self.dsn = dsn or os.environ.get("DATABASE_URL")
+        self.dim = dim
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.lote_escrita = lote_escrita
+        self.probes = probes
+        self.aplicar_migracao = aplicar_migracao
+        self.lock = threading.Lock()
+        self.pendentes = []
+        self._lock_pool = threading.Lock()
+        self._pool = None
+        self._supabase = None
+
+    @property
+    def pool(self):
+        """Pool de conexões, aberto no primeiro uso (os scripts só usam o cliente `supabase`)"""
+        if self._pool is None:
+            with self._lock_pool:
+                if self._pool is None:
+                    self._pool = self._abrir_pool()
+        return self._pool
+
+    def _abrir_pool(self):
+        import psycopg
+        from pgvector.psycopg import register_vector
+        from psycopg_pool import ConnectionPool
+
+        if not self.dsn:
+            raise ValueError("DATABASE_URL não definido")
+        if self.aplicar_migracao:
+            # A extensão precisa existir antes de registrar o tipo vector nas conexões
+            with psycopg.connect(self.dsn, autocommit=True) as conn, open(MIGRACAO, encoding="utf-8") as f:
+                conn.execute(f.read())
+        return ConnectionPool(self.dsn, min_size=self.pool_min, max_size=self.pool_max,
+                              configure=register_vector, open=True)
+
+    def close(self):
+        """Fecha o pool; ele é reaberto no próximo uso (p.ex. nos workers após o fork)"""
+        self.flush()
+        with self._lock_pool:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    @property
+    def supabase(self):
+        """Cliente da API do Supabase, usado pelos scripts em supabase/"""
+        if self._supabase is None:
+            from supabase import create_client
+            self._supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+        return self._supabase
+
+    def alocar_ids(self, quantidade):
+        """Reserva `quantidade` ids da sequência da tabela"""
+        with self.pool.connection() as conn:
+            linhas = conn.execute(
+                "SELECT nextval(pg_get_serial_sequence('documentos', 'id')) FROM generate_series(1, %s)",
+                (quantidade,)).fetchall()
+        return [linha[0] for linha in linhas]
+
+    def registrar_documento(self, registro_id, documento):
+        from psycopg.types.json import Jsonb
+
+        self._enfileirar([(
+            registro_id, documento["nome"], documento.get("texto"), _para_timestamp(documento["data"]),
+            documento["tamanho"], documento["tipo"], 0, None, None, None,
+            Jsonb(metadados_documento(documento)), None,
+        )])
+
+    def registrar_chunks(self, registro_id, documento, ids, textos, vetores, primeiro_chunk):
+        vetores = np.asarray(vetores, dtype=np.float32)
+        data = _para_timestamp(documento["data"])
+        self._enfileirar([
+            (vetor_id, documento["nome"], None, data, None, documento["tipo"], primeiro_chunk + i, None,
+             texto, vetores[i], None, registro_id)
+            for i, (vetor_id, texto) in enumerate(zip(ids, textos))
+        ])
+
+    def finalizar_documento(self, registro_id, documento):
+        from psycopg.types.json import Jsonb
+
+        with self.lock:
+            self._gravar_pendentes()
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute("UPDATE documentos SET total_chunks = %s WHERE documento_principal_id = %s",
+                             (documento["total_chunks"], registro_id))
+                conn.execute("UPDATE documentos SET total_chunks = %s, texto = %s, metadata = %s WHERE id = %s",
+                             (documento["total_chunks"], documento.get("texto"),
+                              Jsonb(metadados_documento(documento)), registro_id))
+
+    def remover_documento(self, registro_id):
+        with self.lock:
+            self._gravar_pendentes()
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute("DELETE FROM documentos WHERE documento_principal_id = %s", (registro_id,))
+                conn.execute("DELETE FROM documentos WHERE id = %s", (registro_id,))
+
+    def flush(self):
+        with self.lock:
+            self._gravar_pendentes()
+
+    def _enfileirar(self, linhas):
+        with self.lock:
+            self.pendentes.extend(linhas)
+            if len(self.pendentes) >= self.lote_escrita:
+                self._gravar_pendentes()
+
+    def _gravar_pendentes(self):
+        # Um upsert em lote (pipeline do psycopg) por transação (chamar com o lock)
+        if not self.pendentes:
+            return
+        # Registros principais antes dos chunks, por causa da chave estrangeira
+        linhas = sorted(self.pendentes, key=lambda linha: linha[6] != 0)
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    cur.executemany(UPSERT, linhas)
+        self.pendentes = []
+
+    def maior_id(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), -1) FROM documentos").fetchone()[0]
+
+    def contar_chunks(self):
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM documentos WHERE chunk_id > 0 AND total_chunks IS NOT NULL").fetchone()[0]
+
+    def carregar_documentos(self):
+        """Registros principais completos, na ordem de inserção"""
+        with self.pool.connection() as conn:
+            linhas = conn.execute("""
+                SELECT id, nome, texto, data, tamanho, tipo, total_chunks, metadata
+                FROM documentos WHERE chunk_id = 0 AND total_chunks IS NOT NULL ORDER BY id
+            """).fetchall()
+        documentos = []
+        for registro_id, nome, texto, data, tamanho, tipo, total_chunks, metadata in linhas:
+            documento = dict(metadata or {})
+            documento.update({
+                "registro_id": registro_id, "nome": nome, "texto": texto, "data": _de_timestamp(data),
+                "tamanho": tamanho, "tipo": tipo, "total_chunks": total_chunks,
+            })
+            documentos.append(documento)
+        return documentos
+
+    def buscar(self, vetor, k, probes=None):
+        """Top-k por similaridade de cosseno, calculado no Postgres"""
+        return self.buscar_lote([vetor], k, probes)[0]
+
+    def buscar_lote(self, vetores, k, probes=None):
+        """Várias consultas top-k na mesma conexão e transação"""
+        vetores = np.asarray(vetores, dtype=np.float32).reshape(-1, self.dim)
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                # set_config(..., true) equivale a SET LOCAL: vale só nesta transação
+                conn.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(probes or self.probes),))
+                consultas = [conn.execute(BUSCA, {"q": vetor, "k": k}).fetchall() for vetor in vetores]
+        return [[self._resultado(linha) for linha in linhas] for linhas in consultas]
+
+    @staticmethod
+    def _resultado(linha):
+        vetor_id, chunk_id, total_chunks, texto, distancia, nome, data, metadata = linha
+        registro = {
+            "documento_id": (metadata or {}).get("id"),
+            "chunk_id": chunk_id,
+            "total_chunks": total_chunks,
+            "chunk_text": texto,
+            "documento": {"id": (metadata or {}).get("id"), "nome": nome, "data": _de_timestamp(data)},
+        }
+        return registro, 1.0 - float(distancia) ** 2 / 2.0
+
+
+class PgVectorEngine:
+    """Adapta o SupabaseDBManager à interface do SearchEngine: a busca vai para o pgvector"""
+
+    tipo_atual = "pgvector"
+
+    def __init__(self, manager, probes=None, cache_contagem=30.0):
+        self.manager = manager
+        self.probes = probes
+        self.chunks = {}
+        self.versao = 0
+        self.cache_contagem = cache_contagem
+        self._contagem = (0.0, 0)
+
+    @property
+    def ntotal(self):
+        # COUNT(*) é caro em tabelas grandes; /health o consulta com frequência
+        instante, valor = self._contagem
+        if time.monotonic() - instante > self.cache_contagem:
+            valor = self.manager.contar_chunks()
+            self._contagem = (time.monotonic(), valor)
+        return valor
+
+    def memoria_estimada(self):
+        return 0  # vetores e registros ficam no Postgres
+
+    def reservar_id(self):
+        return self.manager.alocar_ids(1)[0]
+
+    def garantir_proximo_id(self, minimo):
+        pass  # os ids vêm da sequência do Postgres
+
+    def add(self, documento_id, textos, vetores, primeiro_chunk=1):
+        # Os vetores são gravados pelo manager (registrar_chunks); aqui só se alocam os ids
+        self.versao += 1
+        return self.manager.alocar_ids(len(textos))
+
+    def finalizar(self, ids):
+        self.versao += 1
+
+    def remover(self, ids):
+        # As linhas são apagadas pelo manager (remover_documento)
+        self.versao += 1
+        return len(ids)
+
+    def search(self, vetor_consulta, k, nprobe=None, ef_search=None):
+        return self.manager.buscar(vetor_consulta, k, probes=nprobe or self.probes)
+
+    def search_lote(self, vetores_consulta, k, nprobe=None, ef_search=None, selecao=None):
+        if selecao is not None:
+            raise ValueError("Filtros por ids não são suportados no pgvector")
+        return self.manager.buscar_lote(vetores_consulta, k, probes=nprobe or self.probes)
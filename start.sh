@@ -5,5 +5,5 @@ echo "=== Iniciando aplicação Flask ==="
 echo "Data/Hora: $(date)"
 echo "PORT: ${PORT:-8080}"
 
-# Iniciar aplicação diretamente
-exec python app.py
\ No newline at end of file
+# Iniciar aplicação com o gunicorn (python app.py usa o servidor de desenvolvimento)
+exec gunicorn -c gunicorn.conf.py app:app
\ No newline at end of file
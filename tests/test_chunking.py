@@ -0,0 +1,45 @@
+"""
+chunk_tokens: limites e sobreposição da janela deslizante para textos
+menores, iguais e maiores que `max_tokens`
+"""
+import pytest
+
+from src.document_processor import chunk_tokens
+
+
+def palavras(inicio, fim):
+    return [f"p{i}" for i in range(inicio, fim)]
+
+
+def chunks(total, max_tokens=200, overlap=40):
+    return [chunk.split() for chunk in chunk_tokens([" ".join(palavras(0, total))], max_tokens, overlap)]
+
+
+def test_texto_menor_que_a_janela():
+    assert chunks(50) == [palavras(0, 50)]
+
+
+def test_texto_do_tamanho_da_janela():
+    # Um único chunk: nada de chunk final só com o overlap
+    assert chunks(200) == [palavras(0, 200)]
+
+
+def test_texto_maior_que_a_janela():
+    resultado = chunks(450)
+    assert resultado == [palavras(0, 200), palavras(160, 360), palavras(320, 450)]
+    for anterior, seguinte in zip(resultado, resultado[1:]):
+        assert anterior[-40:] == seguinte[:40]
+
+
+def test_multiplo_exato_do_passo():
+    assert chunks(360) == [palavras(0, 200), palavras(160, 360)]
+
+
+def test_segmentos_ficam_separados_por_quebra_de_linha():
+    resultado = list(chunk_tokens(["p0 p1", "", "p2 p3"], max_tokens=3, overlap=1))
+    assert resultado == ["p0 p1\np2", "p2 p3"]
+
+
+def test_overlap_maior_que_a_janela():
+    with pytest.raises(ValueError):
+        list(chunk_tokens(["texto"], max_tokens=10, overlap=10))
@@ -0,0 +1,54 @@
+"""
+MetadataIndex: seleções por campo e por intervalo de datas, e o cache que
+só descarta as seleções afetadas por um documento
+"""
+from src.filters import MetadataIndex, ler_filtros
+
+
+def documento(numero, tenant, data, tipo="pdf"):
+    return {"id": f"doc{numero}", "nome": f"arquivo{numero}.{tipo}", "tipo": tipo,
+            "data": data, "metadata": {"tenant": tenant}}
+
+
+def indice():
+    filtros = MetadataIndex()
+    filtros.add(documento(1, "a", "01/03/2024 10:00"), [10, 11])
+    filtros.add(documento(2, "b", "15/03/2024 09:30"), [20])
+    filtros.add(documento(3, "a", "02/04/2024 18:00", tipo="txt"), [30, 31, 32])
+    filtros.add(documento(4, "a", "15/03/2024 09:30"), [40])
+    return filtros
+
+
+def ids(filtros, **parametros):
+    return sorted(filtros.resolver(ler_filtros(**parametros)).ids.tolist())
+
+
+def test_intervalo_de_datas():
+    filtros = indice()
+    assert ids(filtros, data_inicio="2024-03-15", data_fim="2024-03-15") == [20, 40]
+    assert ids(filtros, data_inicio="2024-03-02") == [20, 30, 31, 32, 40]
+    assert ids(filtros, data_fim="2024-03-01") == [10, 11]
+    assert ids(filtros, data_inicio="2025-01-01") == []
+
+
+def test_combinacao_de_filtros():
+    filtros = indice()
+    assert ids(filtros, metadata={"tenant": "a"}, tipo="pdf") == [10, 11, 40]
+    assert ids(filtros, metadata={"tenant": "a"}, data_fim="2024-03-31") == [10, 11, 40]
+    assert ids(filtros, nome="arquivo3.txt") == [30, 31, 32]
+
+
+def test_cache_descarta_so_selecoes_afetadas():
+    filtros = indice()
+    tenant_a = ler_filtros(metadata={"tenant": "a"})
+    tenant_b = ler_filtros(metadata={"tenant": "b"})
+    selecao_b = filtros.resolver(tenant_b)
+    filtros.resolver(tenant_a)
+
+    filtros.add(documento(5, "a", "20/03/2024 12:00"), [50])
+    assert filtros.resolver(tenant_b) is selecao_b
+    assert sorted(filtros.resolver(tenant_a).ids.tolist()) == [10, 11, 30, 31, 32, 40, 50]
+
+    filtros.remove(documento(2, "b", "15/03/2024 09:30"))
+    assert len(filtros.resolver(tenant_b)) == 0
+    assert ids(filtros, data_inicio="2024-03-15", data_fim="2024-03-15") == [40]
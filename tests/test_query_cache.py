@@ -0,0 +1,48 @@
+"""
+QueryCache: resultados calculados antes de uma invalidação não entram no
+cache, e a invalidação por partição não afeta as demais
+"""
+from src.query_cache import QueryCache
+
+
+def test_put_rejeita_resultado_anterior_a_invalidacao():
+    cache = QueryCache(max_itens=10, ttl=60)
+    geracao = cache.geracao_de("consulta")
+    cache.invalidar()  # uma ingestão terminou enquanto o resultado era calculado
+    cache.put("consulta", ["antigo"], geracao=geracao)
+    assert cache.get("consulta") is None
+
+    cache.put("consulta", ["novo"], geracao=cache.geracao_de("consulta"))
+    assert cache.get("consulta") == ["novo"]
+
+
+def test_invalidar_particao():
+    cache = QueryCache(max_itens=10, ttl=60, particao=lambda chave: chave[0])
+    cache.put(("a", "consulta"), 1)
+    cache.put(("b", "consulta"), 2)
+    geracao_a = cache.geracao_de(("a", "outra"))
+    geracao_b = cache.geracao_de(("b", "outra"))
+
+    cache.invalidar("b")
+    assert cache.get(("a", "consulta")) == 1
+    assert cache.get(("b", "consulta")) is None
+    cache.put(("a", "outra"), 3, geracao=geracao_a)
+    cache.put(("b", "outra"), 4, geracao=geracao_b)
+    assert cache.get(("a", "outra")) == 3
+    assert cache.get(("b", "outra")) is None
+
+    cache.invalidar()
+    assert cache.get(("a", "consulta")) is None
+
+
+def test_ttl_e_lru():
+    cache = QueryCache(max_itens=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)  # despeja "b", o menos usado
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    expirado = QueryCache(max_itens=2, ttl=0)
+    expirado.put("a", 1)
+    assert expirado.get("a") is None
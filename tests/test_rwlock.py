@@ -0,0 +1,99 @@
+"""
+RWLock: preferência de escritores e `sem_escritas`, que segura as escritas
+sem bloquear os leitores
+"""
+import threading
+import time
+
+from src.rwlock import RWLock
+
+ESPERA = 0.2  # tempo para uma thread que deveria estar bloqueada mostrar que não está
+
+
+def em_thread(alvo):
+    thread = threading.Thread(target=alvo, daemon=True)
+    thread.start()
+    return thread
+
+
+def aguardar(condicao, timeout=2.0):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida"
+        time.sleep(0.005)
+
+
+def test_escritor_passa_a_frente_de_novos_leitores():
+    lock = RWLock()
+    ordem = []
+    lock.adquirir_leitura()
+
+    def escritor():
+        with lock.escrita():
+            ordem.append("escritor")
+
+    def leitor():
+        with lock.leitura():
+            ordem.append("leitor")
+
+    threads = [em_thread(escritor)]
+    aguardar(lambda: lock._escritores_esperando == 1)
+    # Com um escritor esperando, um leitor novo não entra
+    threads.append(em_thread(leitor))
+    time.sleep(ESPERA)
+    assert ordem == []
+
+    lock.liberar_leitura()
+    for thread in threads:
+        thread.join(2)
+    assert ordem == ["escritor", "leitor"]
+
+
+def test_fluxo_continuo_de_leitores_nao_impede_escritor():
+    lock = RWLock()
+    parar = threading.Event()
+    escreveu = threading.Event()
+
+    def leitor():
+        while not parar.is_set():
+            with lock.leitura():
+                time.sleep(0.001)
+
+    leitores = [em_thread(leitor) for _ in range(8)]
+    time.sleep(0.05)
+
+    def escritor():
+        with lock.escrita():
+            escreveu.set()
+
+    em_thread(escritor)
+    try:
+        assert escreveu.wait(2)
+    finally:
+        parar.set()
+        for thread in leitores:
+            thread.join(2)
+
+
+def test_sem_escritas_bloqueia_escritores_e_libera_leitores():
+    lock = RWLock()
+    escreveu = threading.Event()
+    leu = threading.Event()
+
+    def escritor():
+        with lock.escrita():
+            escreveu.set()
+
+    def leitor():
+        with lock.leitura():
+            leu.set()
+
+    with lock.sem_escritas():
+        em_thread(escritor)
+        time.sleep(ESPERA)
+        assert not escreveu.is_set()
+        # O escritor na fila não conta como esperando: as leituras continuam
+        em_thread(leitor)
+        assert leu.wait(2)
+        assert not escreveu.is_set()
+    assert escreveu.wait(2)
@@ -0,0 +1,78 @@
+"""
+Remoções no SearchEngine: o id retornado pela busca tem de ser o do vetor
+encontrado, qualquer que seja o tipo do índice
+"""
+import numpy as np
+import pytest
+
+from src.search_engine import SearchEngine
+
+DIM = 32
+TOTAL = 2000
+
+
+def vetores(total=TOTAL):
+    return np.random.default_rng(0).standard_normal((total, DIM)).astype(np.float32)
+
+
+def motor(tipo, **parametros):
+    parametros = {"nlist": 16, "pq_m": 8, "treino_min": 1000, "compactar_min": 100000, **parametros}
+    engine = SearchEngine(DIM, tipo=tipo, **parametros)
+    X = vetores()
+    engine.add("doc", [str(i) for i in range(TOTAL)], X)
+    engine.aguardar_reconstrucao()
+    assert engine.tipo_atual == tipo
+    return engine, X
+
+
+@pytest.mark.parametrize("tipo", ["flat", "ivf", "hnsw", "sq8"])
+def test_remocao_preserva_ids(tipo):
+    engine, X = motor(tipo)
+    removidos = set(range(0, TOTAL, 3))
+    assert engine.remover(sorted(removidos)) == len(removidos)
+
+    for i in (1, 2, 500, 1999):
+        resultado = engine.search_ids(X[i], 5, nprobe=16)
+        assert resultado[0][0] == i
+        assert len(resultado) == 5
+        assert not removidos & {vetor_id for vetor_id, _ in resultado}
+    assert engine.search_ids(X[0], 1, nprobe=16)[0][0] != 0
+    assert engine.ntotal == TOTAL - len(removidos)
+
+
+def test_remocao_ivf_compacta():
+    engine, X = motor("ivf", compactar_min=100, compactar_fracao=0.1)
+    engine.remover(list(range(0, TOTAL, 2)))
+    engine.aguardar_reconstrucao()
+
+    assert not engine.removidos
+    assert engine.index.ntotal == TOTAL // 2
+    for i in (1, 3, 1001):
+        assert engine.search_ids(X[i], 1, nprobe=16)[0][0] == i
+
+
+def test_restaurar_ivf_descarta_orfaos():
+    engine, X = motor("ivf")
+    chunks = [linha for linha in engine.exportar_chunks() if linha[0] % 2]
+
+    restaurado = SearchEngine(DIM, tipo="ivf", nlist=16, compactar_min=100000)
+    restaurado.restaurar(engine.index, chunks)
+
+    assert restaurado.ntotal == len(chunks)
+    resultado = restaurado.search_ids(X[3], 5, nprobe=16)
+    assert resultado[0][0] == 3
+    assert all(vetor_id % 2 for vetor_id, _ in resultado)
+
+
+def test_remocao_durante_migracao():
+    engine = SearchEngine(DIM, tipo="ivf", nlist=16, treino_min=1000, compactar_min=100000)
+    X = vetores()
+    engine.add("doc", [str(i) for i in range(TOTAL)], X)
+    # Remoção que chega enquanto o IVF é construído é reaplicada no índice novo
+    engine.remover([4, 5, 6])
+    engine.aguardar_reconstrucao()
+
+    assert engine.tipo_atual == "ivf"
+    for i in (4, 5, 6):
+        assert engine.search_ids(X[i], 1, nprobe=16)[0][0] not in (4, 5, 6)
+    assert engine.search_ids(X[7], 1, nprobe=16)[0][0] == 7
@@ -0,0 +1,86 @@
+"""
+Snapshot mapeado em memória: a base somente leitura continua pesquisável e
+o SearchEngine segue aceitando adições e remoções (no delta e em tombstones)
+"""
+import numpy as np
+import pytest
+
+from src.search_engine import SearchEngine
+from src.snapshot import carregar_snapshot, salvar_snapshot
+
+DIM = 32
+TOTAL = 2000
+
+
+def vetores(total, semente):
+    return np.random.default_rng(semente).standard_normal((total, DIM)).astype(np.float32)
+
+
+def novo_motor(tipo, **parametros):
+    parametros = {"nlist": 16, "treino_min": 1000, "compactar_min": 100000, **parametros}
+    return SearchEngine(DIM, tipo=tipo, **parametros)
+
+
+def salvar(diretorio, engine):
+    return salvar_snapshot(str(diretorio), engine.index, {"chunks": engine.exportar_chunks()}, base=engine.base_mapeada)
+
+
+def restaurar(diretorio, tipo, mmap=True, **parametros):
+    index, metadados, base = carregar_snapshot(str(diretorio), mmap=mmap)
+    engine = novo_motor(tipo, **parametros)
+    engine.restaurar(index, metadados["chunks"], base=base)
+    return engine
+
+
+def primeiro(engine, vetor):
+    return engine.search_ids(vetor, 1, nprobe=16)[0][0]
+
+
+@pytest.mark.parametrize("tipo", ["flat", "hnsw", "ivf", "sq8"])
+def test_indice_mapeado_aceita_escritas(tmp_path, tipo):
+    X, Y = vetores(TOTAL, 0), vetores(50, 1)
+    engine = novo_motor(tipo)
+    engine.add("doc", [str(i) for i in range(TOTAL)], X)
+    engine.aguardar_reconstrucao()
+    salvar(tmp_path, engine)
+
+    restaurado = restaurar(tmp_path, tipo)
+    assert restaurado.base is not None and restaurado.tipo_atual == tipo
+    assert primeiro(restaurado, X[7]) == 7
+
+    novos = restaurado.add("doc2", [str(i) for i in range(len(Y))], Y)
+    assert restaurado.remover([7, novos[3]]) == 2
+    assert primeiro(restaurado, Y[0]) == novos[0]
+    assert primeiro(restaurado, X[7]) != 7
+    assert primeiro(restaurado, Y[3]) != novos[3]
+    assert restaurado.ntotal == TOTAL + len(Y) - 2
+
+    # O snapshot seguinte grava só o delta e continua apontando para a base
+    salvar(tmp_path, restaurado)
+    salvar(tmp_path, restaurado)
+    for mmap in (True, False):
+        recarregado = restaurar(tmp_path, tipo, mmap=mmap)
+        assert (recarregado.base is not None) == mmap
+        assert recarregado.ntotal == TOTAL + len(Y) - 2
+        assert primeiro(recarregado, Y[1]) == novos[1]
+        assert primeiro(recarregado, X[8]) == 8
+        assert primeiro(recarregado, X[7]) != 7
+
+
+def test_compactacao_funde_delta_na_base(tmp_path):
+    X, Y = vetores(TOTAL, 0), vetores(300, 1)
+    engine = novo_motor("ivf")
+    engine.add("doc", [str(i) for i in range(TOTAL)], X)
+    engine.aguardar_reconstrucao()
+    salvar(tmp_path, engine)
+
+    restaurado = restaurar(tmp_path, "ivf", compactar_min=100, compactar_fracao=0.1)
+    restaurado.remover([0, 1])
+    novos = restaurado.add("doc2", [str(i) for i in range(len(Y))], Y)
+    restaurado.aguardar_reconstrucao()
+
+    assert restaurado.base is None and not restaurado.removidos
+    assert restaurado.tipo_atual == "ivf"
+    assert restaurado.index.ntotal == TOTAL + len(Y) - 2
+    assert primeiro(restaurado, Y[5]) == novos[5]
+    assert primeiro(restaurado, X[5]) == 5